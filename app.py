@@ -1,23 +1,36 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, Response, stream_with_context
+import startup
 import threading
 import logging
 import time
 import yaml
 import requests
-import docker
+import hashlib
+import hmac
 import os
 from urllib.parse import urljoin
+from functools import partial
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_security.utils import hash_password
 from flask_security import Security, SQLAlchemyUserDatastore, login_required, current_user
+from flask_login import user_logged_out
 
 import rtad_manager
 from models import db, User, Role, CustomNetworkGraph
 import stats
+import history
+import attack_store
+import exposition
+import checkpoint
+import shared
 import docker_manager
 from custom_network import custom_network_bp
+import database
 from database import initialize_database, load_history
+from stream import encode_raw, RESYNC
+from snapshot import snapshot_response, etag_for
+from event_ring import read_events
 
 # Flask-Assets for SCSS compilation
 from flask_assets import Environment, Bundle
@@ -32,7 +45,7 @@ app = Flask(__name__)
 app.config['DEBUG'] = False
 app.config['SECRET_KEY'] = config_data.get('secret_key', 'default-secret-key')
 app.config['SECURITY_PASSWORD_SALT'] = config_data.get('security_password_salt', 'default-salt')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///../stats.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.abspath(database.DB_PATH)
 app.config['SECURITY_PASSWORD_HASH'] = 'bcrypt'
 app.config['SECURITY_PASSWORD_SINGLE_HASH'] = False
 app.config['SECURITY_REGISTERABLE'] = False
@@ -53,7 +66,34 @@ scss_bundle = Bundle(
     output='style.css'
 )
 assets.register('scss_all', scss_bundle)
-scss_bundle.build()
+
+def build_assets():
+    """Compile the SCSS bundle only when its sources changed since the last build."""
+    source_dir = assets.directory
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(source_dir)):
+        if name.endswith('.scss'):
+            with open(os.path.join(source_dir, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    digest = digest.hexdigest()
+    output = os.path.join(source_dir, 'style.css')
+    stamp = output + '.sha1'
+    try:
+        with open(stamp) as f:
+            if f.read().strip() == digest and os.path.exists(output):
+                return
+    except OSError:
+        pass
+    scss_bundle.build(force=True)
+    with open(stamp, 'w') as f:
+        f.write(digest)
+
+# Register with the other workers before anything in the shared directory is used.
+if shared.ENABLED:
+    shared.join_workers()
+
+with startup.step('assets'), shared.file_lock('assets.lock'):
+    build_assets()
 
 # Initialize SQLAlchemy with our app
 db.init_app(app)
@@ -64,7 +104,8 @@ user_datastore = SQLAlchemyUserDatastore(db, User, Role)
 # Initialize Flask-Security extension BEFORE creating default user
 security = Security(app, user_datastore)
 
-with app.app_context():
+# Workers set up the schemas one at a time (see shared.file_lock).
+with startup.step('schema'), shared.file_lock('init.lock'), app.app_context():
     # Create tables for User, Role, CustomNetworkGraph, etc.
     db.create_all()
     default_admin_email = config_data.get('default_admin_email', 'admin@example.com')
@@ -80,23 +121,30 @@ with app.app_context():
 # Register the custom_network blueprint
 app.register_blueprint(custom_network_bp)
 
-# Initialize the legacy database schema and load history data
-initialize_database()
+# Initialize the legacy database schema
+with startup.step('legacy schema'), shared.file_lock('init.lock'):
+    initialize_database()
 history_data = {
     'cpu_history': stats.cpu_history,
     'memory_history_basic': stats.memory_history_basic,
     'disk_history_basic': stats.disk_history_basic,
-    'cpu_history_24h': stats.cpu_history_24h,
-    'memory_history_24h': stats.memory_history_24h,
-    'disk_history': stats.disk_history,
+    'rollups': stats.rollups,
     'network_history': stats.network_history
 }
-load_history(history_data)
+stats.docker_source = lambda: docker_manager.docker_data_cache
+stats.configure_collectors(config_data.get('collectors'))
+exposition.rtad_source = rtad_manager.fetch_event_counters
+exposition.geo_cache_source = rtad_manager.geo_cache.stats
+rtad_manager.event_sink = attack_store.store
+rtad_manager.location_sink = attack_store.relocate
+METRICS_TOKEN = config_data.get('metrics_token')
+
+STREAM_KEEPALIVE = 15  # seconds between SSE keepalive comments
+NPM_PROXY_TIMEOUT = (5, 30)  # connect / read seconds for proxied NPM API calls
 
 # Set NPM domain and API URL from config_data
 NPM_DOMAIN = config_data["npm"]["domain"]
 NPM_API_URL = f"http://{NPM_DOMAIN}/api"
-docker_client = docker.from_env()
 
 # --- NPM Token Manager for production ---
 class NPMTokenManager:
@@ -145,6 +193,58 @@ if not (NPM_DOMAIN and NPM_IDENTITY and NPM_SECRET):
     raise Exception("Incomplete NPM configuration")
 NPM_TOKEN_MANAGER = NPMTokenManager(NPM_DOMAIN, NPM_IDENTITY, NPM_SECRET)
 
+def is_leader():
+    return leader.is_set()
+
+def current_snapshot():
+    return stats.get_snapshot() if is_leader() else feed.snapshot()
+
+def local_service_status():
+    return {
+        'writer': stats.db_writer.get_stats(),
+        'retention': stats.compactor.last_report,
+        'collectors': stats.scheduler.get_stats()
+    }
+
+def service_status():
+    """Writer, retention and collector counters of the process running the collectors."""
+    return local_service_status() if is_leader() else feed.status() or {
+        'writer': {}, 'retention': None, 'collectors': {}}
+
+def fetch_login_attempts():
+    return rtad_manager.fetch_login_attempts() if is_leader() else feed.rtad().get('login_attempts', [])
+
+def fetch_http_error_logs():
+    return rtad_manager.fetch_http_error_logs() if is_leader() else feed.rtad().get('http_error_logs', [])
+
+def rtad_revision():
+    return rtad_manager.location_revision if is_leader() else feed.rtad().get('revision', 0)
+
+def read_login_attempts(after=None, limit=None):
+    if is_leader():
+        return rtad_manager.read_login_attempts(after, limit)
+    return read_events(feed.rtad().get('login_attempts', []), after, limit)
+
+def read_http_error_logs(after=None, limit=None):
+    if is_leader():
+        return rtad_manager.read_http_error_logs(after, limit)
+    return read_events(feed.rtad().get('http_error_logs', []), after, limit)
+
+# Bumped on every logout and credential change (in any worker, through a shared stamp
+# file) so that session checks cached by asgi.py are redone.
+_auth_generation = 0
+
+def auth_changed(*args, **kwargs):
+    global _auth_generation
+    _auth_generation += 1
+    if shared.ENABLED:
+        shared.touch('auth.stamp')
+
+def auth_version():
+    return (_auth_generation, shared.stamp('auth.stamp') if shared.ENABLED else 0)
+
+user_logged_out.connect(auth_changed, app)
+
 @app.before_request
 def require_user_update():
     if current_user.is_authenticated:
@@ -172,6 +272,7 @@ def user_management():
         current_user.password = hash_password(new_password)
         current_user.first_login = False
         db.session.commit()
+        auth_changed()
         flash('Credentials updated successfully!', 'success')
         return redirect(url_for('index'))
     return render_template('user_management.html')
@@ -179,8 +280,103 @@ def user_management():
 @app.route('/stats')
 @login_required
 def stats_route():
-    stats.cached_stats['docker'] = docker_manager.docker_data_cache
-    return jsonify(stats.cached_stats)
+    """
+    Full snapshot by default. With ?since=<seq> only what was published after that
+    tick is returned; a cursor that is too old or unknown falls back to the snapshot.
+    """
+    since = request.args.get('since', default=None, type=int)
+    if not is_leader():
+        if since is not None:
+            delta = feed.delta(since)
+            if delta is not None:
+                return Response(delta, mimetype='application/json')
+        return snapshot_response(request, feed.etag(feed.version()), feed.snapshot)
+    if since is not None:
+        delta = stats.build_delta(since)
+        if delta is not None:
+            return jsonify(delta)
+    return snapshot_response(request, etag_for(stats.tick_seq), stats.get_snapshot)
+
+@app.route('/stats/stream')
+@login_required
+def stats_stream_route():
+    """
+    Server-Sent Events: one full snapshot on connect, then one delta per collector tick.
+    A subscriber that falls behind gets a fresh snapshot instead of a backlog.
+    """
+    def generate():
+        sub = stats.broadcaster.subscribe()
+        try:
+            yield encode_raw('snapshot', current_snapshot().body)
+            while True:
+                frame = sub.get(timeout=STREAM_KEEPALIVE)
+                if frame is None:
+                    yield b': keepalive\n\n'
+                elif frame is RESYNC:
+                    yield encode_raw('snapshot', current_snapshot().body)
+                else:
+                    yield frame
+        finally:
+            stats.broadcaster.unsubscribe(sub)
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/history')
+@login_required
+def history_route():
+    """
+    GET /api/history?metric=cpu&from=<epoch>&to=<epoch>&points=300&mode=lttb|minmax
+    Metrics: cpu, memory, disk, net.<iface>.input, net.<iface>.output.
+    """
+    try:
+        result = history.query_history(
+            request.args.get('metric', 'cpu'),
+            start=request.args.get('from', default=None, type=float),
+            end=request.args.get('to', default=None, type=float),
+            points=request.args.get('points', default=history.DEFAULT_POINTS, type=int),
+            mode=request.args.get('mode', 'lttb')
+        )
+    except KeyError as e:
+        return jsonify({'error': str(e.args[0])}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/storage_stats')
+@login_required
+def storage_stats_route():
+    status = service_status()
+    return jsonify({'writer': status['writer'], 'retention': status['retention']})
+
+def metrics_token_ok(authorization):
+    """Whether an Authorization header carries the configured metrics_token as bearer token."""
+    return bool(METRICS_TOKEN) and hmac.compare_digest(authorization or '', 'Bearer %s' % METRICS_TOKEN)
+
+def metrics_response():
+    body = exposition.get_exposition() if is_leader() else feed.metrics()
+    return Response(body, content_type=exposition.CONTENT_TYPE)
+
+@app.route('/metrics')
+def metrics_route():
+    """
+    Prometheus exposition of the current collector state. Requires a logged-in session
+    unless `metrics_token` is set in config.yml; scrapers then send it as a bearer token.
+    """
+    if not METRICS_TOKEN:
+        return login_required(metrics_response)()
+    if not metrics_token_ok(request.headers.get('Authorization')):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return metrics_response()
+
+@app.route('/api/collector_stats')
+@login_required
+def collector_stats_route():
+    return jsonify(service_status()['collectors'])
+
+@app.route('/api/startup_stats')
+@login_required
+def startup_stats_route():
+    return jsonify(startup.report())
 
 @app.route('/update/<container_name>', methods=['POST'])
 @login_required
@@ -258,7 +454,8 @@ def npm_proxy(path):
             data=request.get_data(),
             cookies=request.cookies,
             allow_redirects=False,
-            verify=False
+            verify=False,
+            timeout=NPM_PROXY_TIMEOUT
         )
         app.logger.debug(f"NPM Response status: {response.status_code}")
         app.logger.debug(f"NPM Response headers: {dict(response.headers)}")
@@ -276,36 +473,25 @@ def npm_proxy(path):
 def rtad():
     return render_template('rtad.html')
 
-@app.route("/rtad_lastb")
-@login_required
-def rtad_lastb():
-    rtad_manager.update_missing_country_info()
-    last_id = request.args.get("last_id", default=None, type=int)
-    attempts = rtad_manager.fetch_login_attempts()
-    if last_id is not None:
-        attempts = [attempt for attempt in attempts if attempt.get("id", 0) > last_id]
-    else:
-        attempts = attempts[-5000:]
-    return jsonify(attempts)
-
-@app.route("/rtad_proxy")
-@login_required
-def rtad_proxy():
-    rtad_manager.update_missing_country_info()
-    last_id = request.args.get("last_id", default=None, type=int)
-    logs = rtad_manager.fetch_http_error_logs()
-    if last_id is not None:
-        logs = [log for log in logs if log.get("id", 0) > last_id]
-    else:
-        logs = logs[-5000:]
-    return jsonify(logs)
-
-@app.route('/api/attack_map_data')
-@login_required
-def attack_map_data():
-    rtad_manager.update_missing_country_info()
-    login_data = rtad_manager.fetch_login_attempts()[-1000:]
-    proxy_data = rtad_manager.fetch_http_error_logs()[-1000:]
+RTAD_RECENT_EVENTS = 5000  # events returned without a cursor
+
+def rtad_events(read, last_id=None, limit=None):
+    """
+    Cursor page of the events newer than `last_id`, or of the newest ones without a cursor.
+    Returns (events, headers): the response stays a plain list, and the next cursor and
+    whether the client must resync (its cursor left the retained window) go in headers.
+    X-Feed-Revision changes when events already served got their location later.
+    """
+    if limit is None and last_id is None:
+        limit = RTAD_RECENT_EVENTS
+    page = read(last_id, limit if limit is None else max(1, limit))
+    return page.events, {'X-Next-Cursor': str(page.next_cursor),
+                         'X-Cursor-Reset': '1' if page.reset else '0',
+                         'X-Feed-Revision': str(rtad_revision())}
+
+def attack_map_results():
+    login_data = fetch_login_attempts()[-1000:]
+    proxy_data = fetch_http_error_logs()[-1000:]
     results = []
     for item in login_data:
         results.append({
@@ -333,32 +519,131 @@ def attack_map_data():
             "url": item.get("url"),
             "proxy_type": item.get("proxy_type", "")
         })
-    return jsonify(results)
+    return results
+
+@app.route("/rtad_lastb")
+@login_required
+def rtad_lastb():
+    events, headers = rtad_events(read_login_attempts, request.args.get("last_id", default=None, type=int),
+                                  request.args.get("limit", default=None, type=int))
+    return jsonify(events), 200, headers
+
+@app.route("/rtad_proxy")
+@login_required
+def rtad_proxy():
+    events, headers = rtad_events(read_http_error_logs, request.args.get("last_id", default=None, type=int),
+                                  request.args.get("limit", default=None, type=int))
+    return jsonify(events), 200, headers
+
+@app.route('/api/attacks')
+@login_required
+def attacks_route():
+    """
+    GET /api/attacks?type=login|proxy&ip=&country=&since=<epoch>&until=<epoch>&before=<id>&limit=100
+    Stored security events, newest first; pass 'next_before' as `before` for the next page.
+    """
+    try:
+        result = attack_store.query(
+            type=request.args.get('type'),
+            ip=request.args.get('ip'),
+            country=request.args.get('country'),
+            since=request.args.get('since', default=None, type=int),
+            until=request.args.get('until', default=None, type=int),
+            before=request.args.get('before', default=None, type=int),
+            limit=request.args.get('limit', default=attack_store.DEFAULT_LIMIT, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/attack_map_data')
+@login_required
+def attack_map_data():
+    return jsonify(attack_map_results())
 
 def start_rtad_log_parser():
+    # Carry on from the previous leader: its read positions and its newest events.
+    try:
+        rtad_manager.offset_tracker.restore(attack_store.load_offsets())
+        for kind in attack_store.TYPES:
+            rtad_manager.restore_events(kind, attack_store.recent(kind))
+    except Exception as e:
+        logging.error("Error restoring RTAD state: %s", e)
+    rtad_manager.offset_tracker.persist = attack_store.save_offset
     parser = rtad_manager.LogParser()
     parser.parse_log_files()
     while True:
         time.sleep(10)
 
-with app.app_context():
-    rtad_manager.ensure_geolite2_db(rtad_manager.GEOIP_DB_PATH)
-    # Start background threads
-    threading.Thread(target=start_rtad_log_parser, daemon=True).start()
-    threading.Thread(target=stats.update_stats_cache, daemon=True).start()
-    threading.Thread(target=docker_manager.docker_info_updater, daemon=True).start()
-    threading.Thread(target=docker_manager.check_image_updates, daemon=True).start()
-    threading.Thread(target=rtad_manager.update_country_info_job, daemon=True).start()
+def start_collectors():
+    """History must be loaded before the collectors append to the same buffers."""
+    with startup.step('restore checkpoint'):
+        restored = checkpoint.restore()
+    with startup.step('load history'):
+        # After a checkpoint only rows written since it are read from stats.db.
+        load_history(history_data, since=restored)
+        stats.archive.resume()
+    startup.start_once('collectors', stats.update_stats_cache)
+    startup.start_once('retention', stats.compactor.run)
+    startup.start_once('checkpoint', checkpoint.run)
+    startup.log_report()
+
+def start_background_services():
+    """
+    Start every sampling/ingest service. Runs in exactly one process, and each service
+    at most once in it. Nothing here blocks: history loading and the GeoIP download run
+    on their own threads, so the worker serves requests while they finish.
+    """
+    stats.start_writer()
+    if shared.ENABLED and not stats.retain_delta:
+        stats.retain_delta = True
+        stats.tick_listeners.append(partial(publish_shared, shared.Publisher()))
+    startup.start_once('history', start_collectors)
+    startup.start_once('geoip', rtad_manager.geolite2_refresh_job)
+    startup.start_once('rtad log parser', start_rtad_log_parser)
+    startup.start_once('docker info', docker_manager.docker_info_updater)
+    startup.start_once('docker updates', docker_manager.check_image_updates)
+    startup.start_once('geo enrichment', rtad_manager.enrichment_job)
+
+def publish_shared(publisher):
+    """Leader tick listener: hand this tick's outputs to the other workers."""
+    publisher.publish_tick(stats.tick_seq, stats.get_snapshot().body, stats.last_delta,
+                           exposition.refresh(), local_service_status())
+    publisher.publish_rtad(rtad_manager.feed_version(), lambda: {
+        'login_attempts': rtad_manager.fetch_login_attempts(),
+        'http_error_logs': rtad_manager.fetch_http_error_logs(),
+        'revision': rtad_manager.location_revision
+    })
+
+def become_leader():
+    start_background_services()
+    leader.set()
+    if feed_stop is not None:
+        feed_stop.set()
+
+def await_leadership():
+    """Follower: block until the leader process exits, then take over its work."""
+    leadership.wait()
+    logging.info("Worker %s took over the collectors", os.getpid())
+    become_leader()
+
+# With several workers only the process holding the leader lock samples and ingests;
+# the others serve what it publishes (see shared.py).
+# The development reloader's watcher process only restarts the server; it runs nothing.
+RELOADER_WATCHER = __name__ == '__main__' and not os.environ.get('WERKZEUG_RUN_MAIN')
+leader = threading.Event()
+leadership = shared.Leadership() if shared.ENABLED else None
+feed = feed_stop = None
+if not RELOADER_WATCHER:
+    if leadership is None or leadership.try_acquire():
+        become_leader()
+    else:
+        feed = shared.Feed()
+        feed_stop = threading.Event()
+        threading.Thread(target=feed.run, args=(stats.broadcaster, feed_stop), daemon=True).start()
+        threading.Thread(target=await_leadership, daemon=True).start()
 
 if __name__ == '__main__':
-    rtad_manager.ensure_geolite2_db(rtad_manager.GEOIP_DB_PATH)
-    # Start background threads
-    threading.Thread(target=start_rtad_log_parser, daemon=True).start()
-    threading.Thread(target=stats.update_stats_cache, daemon=True).start()
-    threading.Thread(target=docker_manager.docker_info_updater, daemon=True).start()
-    threading.Thread(target=docker_manager.check_image_updates, daemon=True).start()
-    threading.Thread(target=rtad_manager.update_country_info_job, daemon=True).start()
-
     # Run the Flask app
     app.run(host='0.0.0.0', port=5000, debug=app.config['DEBUG'], use_reloader=True)
 
@@ -0,0 +1,17 @@
+# apptest.py
+# Imports app for the tests with stats.db and the checkpoint in a temporary directory:
+# importing app starts the leader's services, which must not write into the repository.
+
+import os
+import atexit
+import shutil
+import tempfile
+import checkpoint
+import database
+
+TEMP_DIR = tempfile.mkdtemp(prefix='simplehostmetrics-test-')
+atexit.register(shutil.rmtree, TEMP_DIR, True)
+database.DB_PATH = os.path.join(TEMP_DIR, 'stats.db')
+checkpoint.CHECKPOINT_PATH = os.path.join(TEMP_DIR, 'stats.ckpt')
+
+import app  # noqa: E402
@@ -0,0 +1,134 @@
+# archive.py
+# Long-term, compressed history of the per-minute rollup means.
+# Every closed 1m bucket of every series is appended to that series' open chunk
+# (gorilla.py encoding, typically well under 2 bytes per point for steady metrics).
+# Open chunks are buffered in memory: a chunk row is written to the `chunks` table when
+# the chunk seals, every FLUSH_POINTS points and at exit, so each chunk is written a
+# dozen times rather than once per point. Points a crash kept from being written are
+# still in the 1m rollups table, and resume() replays them. Each chunk row carries its
+# time range, so queries decode only the chunks overlapping the requested range.
+
+import logging
+import threading
+from database import read_connection
+from gorilla import ChunkEncoder, decode, decode_range
+
+TIER = 'archive'          # tier name in /api/history
+SOURCE_TIER = '1m'        # rollup tier whose closed buckets are archived
+STEP = 60
+CHUNK_POINTS = 720        # 12 hours of minutes per chunk
+FLUSH_POINTS = 60         # write an open chunk at least every hour of minutes
+
+UPSERT_SQL = ("INSERT OR REPLACE INTO chunks (series, start_time, end_time, count, data) "
+              "VALUES (?, ?, ?, ?, ?)")
+
+
+class Archive:
+    """
+    Open chunk encoders per series. `queue_query(sql, params)` persists chunk rows,
+    normally through the stats.db writer.
+    """
+    def __init__(self, queue_query, chunk_points=CHUNK_POINTS, flush_points=FLUSH_POINTS):
+        self.queue_query = queue_query
+        self.chunk_points = chunk_points
+        self.flush_points = flush_points
+        self.open = {}            # series -> ChunkEncoder
+        self.unwritten = set()    # series whose open chunk has points not written yet
+        self.lock = threading.Lock()
+
+    def add(self, series, timestamp, value):
+        """Append one point to `series`; older or duplicate timestamps are ignored."""
+        with self.lock:
+            self._add(series, timestamp, value)
+
+    def _add(self, series, timestamp, value):
+        encoder = self.open.get(series)
+        if encoder is not None and encoder.count >= self.chunk_points:
+            encoder = None
+        if encoder is None:
+            encoder = self.open[series] = ChunkEncoder()
+        elif int(timestamp) <= encoder.last_time:
+            return
+        encoder.append(timestamp, value)
+        if encoder.count >= self.chunk_points or encoder.count % self.flush_points == 0:
+            self._write(series, encoder)
+        else:
+            self.unwritten.add(series)
+
+    def _write(self, series, encoder):
+        self.unwritten.discard(series)
+        self.queue_query(UPSERT_SQL, (series, encoder.first_time, encoder.last_time,
+                                      encoder.count, encoder.getvalue()))
+
+    def flush(self):
+        """Write every open chunk that has unwritten points (at exit, before the writer stops)."""
+        with self.lock:
+            for series in list(self.unwritten):
+                self._write(series, self.open[series])
+
+    def open_points(self, series, start, end):
+        """(times, values) of the open chunk of `series` between `start` and `end`, written or not."""
+        with self.lock:
+            encoder = self.open.get(series)
+            data = encoder.getvalue() if encoder is not None else None
+        return decode_range(data, start, end) if data else ([], [])
+
+    def close(self, series):
+        """Stop archiving `series` (e.g. a removed interface) after writing its open chunk."""
+        with self.lock:
+            encoder = self.open.pop(series, None)
+            if series in self.unwritten:
+                self._write(series, encoder)
+
+    def resume(self, conn=None):
+        """
+        Reopen each series' newest unfilled chunk so it keeps growing after a restart, then
+        replay the 1m rollups newer than the archived points (those never written).
+        Returns the number of reopened chunks.
+        """
+        conn = conn or read_connection()
+        rows = conn.execute(
+            "SELECT c.series, c.data FROM chunks c JOIN "
+            "(SELECT series, MAX(start_time) AS start_time FROM chunks GROUP BY series) latest "
+            "ON c.series = latest.series AND c.start_time = latest.start_time WHERE c.count < ?",
+            (self.chunk_points,)
+        ).fetchall()
+        with self.lock:
+            for row in rows:
+                encoder = ChunkEncoder()
+                try:
+                    for timestamp, value in decode(row['data']):
+                        encoder.append(timestamp, value)
+                except ValueError as e:
+                    logging.error("Skipping unreadable archive chunk of %s: %s", row['series'], e)
+                    continue
+                self.open[row['series']] = encoder
+            missed = conn.execute(
+                "SELECT r.series, r.timestamp, r.mean FROM rollups r LEFT JOIN "
+                "(SELECT series, MAX(end_time) AS end_time FROM chunks GROUP BY series) archived "
+                "ON r.series = archived.series WHERE r.tier = ? AND r.timestamp > COALESCE(archived.end_time, -1) "
+                "ORDER BY r.series, r.timestamp", (SOURCE_TIER,)
+            ).fetchall()
+            for row in missed:
+                self._add(row['series'], row['timestamp'], row['mean'])
+        return len(rows)
+
+
+def series_exists(series, conn=None):
+    conn = conn or read_connection()
+    return conn.execute("SELECT 1 FROM chunks WHERE series = ? LIMIT 1", (series,)).fetchone() is not None
+
+
+def points(series, start, end, conn=None):
+    """(times, values) of `series` between `start` and `end`, decoding only overlapping chunks."""
+    conn = conn or read_connection()
+    rows = conn.execute(
+        "SELECT data FROM chunks WHERE series = ? AND end_time >= ? AND start_time <= ? ORDER BY start_time",
+        (series, start, end)
+    ).fetchall()
+    times, values = [], []
+    for row in rows:
+        chunk_times, chunk_values = decode_range(row['data'], start, end)
+        times.extend(chunk_times)
+        values.extend(chunk_values)
+    return times, values
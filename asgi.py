@@ -0,0 +1,257 @@
+# asgi.py
+# Optional ASGI serving mode (SERVER=asgi in start.sh, e.g. `uvicorn asgi:app`).
+# The read-only, high-frequency endpoints (/stats, /stats/stream, the RTAD feeds,
+# /api/attack_map_data and /metrics) are served natively on the event loop, so hundreds
+# of polling or SSE clients cost no thread each. Work that may block (auth lookups,
+# delta building, RTAD copies) runs in one bounded thread pool. Every other route is
+# the unchanged Flask app behind asgiref's WSGI adapter.
+
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from flask_login import current_user
+
+import app as webapp
+import stats
+import exposition
+from snapshot import negotiate, etag_for
+from stream import encode_raw, RESYNC
+
+BLOCKING_THREADS = 8       # Threads for blocking work of the native endpoints.
+MAX_PENDING = 256          # Blocking calls queued or running before answering 503.
+AUTH_CACHE_TTL = 10        # Seconds a session's successful auth check is reused.
+AUTH_CACHE_SIZE = 1024     # Sessions cached; the least recently used one is evicted.
+NATIVE_ROUTES = ('/stats', '/stats/stream', '/rtad_lastb', '/rtad_proxy', '/api/attack_map_data', '/metrics')
+
+# Results of the session check.
+AUTH_OK = 'ok'
+AUTH_FIRST_LOGIN = 'first_login'   # Logged in, but must replace the default credentials first.
+
+executor = ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix='asgi-blocking')
+wsgi_app = WsgiToAsgi(webapp.app)
+_pending = 0
+# (session cookie, remember cookie, authorization) -> (expiry, webapp.auth_version())
+_auth_cache = OrderedDict()
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Request:
+    __slots__ = ('scope', 'path', 'headers', 'args')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.args = {k: v[-1] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+    def int_arg(self, name):
+        try:
+            return int(self.args[name])
+        except (KeyError, ValueError):
+            return None
+
+    def cookie(self, name):
+        for part in self.headers.get('cookie', '').split(';'):
+            key, _, value = part.strip().partition('=')
+            if key == name:
+                return value
+        return None
+
+    def if_none_match(self, etag):
+        for tag in self.headers.get('if-none-match', '').split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.replace('W/', '', 1).strip('"') == etag:
+                return True
+        return False
+
+
+async def run_blocking(func, *args):
+    """Run `func` in the bounded pool; raises Overloaded when too much work is queued."""
+    global _pending
+    if _pending >= MAX_PENDING:
+        raise Overloaded()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+def _check_auth(path, headers):
+    # Same session/remember-cookie/token handling as @login_required in the Flask app.
+    with webapp.app.test_request_context(path, headers=headers):
+        if not current_user.is_authenticated:
+            return None
+        return AUTH_FIRST_LOGIN if current_user.first_login else AUTH_OK
+
+
+async def authenticated(request):
+    """
+    AUTH_OK, AUTH_FIRST_LOGIN or None (not logged in). Only AUTH_OK is cached, and only
+    until the TTL ends or anyone logs out or changes credentials (webapp.auth_version).
+    """
+    key = (request.cookie(webapp.app.config.get('SESSION_COOKIE_NAME', 'session')),
+           request.cookie(webapp.app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')),
+           request.headers.get('authorization'))
+    if not any(key):
+        return None
+    now = time.monotonic()
+    version = webapp.auth_version()
+    cached = _auth_cache.get(key)
+    if cached is not None and cached[0] > now and cached[1] == version:
+        _auth_cache.move_to_end(key)
+        return AUTH_OK
+    state = await run_blocking(_check_auth, request.path, list(request.headers.items()))
+    if state == AUTH_OK:
+        _auth_cache[key] = (now + AUTH_CACHE_TTL, version)
+        _auth_cache.move_to_end(key)
+        while len(_auth_cache) > AUTH_CACHE_SIZE:
+            _auth_cache.popitem(last=False)
+    else:
+        _auth_cache.pop(key, None)
+    return state
+
+
+async def respond(send, status, body=b'', headers=None, content_type=None):
+    headers = dict(headers or {})
+    if content_type:
+        headers['Content-Type'] = content_type
+    headers['Content-Length'] = str(len(body))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def respond_json(send, data, status=200):
+    await respond(send, status, json.dumps(data, separators=(',', ':')).encode('utf-8'),
+                  content_type='application/json')
+
+
+def _snapshot_source():
+    if webapp.is_leader():
+        return etag_for(stats.tick_seq), stats.get_snapshot
+    feed = webapp.feed
+    return feed.etag(feed.version()), feed.snapshot
+
+
+def _delta(since):
+    if webapp.is_leader():
+        delta = stats.build_delta(since)
+        return None if delta is None else json.dumps(delta, separators=(',', ':')).encode('utf-8')
+    return webapp.feed.delta(since)
+
+
+async def stats_endpoint(request, send):
+    since = request.int_arg('since')
+    if since is not None:
+        delta = await run_blocking(_delta, since)
+        if delta is not None:
+            return await respond(send, 200, delta, content_type='application/json')
+    etag, load = _snapshot_source()
+    status, body, headers = await run_blocking(
+        negotiate, etag, load, request.if_none_match(etag), 'gzip' in request.headers.get('accept-encoding', ''))
+    await respond(send, status, body, headers)
+
+
+async def stream_endpoint(request, send, receive):
+    loop = asyncio.get_running_loop()
+    sub = stats.broadcaster.subscribe(loop)
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # Every wait for the next frame also waits for the disconnect, so a client that went
+    # away is unsubscribed (and its backlog dropped) at once, not at the next keepalive.
+    disconnected = asyncio.ensure_future(watch_disconnect())
+    next_frame = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')]})
+        snapshot = await run_blocking(webapp.current_snapshot)
+        await send({'type': 'http.response.body', 'body': encode_raw('snapshot', snapshot.body), 'more_body': True})
+        while True:
+            next_frame = asyncio.ensure_future(sub.get(timeout=webapp.STREAM_KEEPALIVE))
+            await asyncio.wait((next_frame, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                break
+            frame = next_frame.result()
+            if frame is None:
+                frame = b': keepalive\n\n'
+            elif frame is RESYNC:
+                snapshot = await run_blocking(webapp.current_snapshot)
+                frame = encode_raw('snapshot', snapshot.body)
+            await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        disconnected.cancel()
+        if next_frame is not None:
+            next_frame.cancel()
+        stats.broadcaster.unsubscribe(sub)
+
+
+async def metrics_endpoint(request, send):
+    """With a metrics_token the scraper's bearer token; without one app() checked the session."""
+    if webapp.METRICS_TOKEN and not webapp.metrics_token_ok(request.headers.get('authorization')):
+        return await respond(send, 401, b'Unauthorized\n', content_type='text/plain')
+    body = await run_blocking(exposition.get_exposition) if webapp.is_leader() else webapp.feed.metrics()
+    await respond(send, 200, body, content_type=exposition.CONTENT_TYPE)
+
+
+async def json_endpoint(send, func, *args):
+    data = await run_blocking(lambda: json.dumps(func(*args), separators=(',', ':')).encode('utf-8'))
+    await respond(send, 200, data, content_type='application/json')
+
+
+async def cursor_endpoint(send, read, request):
+    def render():
+        events, headers = webapp.rtad_events(read, request.int_arg('last_id'), request.int_arg('limit'))
+        return json.dumps(events, separators=(',', ':')).encode('utf-8'), headers
+    data, headers = await run_blocking(render)
+    await respond(send, 200, data, headers, 'application/json')
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        return await wsgi_app(scope, receive, send)
+    request = Request(scope)
+    path = request.path
+    try:
+        if path == '/metrics' and webapp.METRICS_TOKEN:
+            return await metrics_endpoint(request, send)
+        if path not in NATIVE_ROUTES:
+            return await wsgi_app(scope, receive, send)
+        auth = await authenticated(request)
+        if auth is None:
+            return await respond_json(send, {'error': 'Unauthorized'}, 401)
+        if auth == AUTH_FIRST_LOGIN:
+            # Flask's require_user_update redirects to the credentials form.
+            return await wsgi_app(scope, receive, send)
+        if path == '/metrics':
+            return await metrics_endpoint(request, send)
+        if path == '/stats':
+            return await stats_endpoint(request, send)
+        if path == '/stats/stream':
+            return await stream_endpoint(request, send, receive)
+        if path == '/rtad_lastb':
+            return await cursor_endpoint(send, webapp.read_login_attempts, request)
+        if path == '/rtad_proxy':
+            return await cursor_endpoint(send, webapp.read_http_error_logs, request)
+        if path == '/api/attack_map_data':
+            return await json_endpoint(send, webapp.attack_map_results)
+    except Overloaded:
+        return await respond(send, 503, b'Overloaded\n', {'Retry-After': '1'}, 'text/plain')
+    except Exception as e:
+        logging.error("Error serving %s: %s", path, e)
+        return await respond(send, 500, b'Internal Server Error\n', content_type='text/plain')
+
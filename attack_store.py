@@ -0,0 +1,115 @@
+# attack_store.py
+# Durable store of the RTAD security events in the attack_entries table (models.AttackEntry).
+# Events are written behind, in batches, through the stats.db writer once the enrichment
+# stage has resolved their location; the EventRings in rtad_manager stay the hot
+# tail for the live views. Queries page backwards by id with optional filters. A page
+# filtered by type, ip or country is a walk of that column's index, which also orders by
+# id, however much history is kept. since/until alone have no such index: SQLite either
+# sorts the rows of the time range by id or scans back by rowid, so those pages cost in
+# proportion to the rows they pass over. Events older than stats.ATTACK_RETENTION are
+# expired by the retention compactor.
+# The read position in every log file is kept in log_offsets, so a restart (or a new
+# leader) carries on where the last parse stopped instead of storing the logs again.
+
+from datetime import datetime
+from database import read_connection
+import stats
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Event type stored per rtad_manager event kind (the names used by /api/attack_map_data).
+TYPES = {'login_attempt': 'login', 'http_error': 'proxy'}
+
+COLUMNS = ('type', 'ip_address', 'country', 'city', 'user', 'failure_reason', 'domain',
+           'error_code', 'url', 'timestamp', 'lat', 'lon')
+INSERT_SQL = "INSERT INTO attack_entries ({0}) VALUES ({1})".format(
+    ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)))
+# Fills in the location of events stored while no GeoIP database was loaded.
+RELOCATE_SQL = ("UPDATE attack_entries SET country = ?, city = ?, lat = ?, lon = ? "
+                "WHERE type = ? AND ip_address = ? AND timestamp = ? AND country = 'Unknown'")
+OFFSET_SQL = "INSERT OR REPLACE INTO log_offsets (path, inode, position) VALUES (?, ?, ?)"
+# filter argument -> column
+FILTERS = {'type': 'type', 'ip': 'ip_address', 'country': 'country'}
+
+
+def epoch_seconds(timestamp):
+    """Epoch seconds of an event's ISO timestamp (see rtad_manager.normalize_timestamp)."""
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+
+def event_row(kind, event):
+    error_code = event.get('error_code')
+    return (TYPES[kind], event.get('ip_address'), event.get('country'), event.get('city'),
+            event.get('user'), event.get('failure_reason'), event.get('domain'),
+            None if error_code is None else str(error_code), event.get('url'),
+            epoch_seconds(event['timestamp']), event.get('lat'), event.get('lon'))
+
+
+def store(kind, events):
+    """rtad_manager.event_sink: queue one batched insert for enriched events of one kind."""
+    stats.queue_rows(INSERT_SQL, [event_row(kind, event) for event in events])
+
+
+def relocate(kind, events):
+    """rtad_manager.location_sink: queue the late-resolved location of stored events."""
+    stats.queue_rows(RELOCATE_SQL, [
+        (event.get('country'), event.get('city'), event.get('lat'), event.get('lon'),
+         TYPES[kind], event.get('ip_address'), epoch_seconds(event['timestamp']))
+        for event in events])
+
+
+def load_offsets(conn=None):
+    """{path: (inode, offset)} of the log files read so far (see rtad_manager.FileOffsetTracker)."""
+    conn = conn or read_connection()
+    return {row['path']: (row['inode'], row['position'])
+            for row in conn.execute("SELECT path, inode, position FROM log_offsets")}
+
+
+def save_offset(path, inode, offset):
+    """rtad_manager.FileOffsetTracker.persist: queue the new read position of a log file."""
+    stats.queue_query(OFFSET_SQL, (path, inode, offset))
+
+
+def recent(kind, limit=MAX_LIMIT, conn=None):
+    """The newest `limit` stored events of an rtad_manager event kind, oldest first."""
+    return query(type=TYPES[kind], limit=limit, conn=conn)['entries'][::-1]
+
+
+def query(type=None, ip=None, country=None, since=None, until=None, before=None,
+          limit=DEFAULT_LIMIT, conn=None):
+    """
+    Newest-first page of stored events. `before` is the id cursor returned as
+    'next_before' by the previous page (None for the newest page); since/until
+    bound the epoch timestamp, and without a type/ip/country filter are not served
+    by an index in id order (see the header). Raises ValueError for an unknown type.
+    """
+    if type is not None and type not in TYPES.values():
+        raise ValueError("type must be one of %s" % ', '.join(sorted(TYPES.values())))
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    values = {'type': type, 'ip': ip, 'country': country}
+    where, params = [], []
+    for name, column in FILTERS.items():
+        if values[name] is not None:
+            where.append(column + ' = ?')
+            params.append(values[name])
+    if since is not None:
+        where.append('timestamp >= ?')
+        params.append(int(since))
+    if until is not None:
+        where.append('timestamp <= ?')
+        params.append(int(until))
+    if before is not None:
+        where.append('id < ?')
+        params.append(int(before))
+    conn = conn or read_connection()
+    rows = conn.execute(
+        "SELECT id, {0} FROM attack_entries{1} ORDER BY id DESC LIMIT ?".format(
+            ', '.join(COLUMNS), ' WHERE ' + ' AND '.join(where) if where else ''),
+        params + [limit + 1]
+    ).fetchall()
+    entries = [dict(row) for row in rows[:limit]]
+    return {
+        'entries': entries,
+        'next_before': entries[-1]['id'] if len(rows) > limit else None,
+    }
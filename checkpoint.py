@@ -0,0 +1,191 @@
+# checkpoint.py
+# Warm-start checkpoints of the collector state.
+# The collector periodically (and at exit) writes its in-memory state to one binary
+# file: the history ring buffers, the rollup tiers including their still-open
+# accumulators, and the previous counters of rate collectors. On start the file is
+# mapped and copied straight into the buffers, so graphs are complete immediately,
+# partial minutes/hours/days keep aggregating and the first network sample counts.
+#
+# Layout: HEADER, a JSON index, then the buffer columns as native float64/int64 arrays.
+
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import atexit
+import struct
+import logging
+import threading
+import psutil
+import stats
+from ring_buffer import RingBuffer
+
+CHECKPOINT_PATH = 'stats.ckpt'
+CHECKPOINT_INTERVAL = 60     # seconds between checkpoints
+MAX_AGE = 7 * 86400          # older checkpoints are ignored
+FORMAT_VERSION = 1
+MAGIC = b'SHMCKPT\x00'
+# magic, format version, JSON index length, crc32 of everything after the header
+HEADER = struct.Struct('<8sIQI')
+
+_stop = threading.Event()
+
+
+def _buffer_entry(buffer, chunks, offset):
+    """Append `buffer`'s columns to `chunks`; return its index entry and the new offset."""
+    times, seqs, columns = buffer.dump()
+    entry = {'fields': list(buffer.fields), 'count': len(buffer), 'last_seq': buffer.last_seq, 'offset': offset}
+    for chunk in [times, seqs] + columns:
+        chunks.append(chunk)
+        offset += len(chunk)
+    return entry, offset
+
+
+def encode():
+    """Serialize the collector state. Call with stats.state_lock held."""
+    chunks = []
+    offset = 0
+    histories = []
+    for name, history in stats.histories.items():
+        items = history.items() if isinstance(history, dict) else ((None, history),)
+        for key, buffer in items:
+            entry, offset = _buffer_entry(buffer, chunks, offset)
+            entry.update(history=name, key=key)
+            histories.append(entry)
+    rollups = []
+    for name in stats.rollups.names():
+        series = stats.rollups.get(name)
+        tiers = []
+        for tier in series.tiers:
+            entry, offset = _buffer_entry(tier.buffer, chunks, offset)
+            entry.update(tier=tier.name, open=tier.open_state())
+            tiers.append(entry)
+        rollups.append({'series': name, 'tiers': tiers})
+    index = {
+        'created': time.time(),
+        'boot_time': psutil.boot_time(),
+        'byteorder': sys.byteorder,
+        'histories': histories,
+        'rollups': rollups,
+        'collectors': {name: collector.get_state() for name, collector in stats.active_collectors.items()},
+    }
+    index = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    body = b''.join(chunks)
+    crc = zlib.crc32(body, zlib.crc32(index))
+    return HEADER.pack(MAGIC, FORMAT_VERSION, len(index), crc) + index + body
+
+
+def save(path=None):
+    """Write a checkpoint atomically (temporary file plus rename), by default to CHECKPOINT_PATH."""
+    path = path or CHECKPOINT_PATH
+    with stats.state_lock:
+        data = encode()
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return len(data)
+
+
+def _load_buffer(buffer, entry, data, base):
+    """Fill `buffer` from the index `entry` whose arrays start at data[base + offset]."""
+    size = entry['count'] * 8
+    start = base + entry['offset']
+    parts = [data[start + i * size:start + (i + 1) * size] for i in range(2 + len(entry['fields']))]
+    try:
+        buffer.load(parts[0], parts[1], parts[2:], entry['last_seq'])
+    finally:
+        for part in parts:
+            part.release()
+
+
+def apply(data):
+    """
+    Load checkpoint bytes (bytes or any buffer, e.g. an mmap) into the collector state.
+    Returns the checkpoint's creation time, or None if it is unusable.
+    """
+    with memoryview(data) as view:
+        return _apply(view)
+
+
+def _apply(data):
+    if len(data) < HEADER.size:
+        return None
+    magic, version, index_length, crc = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    base = HEADER.size + index_length
+    if zlib.crc32(data[base:], zlib.crc32(data[HEADER.size:base])) != crc:
+        logging.error("Ignoring corrupt checkpoint")
+        return None
+    index = json.loads(bytes(data[HEADER.size:base]))
+    if index['byteorder'] != sys.byteorder or time.time() - index['created'] > MAX_AGE:
+        return None
+    with stats.state_lock:
+        for entry in index['histories']:
+            history = stats.histories.get(entry['history'])
+            if history is None:
+                continue
+            if entry['key'] is None:
+                buffer = history
+            else:
+                buffer = history.get(entry['key'])
+                if buffer is None:
+                    buffer = history[entry['key']] = RingBuffer(stats.MAX_HISTORY, entry['fields'])
+            if isinstance(buffer, RingBuffer) and list(buffer.fields) == entry['fields']:
+                _load_buffer(buffer, entry, data, base)
+        for entry in index['rollups']:
+            series = stats.rollups.register(entry['series'])
+            for tier_entry in entry['tiers']:
+                try:
+                    tier = series.tier(tier_entry['tier'])
+                except KeyError:
+                    continue
+                _load_buffer(tier.buffer, tier_entry, data, base)
+                tier.restore_open(tier_entry['open'])
+        # Counters restart at zero after a reboot, and the monotonic clock with them.
+        if abs(index['boot_time'] - psutil.boot_time()) < 2:
+            for name, state in index['collectors'].items():
+                collector = stats.active_collectors.get(name)
+                if collector is not None and state is not None:
+                    collector.set_state(state)
+    return index['created']
+
+
+def restore(path=None):
+    """Map the checkpoint at `path` (CHECKPOINT_PATH) and apply it; returns its creation time or None."""
+    path = path or CHECKPOINT_PATH
+    try:
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                created = apply(mapped)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error("Error restoring checkpoint %s: %s", path, e)
+        return None
+    if created is not None:
+        logging.info("Restored collector state from checkpoint taken %.0fs ago", time.time() - created)
+    return created
+
+
+def run(path=None, interval=CHECKPOINT_INTERVAL):
+    """Thread target: checkpoint every `interval` seconds and once more at exit."""
+    path = path or CHECKPOINT_PATH
+    atexit.register(save_quietly, path)
+    while not _stop.wait(interval):
+        save_quietly(path)
+
+
+def stop():
+    _stop.set()
+
+
+def save_quietly(path=None):
+    path = path or CHECKPOINT_PATH
+    try:
+        save(path)
+    except Exception as e:
+        logging.error("Error writing checkpoint %s: %s", path, e)
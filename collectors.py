@@ -0,0 +1,410 @@
+# collectors.py
+# Metric collector plugins.
+# A collector only samples: sample() returns numeric fields (or, for keyed collectors,
+# {key: fields} such as one entry per interface). The shared pipeline in stats.py
+# appends the samples to history buffers, feeds the rollup tiers, persists raw rows
+# and publishes them, so adding a source never touches the sampling loop itself.
+# Sources are enabled and tuned in the `collectors` section of config.yml.
+
+import os
+import time
+import operator
+import psutil
+from array import array
+from itertools import chain, cycle
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+# name -> collector class
+COLLECTORS = {}
+
+
+def register(cls):
+    """Class decorator adding a collector to the registry under `cls.name`."""
+    COLLECTORS[cls.name] = cls
+    return cls
+
+
+def create(name, options=None):
+    """Instantiate the registered collector `name` with its config.yml options."""
+    if name not in COLLECTORS:
+        raise KeyError("Unknown collector %s" % name)
+    return COLLECTORS[name](**(options or {}))
+
+
+class Collector:
+    """
+    Base class for collectors.
+
+    name       registry name, also the prefix of the rollup series
+    interval   seconds between samples
+    fields     numeric fields kept in the history buffers (and the raw table, if any)
+    keyed      sample() returns {key: {field: value}} instead of {field: value}
+    table      stats.db table for raw rows, or None to keep only history and rollups
+    key_column column of `table` holding the key of keyed collectors
+    rollup     {series: field} fed into the rollup tiers; '{key}' is replaced by the key.
+               None rolls up every field as '<name>.<field>' ('<name>.<key>.<field>').
+    """
+    name = None
+    interval = 1.0
+    enabled = True
+    fields = ()
+    keyed = False
+    table = None
+    key_column = None
+    rollup = None
+
+    def __init__(self, interval=None, enabled=None):
+        if interval is not None:
+            self.interval = float(interval)
+        if enabled is not None:
+            self.enabled = bool(enabled)
+
+    @classmethod
+    def available(cls):
+        """Whether this collector can run on the current host."""
+        return True
+
+    def sample(self):
+        raise NotImplementedError
+
+    def rollup_series(self, key=None):
+        """(series name, field) pairs for one sample row."""
+        if self.rollup is None:
+            prefix = self.name if key is None else '%s.%s' % (self.name, key)
+            return [('%s.%s' % (prefix, field), field) for field in self.fields]
+        return [(series.format(key=key), field) for series, field in self.rollup.items()]
+
+    def publish(self, system, values):
+        """Write the latest gauges into the system section of the stats payload (built-ins only)."""
+
+    def get_state(self):
+        """JSON-serializable state worth keeping across restarts (see checkpoint.py), or None."""
+        return None
+
+    def set_state(self, state):
+        """Reinstate state returned by get_state()."""
+
+
+class RateCollector(Collector):
+    """Keyed collector turning monotonically increasing counters into per-second rates."""
+    keyed = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.previous = None
+        self.previous_time = None
+
+    def counters(self):
+        """Return {key: {field: counter}}."""
+        raise NotImplementedError
+
+    def get_state(self):
+        # CLOCK_MONOTONIC is shared by all processes of one boot, so the pair stays valid
+        # for a restarted process (checkpoint.py drops it after a reboot).
+        if self.previous is None:
+            return None
+        return {'previous': self.previous, 'previous_time': self.previous_time}
+
+    def set_state(self, state):
+        self.previous, self.previous_time = state['previous'], state['previous_time']
+
+    def sample(self):
+        # Rates use the monotonic clock so wall-clock adjustments cannot distort them.
+        now = time.monotonic()
+        current = self.counters()
+        previous, previous_time = self.previous, self.previous_time
+        self.previous, self.previous_time = current, now
+        if previous is None or now <= previous_time:
+            return {}
+        dt = now - previous_time
+        rates = {}
+        for key, counters in current.items():
+            before = previous.get(key)
+            if before:
+                rates[key] = {field: max(counters[field] - before[field], 0) / dt for field in self.fields}
+        return rates
+
+
+##################
+# Built-in sources
+##################
+@register
+class CpuCollector(Collector):
+    name = 'cpu'
+    fields = ('usage',)
+    table = 'cpu_history'
+    rollup = {'cpu': 'usage'}
+
+    def sample(self):
+        return {'usage': psutil.cpu_percent()}
+
+    def publish(self, system, values):
+        system['cpu'] = values['usage']
+
+
+@register
+class MemoryCollector(Collector):
+    name = 'memory'
+    interval = 2.0
+    fields = ('free', 'used', 'cached')   # `used` excludes the page cache
+    table = 'memory_history'
+    rollup = {'memory': 'used_total'}
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.last_bytes = {}    # Unrounded byte values of the last sample, e.g. for /metrics.
+
+    def sample(self):
+        mem = psutil.virtual_memory()
+        cached = getattr(mem, 'cached', 0)
+        self.last_bytes = {'total': mem.total, 'used': mem.used, 'free': mem.free, 'cached': cached}
+        return {
+            'free': round(mem.free / GB, 2),
+            'used': round((mem.used - cached) / GB, 2),
+            'cached': round(cached / GB, 2),
+            'used_total': round(mem.used / GB, 2),
+            'total': round(mem.total / GB, 2),
+            'percent': mem.percent
+        }
+
+    def publish(self, system, values):
+        system['memory'] = {
+            'percent': values['percent'],
+            'total': values['total'],
+            'used': values['used_total'],
+            'free': values['free'],
+            'cached': values['cached']
+        }
+
+
+@register
+class DiskCollector(Collector):
+    name = 'disk'
+    interval = 30.0
+    fields = ('total', 'used', 'free')
+    table = 'disk_history_basic'
+    rollup = {'disk': 'used'}
+
+    def __init__(self, path='/', **options):
+        super().__init__(**options)
+        self.path = path
+        self.last_bytes = {}    # Unrounded byte values of the last sample, e.g. for /metrics.
+
+    def sample(self):
+        disk = psutil.disk_usage(self.path)
+        self.last_bytes = {'total': disk.total, 'used': disk.used, 'free': disk.free}
+        return {
+            'total': round(disk.total / GB, 2),
+            'used': round(disk.used / GB, 2),
+            'free': round(disk.free / GB, 2),
+            'percent': disk.percent
+        }
+
+    def publish(self, system, values):
+        system['disk'] = {
+            'percent': values['percent'],
+            'total': values['total'],
+            'used': values['used'],
+            'free': values['free']
+        }
+
+
+COUNTER_WRAP_32 = 2 ** 32
+COUNTER_WRAP_64 = 2 ** 64
+# A decrease is taken for a wrap only when both reads are within this many units of the
+# wrap point (256 MiB: a 2 Gbit/s link for one second).
+WRAP_MARGIN = 2 ** 28
+
+
+def counter_delta(current, previous):
+    """
+    Increase of a counter that went down since the last read. psutil's counters are
+    64-bit on Linux, so that is a reset (e.g. a re-created interface) and the increase is
+    `current`, unless the previous read was just below the 32-bit or 64-bit wrap point
+    and the current one just above zero.
+    """
+    if current >= previous:
+        return current - previous
+    if current < WRAP_MARGIN:
+        for wrap in (COUNTER_WRAP_32, COUNTER_WRAP_64):
+            if wrap - WRAP_MARGIN <= previous < wrap:
+                return current + wrap - previous
+    return current
+
+
+@register
+class NetworkCollector(Collector):
+    """
+    Per-interface rates. All interfaces' counters are kept in one flat array
+    (interfaces x COUNTERS) that is refilled in a single pass per read; the deltas and
+    rates are computed with list operations over that array, and only the result dicts
+    are built per interface. When the set of interfaces changes, the previous array is
+    realigned to the new names one interface at a time.
+    """
+    name = 'network'
+    fields = ('input', 'output')           # MB/s; kept in the history and net_history
+    keyed = True
+    table = 'net_history'
+    key_column = 'interface'
+    rollup = {'net.{key}.input': 'input', 'net.{key}.output': 'output'}
+    # psutil.net_io_counters() fields, and the per-second rate reported for each.
+    COUNTERS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout')
+    RATES = ('output', 'input', 'packets_out', 'packets_in', 'errors_in', 'errors_out', 'drops_in', 'drops_out')
+    SCALE = (1 / MB, 1 / MB, 1, 1, 1, 1, 1, 1)
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.interfaces = ()             # interface names, in the order of `counters`
+        self.counters = array('Q')       # len(interfaces) * len(COUNTERS) raw counters
+        self.counters_time = None        # monotonic time of the last read
+
+    def read(self):
+        current = psutil.net_io_counters(pernic=True)
+        return tuple(current), array('Q', chain.from_iterable(current.values()))
+
+    def totals(self):
+        """{interface: {counter: value}} of the last read, e.g. for /metrics."""
+        width = len(self.COUNTERS)
+        counters = self.counters
+        return {iface: dict(zip(self.COUNTERS, counters[i * width:(i + 1) * width]))
+                for i, iface in enumerate(self.interfaces)}
+
+    def _aligned_previous(self, names, previous_names, previous, current):
+        """
+        Previous counters rearranged to `names`. Interfaces without a previous read take
+        their current counters (zero delta) and are returned in the `new` set.
+        """
+        width = len(self.COUNTERS)
+        slots = {iface: i for i, iface in enumerate(previous_names)}
+        aligned = array('Q')
+        new = set()
+        for i, iface in enumerate(names):
+            slot = slots.get(iface)
+            if slot is None:
+                new.add(iface)
+                aligned.extend(current[i * width:(i + 1) * width])
+            else:
+                aligned.extend(previous[slot * width:(slot + 1) * width])
+        return aligned, new
+
+    def sample(self):
+        # Rates use the monotonic clock so wall-clock adjustments cannot distort them.
+        now = time.monotonic()
+        names, current = self.read()
+        previous_names, previous, previous_time = self.interfaces, self.counters, self.counters_time
+        self.interfaces, self.counters, self.counters_time = names, current, now
+        if previous_time is None or now <= previous_time:
+            return {}
+        new = ()
+        if names != previous_names:
+            previous, new = self._aligned_previous(names, previous_names, previous, current)
+        deltas = list(map(operator.sub, current, previous))
+        if deltas and min(deltas) < 0:
+            deltas = [d if d >= 0 else counter_delta(c, p) for d, c, p in zip(deltas, current, previous)]
+        dt = now - previous_time
+        rates = list(map(operator.mul, deltas, cycle([scale / dt for scale in self.SCALE])))
+        width = len(self.COUNTERS)
+        result = {}
+        for i, iface in enumerate(names):
+            if iface in new:
+                continue
+            row = dict(zip(self.RATES, rates[i * width:(i + 1) * width]))
+            for field in self.fields:
+                if row[field] < 0.0001:
+                    row[field] = 0
+            result[iface] = row
+        return result
+
+    def publish(self, system, values):
+        system['network'] = values
+
+    def get_state(self):
+        # See RateCollector.get_state: valid for a restarted process within the same boot.
+        if self.counters_time is None:
+            return None
+        return {'interfaces': list(self.interfaces), 'counters': self.counters.tolist(), 'time': self.counters_time}
+
+    def set_state(self, state):
+        if 'counters' not in state:
+            return   # saved by an older version of this collector
+        self.interfaces = tuple(state['interfaces'])
+        self.counters = array('Q', state['counters'])
+        self.counters_time = state['time']
+
+
+##################
+# Optional sources
+##################
+@register
+class CpuCoresCollector(Collector):
+    name = 'cpu_cores'
+    enabled = False
+    interval = 5.0
+    fields = ('usage',)
+    keyed = True
+
+    def sample(self):
+        return {'cpu%d' % i: {'usage': usage} for i, usage in enumerate(psutil.cpu_percent(percpu=True))}
+
+
+@register
+class DiskIOCollector(RateCollector):
+    name = 'disk_io'
+    enabled = False
+    interval = 5.0
+    fields = ('read', 'write')             # MB/s
+
+    def counters(self):
+        return {disk: {'read': counters.read_bytes / MB, 'write': counters.write_bytes / MB}
+                for disk, counters in (psutil.disk_io_counters(perdisk=True) or {}).items()}
+
+
+@register
+class PressureCollector(Collector):
+    """Linux pressure stall information: share of time some tasks stalled (avg10, percent)."""
+    name = 'pressure'
+    enabled = False
+    interval = 10.0
+    fields = ('cpu', 'memory', 'io')
+    PATH = '/proc/pressure'
+
+    @classmethod
+    def available(cls):
+        return os.path.isdir(cls.PATH)
+
+    def sample(self):
+        values = {}
+        for resource in self.fields:
+            with open(os.path.join(self.PATH, resource)) as f:
+                some = f.readline().split()
+            values[resource] = float(some[1].split('=')[1])
+        return values
+
+
+@register
+class SocketsCollector(Collector):
+    """Socket counts from /proc/net/sockstat (cheap, unlike enumerating connections)."""
+    name = 'sockets'
+    enabled = False
+    interval = 10.0
+    fields = ('tcp_inuse', 'tcp_timewait', 'udp_inuse')
+    PATH = '/proc/net/sockstat'
+
+    @classmethod
+    def available(cls):
+        return os.path.exists(cls.PATH)
+
+    def sample(self):
+        stats = {}
+        with open(self.PATH) as f:
+            for line in f:
+                proto, _, rest = line.partition(':')
+                parts = rest.split()
+                stats[proto] = dict(zip(parts[::2], parts[1::2]))
+        return {
+            'tcp_inuse': float(stats.get('TCP', {}).get('inuse', 0)),
+            'tcp_timewait': float(stats.get('TCP', {}).get('tw', 0)),
+            'udp_inuse': float(stats.get('UDP', {}).get('inuse', 0))
+        }
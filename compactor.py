@@ -0,0 +1,76 @@
+# compactor.py
+# Background retention for stats.db.
+# The collector only appends rows; this compactor periodically removes everything that
+# fell out of its retention window using indexed time-range deletes in small batches,
+# and reports how many rows were removed and how long it took.
+
+import time
+import logging
+import threading
+from collections import namedtuple
+from database import write_connection
+
+# table: table name, max_age: seconds to keep,
+# where/params: optional extra filter (e.g. one rollup tier of a shared table),
+# column: the time column compared against the cutoff.
+RetentionPolicy = namedtuple('RetentionPolicy', ['table', 'max_age', 'where', 'params', 'column'])
+RetentionPolicy.__new__.__defaults__ = ('', (), 'timestamp')
+
+
+class RetentionCompactor:
+    """
+    Deletes expired rows for a list of RetentionPolicy entries on a fixed schedule.
+    Each delete touches at most `batch_size` rows per statement so the writer thread
+    never waits long for the database lock.
+    """
+    def __init__(self, policies, interval=300, batch_size=5000):
+        self.policies = list(policies)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_report = {'time': None, 'duration': 0.0, 'removed': {}}
+        self._stop = threading.Event()
+
+    def run_once(self, now=None):
+        """Apply every policy once and return the report."""
+        now = time.time() if now is None else now
+        started = time.monotonic()
+        removed = {}
+        conn = write_connection()
+        for policy in self.policies:
+            name = policy.table + (' [%s]' % ', '.join(map(str, policy.params)) if policy.params else '')
+            try:
+                removed[name] = self._expire(conn, policy, now - policy.max_age)
+            except Exception as e:
+                conn.rollback()
+                logging.error("Retention compaction failed for %s: %s", name, e)
+        duration = time.monotonic() - started
+        self.last_report = {'time': now, 'duration': duration, 'removed': removed}
+        total = sum(removed.values())
+        if total:
+            logging.info("Retention compactor removed %s rows in %.3fs: %s", total, duration, removed)
+        return self.last_report
+
+    def _expire(self, conn, policy, cutoff):
+        condition = policy.column + " < ?" + (" AND " + policy.where if policy.where else "")
+        sql = ("DELETE FROM {table} WHERE rowid IN "
+               "(SELECT rowid FROM {table} WHERE {condition} LIMIT ?)").format(table=policy.table, condition=condition)
+        params = (cutoff,) + tuple(policy.params) + (self.batch_size,)
+        total = 0
+        while True:
+            deleted = conn.execute(sql, params).rowcount
+            conn.commit()
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+
+    def run(self):
+        """Thread target: compact on every interval until stop() is called."""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error("Error in retention compactor: %s", e)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
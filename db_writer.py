@@ -0,0 +1,157 @@
+# db_writer.py
+# Single writer thread for stats.db.
+# Statements are queued by the collector, grouped by SQL text into executemany() calls
+# and committed on a size or time window. The queue is bounded so a stalled disk
+# cannot grow process memory, and everything still queued is flushed on shutdown.
+
+import time
+import sqlite3
+import logging
+import threading
+from queue import Queue, Empty, Full
+
+# What submit() does when the queue is full.
+POLICY_BLOCK = 'block'               # Wait up to put_timeout, then drop the new statement.
+POLICY_DROP_NEWEST = 'drop_newest'   # Drop the new statement immediately.
+POLICY_DROP_OLDEST = 'drop_oldest'   # Drop the oldest queued statement to make room.
+
+
+class DBWriter:
+    """
+    Batched, bounded SQLite writer.
+
+    Statements within one batch may be reordered across different SQL texts, so only
+    order-independent writes (appends) should go through the writer.
+    """
+    def __init__(self, connect, maxsize=20000, batch_size=1000, commit_interval=1.0,
+                 policy=POLICY_DROP_OLDEST, put_timeout=0.5):
+        self.connect = connect
+        self.queue = Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self.batches = 0
+        self.rows = 0
+        self.last_commit_latency = 0.0
+        self.max_commit_latency = 0.0
+        self._latency_total = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, sql, params, many=False):
+        """
+        Queue one statement (or, with `many`, one statement for a list of parameter rows,
+        e.g. a tick's rows for every interface), applying the policy when the queue is full.
+        """
+        item = (sql, params, many)
+        if self.policy == POLICY_BLOCK:
+            try:
+                self.queue.put(item, timeout=self.put_timeout)
+            except Full:
+                self.dropped += 1
+            return
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except Full:
+                self.dropped += 1
+                if self.policy != POLICY_DROP_OLDEST:
+                    return
+                try:
+                    self.queue.get_nowait()
+                except Empty:
+                    pass
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='db-writer', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=10):
+        """Stop the writer thread after it has flushed everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        conn = self.connect()
+        # Switching to WAL needs the database to itself; retry while e.g. the schema is set up.
+        while True:
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                break
+            except sqlite3.OperationalError as e:
+                logging.error("Could not enable WAL on stats.db, retrying: %s", e)
+                time.sleep(1.0)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = self._collect()
+            if batch:
+                self._write(conn, batch)
+            elif self._stop.is_set():
+                break
+        conn.close()
+
+    def _collect(self):
+        """Wait for the first statement, then gather until the batch is full or the window elapses."""
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.commit_interval))
+        except Empty:
+            return batch
+        deadline = time.monotonic() + self.commit_interval
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _write(self, conn, batch):
+        groups = {}
+        for sql, params, many in batch:
+            if many:
+                groups.setdefault(sql, []).extend(params)
+            else:
+                groups.setdefault(sql, []).append(params)
+        started = time.monotonic()
+        for sql, rows in groups.items():
+            try:
+                conn.executemany(sql, rows)
+            except Exception as e:
+                logging.error("DB batch failed (%s rows): %s; SQL: %s", len(rows), e, sql)
+                for params in rows:
+                    try:
+                        conn.execute(sql, params)
+                    except Exception as e:
+                        logging.error("DB operation failed: %s; SQL: %s; Params: %s", e, sql, params)
+        try:
+            conn.commit()
+        except Exception as e:
+            logging.error("DB commit failed: %s", e)
+        latency = time.monotonic() - started
+        self.batches += 1
+        self.rows += sum(len(rows) for rows in groups.values())
+        self.last_commit_latency = latency
+        self.max_commit_latency = max(self.max_commit_latency, latency)
+        self._latency_total += latency
+
+    def get_stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'rows': self.rows,
+            'last_commit_latency': self.last_commit_latency,
+            'max_commit_latency': self.max_commit_latency,
+            'avg_commit_latency': (self._latency_total / self.batches) if self.batches else 0.0,
+        }
@@ -12,8 +12,10 @@ import threading                       # For running update and check operations
 import logging                         # For logging errors and information.
 from datetime import datetime          # For parsing and formatting timestamps.
 
-# Initialize the Docker client from environment variables.
-client = docker.from_env()
+# The Docker client is created on first use (see get_client), so importing this
+# module neither blocks on nor fails without the Docker daemon.
+_client = None
+_client_lock = threading.Lock()
 
 # Global dictionaries to keep track of container update operations and status.
 updating_containers = {}                # Tracks update operations for containers.
@@ -24,6 +26,17 @@ check_all_status = {'in_progress': False, 'checked': 0, 'total': 0}  # Overall s
 # Cache for Docker data to avoid frequent expensive operations.
 docker_data_cache = []                  # Stores the last retrieved Docker container information.
 
+def get_client():
+    """
+    Return the shared Docker client, connecting from environment variables on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = docker.from_env()
+    return _client
+
 def parse_docker_created(created_str):
     """
     Parse the Docker 'Created' timestamp string to a datetime object.
@@ -63,7 +76,7 @@ def get_docker_info():
     """
     containers = []
     # Build a dictionary of currently running and stopped containers.
-    real_containers = {c.name: c for c in client.containers.list(all=True)}
+    real_containers = {c.name: c for c in get_client().containers.list(all=True)}
     for cname, container in real_containers.items():
         try:
             created = container.attrs.get('Created', '')
@@ -153,7 +166,7 @@ def check_image_updates():
     """
     while True:
         try:
-            for container in client.containers.list(all=True):
+            for container in get_client().containers.list(all=True):
                 if container.image.tags:
                     image_tag = container.image.tags[0]
                 else:
@@ -164,7 +177,7 @@ def check_image_updates():
                     else:
                         continue
                 try:
-                    latest_img = client.images.pull(image_tag)
+                    latest_img = get_client().images.pull(image_tag)
                 except Exception as e:
                     logging.error("Error pulling %s: %s", image_tag, e)
                     continue
@@ -217,7 +230,7 @@ def update_container(container_name):
         try:
             try:
                 # Attempt to get the existing container.
-                old_container = client.containers.get(cname)
+                old_container = get_client().containers.get(cname)
             except docker.errors.NotFound:
                 old_container = None
 
@@ -244,7 +257,7 @@ def update_container(container_name):
             # Pull the latest image.
             fresh_img = None
             try:
-                fresh_img = client.images.pull(image_tag)
+                fresh_img = get_client().images.pull(image_tag)
             except Exception as e:
                 msg = f"Error pulling {image_tag}: {str(e)}"
                 logging.error(msg)
@@ -277,7 +290,7 @@ def update_container(container_name):
                     logging.error(f"Error removing container {cname}: {e}")
                 if image_tag:
                     try:
-                        client.images.remove(image=image_tag, force=True)
+                        get_client().images.remove(image=image_tag, force=True)
                     except Exception as e:
                         logging.error(f"Error removing old image {image_tag}: {e}")
 
@@ -298,7 +311,7 @@ def update_container(container_name):
                 if len(volumes) == 0:
                     volumes = None
 
-            new_container = client.containers.run(
+            new_container = get_client().containers.run(
                 image=image_tag,
                 name=cname,
                 command=cmd,
@@ -339,7 +352,7 @@ def update_container(container_name):
             # If update was successful, update the image_update_info cache.
             if updating_containers[cname]["success"]:
                 try:
-                    new_c = client.containers.get(cname)
+                    new_c = get_client().containers.get(cname)
                     new_image_id = updating_containers[cname].get("new_image_id")
                     if new_c and new_image_id and (new_c.image.id == new_image_id):
                         image_update_info[cname] = True
@@ -381,7 +394,7 @@ def check_container(container_name):
         Inner function to perform the check operation asynchronously.
         """
         try:
-            cont = client.containers.get(cname)
+            cont = get_client().containers.get(cname)
         except Exception as e:
             logging.error(f"Container not found: {e}")
             return
@@ -396,7 +409,7 @@ def check_container(container_name):
                 logging.error(f"Container '{cname}' has no image tag/digest")
                 return
         try:
-            latest_img = client.images.pull(image_tag)
+            latest_img = get_client().images.pull(image_tag)
             up_to_date = (cont.image.id == latest_img.id)
             image_update_info[cname] = up_to_date
         except Exception as e:
@@ -414,7 +427,7 @@ def background_check_all():
     dictionary with progress information.
     """
     global check_all_status, image_update_info
-    containers = client.containers.list(all=True)
+    containers = get_client().containers.list(all=True)
     total = len(containers)
     check_all_status['in_progress'] = True
     check_all_status['checked'] = 0
@@ -431,7 +444,7 @@ def background_check_all():
                 tag = repo_name + ":latest"
         if tag:
             try:
-                latest = client.images.pull(tag)
+                latest = get_client().images.pull(tag)
                 image_update_info[cname] = (c.image.id == latest.id)
             except Exception as e:
                 logging.error(f"Error pulling {tag} for {cname}: {e}")
@@ -0,0 +1,69 @@
+# downsample.py
+# Shape-preserving downsampling for time series served to the charts.
+# Both algorithms take parallel sequences (lists or array('d')) of timestamps and values
+# and return new array('d') columns of at most the requested length.
+
+from array import array
+
+
+def lttb(times, values, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last point and, for every bucket
+    in between, the point forming the largest triangle with the previously kept point
+    and the average of the next bucket. Returns (times, values).
+    """
+    n = len(times)
+    if threshold >= n or threshold < 3:
+        return array('d', times), array('d', values)
+    out_t = array('d', [times[0]])
+    out_v = array('d', [values[0]])
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Range of the bucket to pick from, and of the next bucket to average over.
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end >= next_end:
+            avg_t, avg_v = times[n - 1], values[n - 1]
+        else:
+            span = next_end - end
+            avg_t = sum(times[end:next_end]) / span
+            avg_v = sum(values[end:next_end]) / span
+        at, av = times[a], values[a]
+        dt = at - avg_t
+        dv = avg_v - av
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs(dt * (values[j] - av) - (at - times[j]) * dv)
+            if area > best_area:
+                best, best_area = j, area
+        out_t.append(times[best])
+        out_v.append(values[best])
+        a = best
+    out_t.append(times[n - 1])
+    out_v.append(values[n - 1])
+    return out_t, out_v
+
+
+def minmax(times, values, buckets, minimums=None, maximums=None):
+    """
+    Split the series into `buckets` equal-count buckets and keep the minimum and maximum
+    of each. `minimums`/`maximums` may carry per-point extremes (e.g. rollup min/max)
+    that are used instead of `values`. Returns (times, mins, maxs) with one entry per
+    bucket, timestamped at the bucket's first point.
+    """
+    n = len(times)
+    minimums = values if minimums is None else minimums
+    maximums = values if maximums is None else maximums
+    if buckets >= n or buckets < 1:
+        return array('d', times), array('d', minimums), array('d', maximums)
+    out_t, out_min, out_max = array('d'), array('d'), array('d')
+    every = n / buckets
+    for i in range(buckets):
+        start = int(i * every)
+        end = max(int((i + 1) * every), start + 1)
+        out_t.append(times[start])
+        out_min.append(min(minimums[start:end]))
+        out_max.append(max(maximums[start:end]))
+    return out_t, out_min, out_max
@@ -0,0 +1,101 @@
+# event_ring.py
+# Fixed-capacity ring of security events with increasing ids, read by cursor.
+# A poller passes the last id it has seen and gets only the newer events: the start is
+# found by binary search over the ids and only the returned slice is copied, so a poll
+# costs O(log n + returned events) however many events are retained.
+
+from collections import namedtuple
+
+# events: list of event dicts, oldest first; next_cursor: id to pass as `after` next time;
+# reset: the cursor was outside the retained ids (events were dropped in between, or the
+# ids restarted), so `events` starts at the oldest retained event and the client should
+# replace rather than extend what it has.
+CursorPage = namedtuple('CursorPage', ['events', 'next_cursor', 'reset'])
+
+
+def _read(get, size, after, limit):
+    """Cursor read over `size` events where get(i) is the i-th oldest."""
+    last_id = get(size - 1)['id'] if size else 0
+    if after is None:
+        start = 0 if limit is None else max(0, size - limit)
+        events = [get(i) for i in range(start, size)]
+        return CursorPage(events, events[-1]['id'] if events else 0, False)
+    first_id = get(0)['id'] if size else 1
+    reset = after > last_id or after < first_id - 1
+    if reset:
+        start = 0
+    else:
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get(mid)['id'] <= after:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+    end = size if limit is None else min(size, start + limit)
+    events = [get(i) for i in range(start, end)]
+    if events:
+        next_cursor = events[-1]['id']
+    else:
+        next_cursor = last_id if reset else after
+    return CursorPage(events, next_cursor, reset)
+
+
+def read_events(events, after=None, limit=None):
+    """Cursor read over a plain list of events ordered by id (e.g. a follower's feed copy)."""
+    return _read(events.__getitem__, len(events), after, limit)
+
+
+class EventRing:
+    """
+    Holds the newest `capacity` event dicts, appended with increasing 'id's.
+    Behaves like the deque it replaces for append, len, iteration and [-1];
+    read() is the cursor API. Not thread-safe: callers hold their cache lock.
+    """
+    __slots__ = ('capacity', '_events', '_head', '_size')
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._events = [None] * capacity
+        self._head = 0       # Slot the next event is written to.
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _get(self, index):
+        """index-th oldest retained event."""
+        return self._events[(self._head - self._size + index) % self.capacity]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("event ring index out of range")
+        return self._get(index)
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self._get(i)
+
+    def append(self, event):
+        if self._size and event['id'] <= self._get(self._size - 1)['id']:
+            raise ValueError("event ids must increase")
+        self._events[self._head] = event
+        self._head = (self._head + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def clear(self):
+        self._events = [None] * self.capacity
+        self._head = 0
+        self._size = 0
+
+    def read(self, after=None, limit=None):
+        """
+        Events with id > `after`, oldest first, at most `limit` of them; without a
+        cursor the newest `limit` events (all retained ones without a limit).
+        """
+        return _read(self._get, self._size, after, limit)
@@ -0,0 +1,212 @@
+# exposition.py
+# Prometheus text exposition (format 0.0.4) of the collector state for /metrics.
+# The text is rendered from the in-memory state only, never from SQLite or psutil, and
+# at most once per collector tick. While a scraper is active the collector renders it
+# right after each tick, so a scrape just writes the pre-rendered bytes.
+
+import math
+import time
+import threading
+import stats
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'simplehostmetrics_'
+SCRAPE_ACTIVE_WINDOW = 120   # seconds after the last scrape during which ticks pre-render
+
+# (psutil counter, metric name, help) of the per-interface counters.
+NETWORK_COUNTERS = (
+    ('bytes_recv', 'network_receive_bytes_total', 'Bytes received per interface.'),
+    ('bytes_sent', 'network_transmit_bytes_total', 'Bytes sent per interface.'),
+    ('packets_recv', 'network_receive_packets_total', 'Packets received per interface.'),
+    ('packets_sent', 'network_transmit_packets_total', 'Packets sent per interface.'),
+    ('errin', 'network_receive_errors_total', 'Receive errors per interface.'),
+    ('errout', 'network_transmit_errors_total', 'Transmit errors per interface.'),
+    ('dropin', 'network_receive_drops_total', 'Incoming packets dropped per interface.'),
+    ('dropout', 'network_transmit_drops_total', 'Outgoing packets dropped per interface.'),
+)
+
+# Callable returning {(type, code, country): count}; app.py wires it to rtad_manager.
+rtad_source = lambda: {}
+# Callable returning the GeoIP cache statistics (geo_cache.GeoCache.stats), or None.
+geo_cache_source = lambda: None
+
+_current = (None, b'')      # (tick version, rendered bytes)
+_last_scrape = 0.0
+_render_lock = threading.Lock()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    """Sample value as the text format spells it, including NaN and the infinities."""
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def sanitize(name):
+    """Turn an arbitrary collector/field name into a valid metric name fragment."""
+    return ''.join(c if c.isalnum() or c == '_' else '_' for c in name)
+
+
+class Family:
+    """One metric family: HELP/TYPE header plus its samples."""
+    __slots__ = ('name', 'kind', 'help', 'samples')
+
+    def __init__(self, name, kind, help):
+        self.name = PREFIX + name
+        self.kind = kind
+        self.help = help
+        self.samples = []
+
+    def add(self, value, **labels):
+        if value is not None:
+            self.samples.append((labels, value))
+        return self
+
+    def render(self, lines):
+        if not self.samples:
+            return
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        lines.append('# TYPE %s %s' % (self.name, self.kind))
+        for labels, value in self.samples:
+            if labels:
+                label_text = ','.join('%s="%s"' % (k, escape(v)) for k, v in sorted(labels.items()))
+                lines.append('%s{%s} %s' % (self.name, label_text, format_value(value)))
+            else:
+                lines.append('%s %s' % (self.name, format_value(value)))
+
+
+def collect():
+    """Build the metric families from the collector state. Call with stats.state_lock held."""
+    system = stats.cached_stats['system']
+    families = []
+
+    def family(name, kind, help):
+        f = Family(name, kind, help)
+        families.append(f)
+        return f
+
+    family('cpu_usage_percent', 'gauge', 'CPU utilisation in percent.').add(system.get('cpu'))
+    family('load15', 'gauge', '15 minute load average.').add(system.get('cpu_details', {}).get('load15'))
+
+    # Byte gauges come from the collectors' unrounded values, not the GB display values.
+    memory = system.get('memory')
+    memory_bytes = getattr(stats.active_collectors.get('memory'), 'last_bytes', None)
+    if memory and memory_bytes:
+        for field in ('total', 'used', 'free', 'cached'):
+            family('memory_%s_bytes' % field, 'gauge', 'Memory %s in bytes.' % field).add(memory_bytes[field])
+    if memory:
+        family('memory_usage_percent', 'gauge', 'Memory utilisation in percent.').add(memory['percent'])
+
+    disk = system.get('disk')
+    collector = stats.active_collectors.get('disk')
+    path = getattr(collector, 'path', '/')
+    disk_bytes = getattr(collector, 'last_bytes', None)
+    if disk and disk_bytes:
+        for field in ('total', 'used', 'free'):
+            family('disk_%s_bytes' % field, 'gauge', 'Filesystem %s in bytes.' % field).add(disk_bytes[field], path=path)
+    if disk:
+        family('disk_usage_percent', 'gauge', 'Filesystem utilisation in percent.').add(disk['percent'], path=path)
+
+    # Raw interface counters as last read by the network collector.
+    network = stats.active_collectors.get('network')
+    counters = network.totals() if network is not None else {}
+    for counter, name, help in NETWORK_COUNTERS:
+        f = family(name, 'counter', help)
+        for iface, values in sorted(counters.items()):
+            f.add(values[counter], interface=iface)
+
+    # Optional collectors: one gauge family per field.
+    for name, values in sorted(stats.latest_metrics.items()):
+        collector = stats.active_collectors.get(name)
+        if collector is None:
+            continue
+        for field in collector.fields:
+            f = family('%s_%s' % (sanitize(name), sanitize(field)), 'gauge',
+                       '%s %s (collector %s).' % (name, field, name))
+            if collector.keyed:
+                for key, row in sorted(values.items()):
+                    f.add(row[field], key=key)
+            else:
+                f.add(values[field])
+
+    info = family('container_info', 'gauge', 'Docker containers with their status and image.')
+    running = family('container_running', 'gauge', 'Whether the container is running.')
+    uptime = family('container_uptime_seconds', 'gauge', 'Seconds since the container was created.')
+    up_to_date = family('container_up_to_date', 'gauge', 'Whether the container image is up to date.')
+    for container in stats.cached_stats['docker'] or []:
+        name = container.get('name')
+        info.add(1, name=name, status=container.get('status'), image=container.get('image'))
+        running.add(1 if container.get('status') == 'running' else 0, name=name)
+        uptime.add(container.get('uptime'), name=name)
+        up_to_date.add(1 if container.get('up_to_date') else 0, name=name)
+
+    events = family('rtad_events_total', 'counter', 'Security events by type, HTTP code and country.')
+    for (kind, code, country), count in sorted(rtad_source().items()):
+        events.add(count, type=kind, code=code, country=country)
+
+    geo = geo_cache_source()
+    if geo is not None:
+        lookups = family('geoip_cache_lookups_total', 'counter', 'GeoIP cache lookups by result.')
+        lookups.add(geo['hits'], result='hit')
+        lookups.add(geo['negative_hits'], result='negative_hit')
+        lookups.add(geo['misses'], result='miss')
+        family('geoip_cache_evictions_total', 'counter', 'GeoIP cache entries evicted by the size bound.').add(
+            geo['evictions'])
+        family('geoip_cache_entries', 'gauge', 'GeoIP cache entries (network blocks).').add(geo['entries'])
+
+    jobs = stats.scheduler.jobs
+    runs = family('collector_runs_total', 'counter', 'Collector runs.')
+    missed = family('collector_missed_total', 'counter', 'Collector slots skipped because the collector was late.')
+    errors = family('collector_errors_total', 'counter', 'Collector runs that failed.')
+    duration = family('collector_duration_seconds', 'gauge', 'Duration of the last collector run.')
+    for job in jobs:
+        runs.add(job.runs, collector=job.name)
+        missed.add(job.missed, collector=job.name)
+        errors.add(job.errors, collector=job.name)
+        duration.add(job.last_duration, collector=job.name)
+    family('db_writer_dropped_total', 'counter', 'Rows dropped by the stats.db writer.').add(stats.db_writer.dropped)
+    return families
+
+
+def render(version):
+    lines = []
+    for family in collect():
+        family.render(lines)
+    lines.append('')
+    return version, '\n'.join(lines).encode('utf-8')
+
+
+def refresh():
+    """Render the exposition for the current tick unless it is already up to date."""
+    global _current
+    with _render_lock:
+        with stats.state_lock:
+            if _current[0] != stats.tick_seq:
+                _current = render(stats.tick_seq)
+        return _current[1]
+
+
+def on_tick():
+    """Collector hook: pre-render while a scraper is active."""
+    if time.monotonic() - _last_scrape < SCRAPE_ACTIVE_WINDOW:
+        refresh()
+
+
+def get_exposition():
+    """Return the exposition bytes for the latest tick (a copy-free read when pre-rendered)."""
+    global _last_scrape
+    _last_scrape = time.monotonic()
+    version, body = _current
+    if version == stats.tick_seq:
+        return body
+    return refresh()
+
+
+stats.tick_listeners.append(on_tick)
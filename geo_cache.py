@@ -0,0 +1,142 @@
+# geo_cache.py
+# Bounded LRU cache of GeoIP results, keyed by the GeoIP network block of an address.
+# A GeoIP database maps whole networks (e.g. a /24 or an IPv6 /48) to one location, so
+# every address of a scanner subnet is answered by a single entry. Failed lookups
+# (unknown or private addresses, no database yet) are cached separately with a short TTL.
+
+import time
+import threading
+import ipaddress
+from collections import OrderedDict
+
+
+class PrefixLRU:
+    """
+    LRU map from IP networks to values with a per-map TTL and capacity.
+    Lookups probe only the prefix lengths currently stored, most specific first.
+    Not thread-safe; GeoCache serializes access.
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()   # (version, prefixlen, network int) -> (expires, value)
+        self.prefixes = {}             # (version, prefixlen) -> number of stored entries
+        self.probe_order = []          # keys of `prefixes`, longest prefix first
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, address, now):
+        value = int(address)
+        bits = address.max_prefixlen
+        for version, prefixlen in self.probe_order:
+            if version != address.version:
+                continue
+            key = (version, prefixlen, value >> (bits - prefixlen) << (bits - prefixlen))
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                self._remove(key)
+                self.expirations += 1
+                continue
+            self.entries.move_to_end(key)
+            return entry[1]
+        return None
+
+    def put(self, network, value, now):
+        key = (network.version, network.prefixlen, int(network.network_address))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            prefix = key[:2]
+            if prefix not in self.prefixes:
+                self.prefixes[prefix] = 0
+                self._reorder()
+            self.prefixes[prefix] += 1
+        self.entries[key] = (now + self.ttl, value)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self.entries[key]
+        prefix = key[:2]
+        self.prefixes[prefix] -= 1
+        if not self.prefixes[prefix]:
+            del self.prefixes[prefix]
+            self._reorder()
+
+    def _reorder(self):
+        self.probe_order = sorted(self.prefixes, key=lambda p: -p[1])
+
+    def clear(self):
+        self.entries.clear()
+        self.prefixes.clear()
+        self.probe_order = []
+
+
+class GeoCache:
+    """
+    Caches `lookup(ip) -> (info, network, found)`. `network` is the ipaddress network
+    the answer applies to (None for just this address); `found` is False for failures.
+    get() returns a copy of the cached info dict.
+    """
+    def __init__(self, lookup, max_entries=4096, ttl=3600, max_failures=1024, failure_ttl=60,
+                 clock=time.monotonic):
+        self.lookup = lookup
+        self.clock = clock
+        self.results = PrefixLRU(max_entries, ttl)
+        self.failures = PrefixLRU(max_failures, failure_ttl)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, ip):
+        ip = ip.strip()
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            address = None
+        if address is not None:
+            now = self.clock()
+            with self.lock:
+                info = self.results.get(address, now)
+                if info is not None:
+                    self.hits += 1
+                    return dict(info)
+                info = self.failures.get(address, now)
+                if info is not None:
+                    self.negative_hits += 1
+                    return dict(info)
+                self.misses += 1
+        # Looked up outside the lock; concurrent misses for one block just store it twice.
+        info, network, found = self.lookup(ip)
+        if address is not None:
+            if network is None:
+                network = ipaddress.ip_network(address)
+            with self.lock:
+                (self.results if found else self.failures).put(network, dict(info), self.clock())
+        return dict(info)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.failures.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'entries': len(self.results),
+                'failure_entries': len(self.failures),
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                'evictions': self.results.evictions + self.failures.evictions,
+                'expirations': self.results.expirations + self.failures.expirations,
+            }
@@ -0,0 +1,183 @@
+# gorilla.py
+# Gorilla-style compression of (timestamp, float) series into small chunks.
+# Timestamps (integer epoch seconds) are stored as delta-of-deltas, which is a single
+# bit for a regular interval; values are XORed with their predecessor and only the
+# meaningful bits are stored, which is a single bit for an unchanged value.
+# See "Gorilla: A Fast, Scalable, In-Memory Time Series Database" (VLDB 2015).
+
+import struct
+
+FORMAT_VERSION = 1
+CHUNK_HEADER = struct.Struct('>BH')      # format version, number of points
+_DOUBLE = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+
+# Delta-of-delta encodings: '0' for zero, then '10', '110', '1110' followed by a
+# 7, 9 or 12 bit two's complement value, and '1111' followed by 64 bits.
+DOD_LENGTHS = (7, 9, 12)
+DOD_FALLBACK_LENGTH = 64
+
+
+def _float_bits(value):
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_float(bits):
+    return _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+class BitWriter:
+    __slots__ = ('out', 'acc', 'bits')
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0      # pending bits not yet flushed to `out`
+        self.bits = 0
+
+    def write(self, value, length):
+        self.acc = (self.acc << length) | (value & ((1 << length) - 1))
+        self.bits += length
+        while self.bits >= 8:
+            self.bits -= 8
+            self.out.append((self.acc >> self.bits) & 0xFF)
+        self.acc &= (1 << self.bits) - 1
+
+    def getvalue(self):
+        """The bits written so far, zero-padded to whole bytes (writing may continue)."""
+        if not self.bits:
+            return bytes(self.out)
+        return bytes(self.out) + bytes([(self.acc << (8 - self.bits)) & 0xFF])
+
+
+class BitReader:
+    __slots__ = ('value', 'total', 'pos')
+
+    def __init__(self, data):
+        self.value = int.from_bytes(data, 'big')
+        self.total = len(data) * 8
+        self.pos = 0
+
+    def read(self, length):
+        self.pos += length
+        if self.pos > self.total:
+            raise ValueError("truncated chunk")
+        return (self.value >> (self.total - self.pos)) & ((1 << length) - 1)
+
+
+def _signed(value, length):
+    return value - (1 << length) if value >> (length - 1) else value
+
+
+class ChunkEncoder:
+    """
+    Streaming encoder: append() points with increasing timestamps, then getvalue()
+    returns the chunk at any moment without ending the stream.
+    """
+    def __init__(self):
+        self.writer = BitWriter()
+        self.count = 0
+        self.first_time = None
+        self.last_time = None
+        self._delta = 0
+        self._value = 0           # bits of the previous value
+        self._leading = -1        # leading/trailing zeros of the previous stored XOR window
+        self._trailing = 0
+
+    def append(self, timestamp, value):
+        timestamp = int(timestamp)
+        bits = _float_bits(value)
+        w = self.writer
+        if self.count == 0:
+            w.write(timestamp, 64)
+            w.write(bits, 64)
+            self.first_time = timestamp
+        else:
+            if timestamp <= self.last_time:
+                raise ValueError("timestamps must increase (got %s after %s)" % (timestamp, self.last_time))
+            delta = timestamp - self.last_time
+            self._write_dod(delta - self._delta)
+            self._delta = delta
+            self._write_value(bits)
+        self._value = bits
+        self.last_time = timestamp
+        self.count += 1
+
+    def _write_dod(self, dod):
+        w = self.writer
+        if dod == 0:
+            w.write(0, 1)
+            return
+        for i, length in enumerate(DOD_LENGTHS):
+            if -(1 << (length - 1)) <= dod < (1 << (length - 1)):
+                w.write((1 << (i + 2)) - 2, i + 2)     # i+1 ones and a zero
+                break
+        else:
+            length = DOD_FALLBACK_LENGTH
+            w.write(0b1111, 4)
+        w.write(dod, length)
+
+    def _write_value(self, bits):
+        w = self.writer
+        xor = bits ^ self._value
+        if xor == 0:
+            w.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self._leading >= 0 and leading >= self._leading and trailing >= self._trailing:
+            # Fits the previous window: reuse its position.
+            w.write(0b10, 2)
+            w.write(xor >> self._trailing, 64 - self._leading - self._trailing)
+            return
+        length = 64 - leading - trailing
+        w.write(0b11, 2)
+        w.write(leading, 5)
+        w.write(length & 63, 6)          # 64 is stored as 0
+        w.write(xor >> trailing, length)
+        self._leading, self._trailing = leading, trailing
+
+    def getvalue(self):
+        return CHUNK_HEADER.pack(FORMAT_VERSION, self.count) + self.writer.getvalue()
+
+
+def decode(data):
+    """Yield the (timestamp, value) points of a chunk in order (streaming)."""
+    version, count = CHUNK_HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported chunk format %s" % version)
+    if not count:
+        return
+    reader = BitReader(bytes(data[CHUNK_HEADER.size:]))
+    timestamp = reader.read(64)
+    bits = reader.read(64)
+    yield timestamp, _bits_float(bits)
+    delta = 0
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read(1):
+            length = DOD_FALLBACK_LENGTH
+            for bucket_length in DOD_LENGTHS:
+                if not reader.read(1):
+                    length = bucket_length
+                    break
+            delta += _signed(reader.read(length), length)
+        timestamp += delta
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                length = reader.read(6) or 64
+                trailing = 64 - leading - length
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        yield timestamp, _bits_float(bits)
+
+
+def decode_range(data, start, end):
+    """(times, values) of the chunk's points with start <= timestamp <= end."""
+    times, values = [], []
+    for timestamp, value in decode(data):
+        if timestamp > end:
+            break
+        if timestamp >= start:
+            times.append(timestamp)
+            values.append(value)
+    return times, values
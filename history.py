@@ -0,0 +1,162 @@
+# history.py
+# Time-range history queries backing /api/history.
+# A query picks the finest tier (raw 1s rows or a rollup tier) whose row count for the
+# requested range stays within a small multiple of the requested points, then
+# downsamples on the server. Query cost is therefore bounded by the point count,
+# not by the length of the time range.
+# Rollups are read from memory in the process running the collectors and from the
+# persisted rollups table in other web workers. Older minute data comes from the
+# compressed archive (archive.py), which keeps minute resolution for a year.
+
+import bisect
+import time
+from database import read_connection
+from downsample import lttb, minmax
+import stats
+import archive
+
+RAW_TIER = '1s'
+OVERSAMPLE = 4        # Rows read per requested point before downsampling.
+DEFAULT_POINTS = 300
+MAX_POINTS = 5000
+MODES = ('lttb', 'minmax')
+
+# metric -> (table, value expression) for the raw 1s tier.
+# Memory rollups track psutil's `used`, which the raw table stores split into used + cached.
+RAW_COLUMNS = {
+    'cpu': ('cpu_history', 'usage'),
+    'memory': ('memory_history', 'used + cached'),
+    'disk': ('disk_history_basic', 'used'),
+}
+
+
+def raw_source(metric):
+    """Return (table, value expression, extra where, params) for a metric's raw rows, or None."""
+    if metric in RAW_COLUMNS:
+        table, column = RAW_COLUMNS[metric]
+        return table, column, '', ()
+    if metric.startswith('net.'):
+        iface, _, direction = metric[4:].rpartition('.')
+        if iface and direction in ('input', 'output'):
+            return 'net_history', direction, 'interface = ? AND ', (iface,)
+    return None
+
+
+def available_tiers():
+    """(name, step, retention) from finest to coarsest."""
+    tiers = [(RAW_TIER, 1, stats.RAW_RETENTION)]
+    for name, step, capacity in stats.rollups.tier_specs:
+        tiers.append((name, step, step * capacity))
+        if name == archive.SOURCE_TIER:
+            tiers.append((archive.TIER, archive.STEP, stats.ARCHIVE_RETENTION))
+    return tiers
+
+
+def choose_tier(start, end, points, now=None):
+    """
+    Pick the finest tier that still reaches back to `start` and returns at most
+    points * OVERSAMPLE rows for the range. Falls back to the coarsest tier.
+    """
+    now = time.time() if now is None else now
+    tiers = available_tiers()
+    for name, step, retention in tiers:
+        if start >= now - retention and (end - start) / step <= points * OVERSAMPLE:
+            return name
+    return tiers[-1][0]
+
+
+def _raw_points(metric, start, end):
+    source = raw_source(metric)
+    if source is None:
+        raise KeyError("No raw history for metric %s" % metric)
+    table, column, where, params = source
+    rows = read_connection().execute(
+        "SELECT timestamp, {column} AS value FROM {table} WHERE {where}timestamp BETWEEN ? AND ? "
+        "ORDER BY timestamp".format(column=column, table=table, where=where),
+        params + (start, end)
+    ).fetchall()
+    times = [r['timestamp'] for r in rows]
+    values = [r['value'] for r in rows]
+    return times, values, values, values
+
+
+def _stored_rollup_points(metric, tier_name, start, end):
+    rows = read_connection().execute(
+        "SELECT timestamp, min, max, mean FROM rollups WHERE series = ? AND tier = ? "
+        "AND timestamp BETWEEN ? AND ? ORDER BY timestamp",
+        (metric, tier_name, start, end)
+    ).fetchall()
+    return ([r['timestamp'] for r in rows], [r['mean'] for r in rows],
+            [r['min'] for r in rows], [r['max'] for r in rows])
+
+
+def stored_series_exists(metric):
+    return read_connection().execute(
+        "SELECT 1 FROM rollups WHERE series = ? LIMIT 1", (metric,)).fetchone() is not None
+
+
+def _archive_points(metric, start, end):
+    times, values = archive.points(metric, start, end)
+    # The open chunk is only written every few dozen points; add what is still buffered.
+    open_times, open_values = stats.archive.open_points(metric, start, end)
+    newer = bisect.bisect_right(open_times, times[-1]) if times else 0
+    times.extend(open_times[newer:])
+    values.extend(open_values[newer:])
+    return times, values, values, values
+
+
+def _rollup_points(metric, tier_name, start, end):
+    series = stats.rollups.get(metric)
+    if series is None:
+        return _stored_rollup_points(metric, tier_name, start, end)
+    view = series.tier(tier_name).buffer.between(start, end)
+    times, means = view.times(), view.values('mean')
+    mins, maxs = view.values('min'), view.values('max')
+    open_bucket = series.open_bucket(tier_name)
+    if open_bucket is not None and start <= open_bucket[0] <= end and (not times or open_bucket[0] > times[-1]):
+        bucket, minimum, maximum, mean, count = open_bucket
+        times.append(bucket)
+        means.append(mean)
+        mins.append(minimum)
+        maxs.append(maximum)
+    return times, means, mins, maxs
+
+
+def query_history(metric, start=None, end=None, points=DEFAULT_POINTS, mode='lttb'):
+    """
+    Return {'metric', 'tier', 'from', 'to', 'time', ...} for `metric` between `start` and `end`
+    (epoch seconds), downsampled to at most `points` entries.
+    mode 'lttb' returns a 'value' column; mode 'minmax' returns 'min' and 'max' columns.
+    Raises KeyError for unknown metrics and ValueError for invalid arguments.
+    """
+    if mode not in MODES:
+        raise ValueError("mode must be one of %s" % ', '.join(MODES))
+    end = time.time() if end is None else float(end)
+    start = end - 3600 if start is None else float(start)
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+    points = max(3, min(int(points), MAX_POINTS))
+    known = (stats.rollups.get(metric) is not None or raw_source(metric) is not None
+             or stored_series_exists(metric) or archive.series_exists(metric))
+    if not known:
+        raise KeyError("Unknown metric %s" % metric)
+
+    tier = choose_tier(start, end, points)
+    if tier == RAW_TIER:
+        times, values, mins, maxs = _raw_points(metric, start, end)
+    elif tier == archive.TIER:
+        times, values, mins, maxs = _archive_points(metric, start, end)
+    else:
+        times, values, mins, maxs = _rollup_points(metric, tier, start, end)
+
+    result = {'metric': metric, 'tier': tier, 'from': start, 'to': end, 'mode': mode}
+    if mode == 'lttb':
+        out_t, out_v = lttb(times, values, points)
+        result['time'] = out_t.tolist()
+        result['value'] = out_v.tolist()
+    else:
+        out_t, out_min, out_max = minmax(times, values, points, mins, maxs)
+        result['time'] = out_t.tolist()
+        result['min'] = out_min.tolist()
+        result['max'] = out_max.tolist()
+    return result
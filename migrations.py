@@ -0,0 +1,139 @@
+# migrations.py
+# Versioned schema migrations for stats.db.
+# The schema version is kept in SQLite's PRAGMA user_version. migrate() applies every
+# migration newer than the recorded version, each in its own transaction together with
+# the version bump, so an interrupted upgrade is simply retried on the next start.
+
+import logging
+
+# Raw sample tables: name -> value columns. The integer epoch second is the primary key.
+RAW_TABLES = {
+    'cpu_history': ('usage',),
+    'memory_history': ('free', 'used', 'cached'),
+    'disk_history_basic': ('total', 'used', 'free'),
+}
+
+COUNTRY_CENTROIDS = [
+    ('US', 37.0902, -95.7129), ('CN', 35.8617, 104.1954), ('NL', 52.1326, 5.2913),
+    ('GB', 55.3781, -3.4360), ('DE', 51.1657, 10.4515), ('FR', 46.2276, 2.2137),
+    ('RU', 61.5240, 105.3188), ('CA', 56.1304, -106.3468), ('BR', -14.2350, -51.9253),
+    ('AU', -25.2744, 133.7751), ('JP', 36.2048, 138.2529), ('IN', 20.5937, 78.9629),
+    ('SG', 1.3521, 103.8198), ('KR', 35.9078, 127.7669), ('ZA', -30.5595, 22.9375),
+    ('SE', 60.1282, 18.6435), ('CH', 46.8182, 8.2275), ('AT', 47.5162, 14.5501),
+    ('BE', 50.5039, 4.4699), ('DK', 56.2639, 9.5018),
+]
+
+
+def initial_schema(conn):
+    """Version 1: the schema as created before versioning (a no-op on existing databases)."""
+    conn.execute("CREATE TABLE IF NOT EXISTS cpu_history (timestamp REAL, usage REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS cpu_history_24h (timestamp REAL, usage REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS memory_history (timestamp REAL, free REAL, used REAL, cached REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS memory_history_24h (timestamp REAL, usage REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS disk_history_basic (timestamp REAL, total REAL, used REAL, free REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS disk_history_details (timestamp REAL, used REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS net_history (interface TEXT, timestamp REAL, input REAL, output REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS rollups (series TEXT, tier TEXT, timestamp REAL, min REAL, max REAL, mean REAL, count INTEGER)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rollups_series_tier_ts ON rollups (series, tier, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_rollups_tier_ts ON rollups (tier, timestamp)")
+    conn.execute("CREATE TABLE IF NOT EXISTS custom_network_graphs (id INTEGER PRIMARY KEY, graph_name TEXT, interfaces TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS country_centroids (country_code TEXT PRIMARY KEY, lat REAL, lon REAL)")
+    conn.executemany("INSERT OR IGNORE INTO country_centroids (country_code, lat, lon) VALUES (?, ?, ?)",
+                     COUNTRY_CENTROIDS)
+
+
+def integer_time_keys(conn):
+    """
+    Version 2: key the raw tables by integer epoch seconds.
+    cpu/memory/disk rows live in the rowid B-tree itself (INTEGER PRIMARY KEY), so
+    newest-N and time-range reads are tree walks without a sort. net_history is keyed by
+    (interface, timestamp), with a separate timestamp index for retention and latest-time
+    lookups. Rows that collapse onto the same second keep the latest one. The unused
+    pre-rollup 24h tables are dropped.
+    """
+    for table, columns in RAW_TABLES.items():
+        rebuild(conn, table,
+                "CREATE TABLE {0} (timestamp INTEGER PRIMARY KEY, %s)" % ', '.join('%s REAL' % c for c in columns),
+                ('timestamp',) + columns)
+    rebuild(conn, 'net_history',
+            "CREATE TABLE {0} (interface TEXT NOT NULL, timestamp INTEGER NOT NULL, input REAL, output REAL, "
+            "PRIMARY KEY (interface, timestamp))",
+            ('interface', 'timestamp', 'input', 'output'))
+    conn.execute("CREATE INDEX idx_net_history_timestamp ON net_history (timestamp)")
+    for table in ('cpu_history_24h', 'memory_history_24h', 'disk_history_details'):
+        conn.execute("DROP TABLE IF EXISTS %s" % table)
+
+
+def rebuild(conn, table, create_sql, columns):
+    """Recreate `table` from `create_sql` (with {0} as the table name), copying its rows."""
+    selected = ', '.join('CAST(timestamp AS INTEGER)' if c == 'timestamp' else c for c in columns)
+    conn.execute(create_sql.format(table + '_new'))
+    conn.execute("INSERT OR REPLACE INTO {0}_new ({1}) SELECT {2} FROM {0} WHERE timestamp IS NOT NULL "
+                 "ORDER BY rowid".format(table, ', '.join(columns), selected))
+    conn.execute("DROP TABLE %s" % table)
+    conn.execute("ALTER TABLE {0}_new RENAME TO {0}".format(table))
+
+
+def archive_chunks(conn):
+    """Version 3: compressed long-term history chunks (see archive.py), indexed by time range."""
+    conn.execute("CREATE TABLE chunks (series TEXT NOT NULL, start_time INTEGER NOT NULL, "
+                 "end_time INTEGER NOT NULL, count INTEGER NOT NULL, data BLOB NOT NULL, "
+                 "PRIMARY KEY (series, start_time))")
+    conn.execute("CREATE INDEX idx_chunks_series_end ON chunks (series, end_time)")
+    conn.execute("CREATE INDEX idx_chunks_end ON chunks (end_time)")
+
+
+def attack_entry_indexes(conn):
+    """
+    Version 4: RTAD event store (attack_store.py). The table matches models.AttackEntry and
+    may already exist from db.create_all(). Each single-column index also orders by id,
+    so newest-first pages filtered by one value are index walks; a timestamp range is
+    not ordered by id and still needs a sort or a rowid scan.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS attack_entries (id INTEGER PRIMARY KEY, type VARCHAR NOT NULL, "
+                 "ip_address VARCHAR, country VARCHAR, city VARCHAR, user VARCHAR, failure_reason VARCHAR, "
+                 "domain VARCHAR, error_code VARCHAR, url VARCHAR, timestamp BIGINT, lat FLOAT, lon FLOAT, "
+                 "country_lat FLOAT, country_lon FLOAT)")
+    for column in ('timestamp', 'ip_address', 'country', 'type'):
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_attack_entries_{0} ON attack_entries ({0})".format(column))
+
+
+def log_offsets(conn):
+    """Version 5: how far each RTAD log file has been read (rtad_manager.FileOffsetTracker)."""
+    conn.execute("CREATE TABLE log_offsets (path TEXT PRIMARY KEY, inode INTEGER NOT NULL, "
+                 "position INTEGER NOT NULL)")
+
+
+# (version, migration); append new entries, never edit applied ones.
+MIGRATIONS = [
+    (1, initial_schema),
+    (2, integer_time_keys),
+    (3, archive_chunks),
+    (4, attack_entry_indexes),
+    (5, log_offsets),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring `conn`'s database up to SCHEMA_VERSION; returns the versions applied."""
+    applied = []
+    for version, migration in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute("PRAGMA user_version = %d" % version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        logging.info("Migrated stats.db to schema version %s (%s)", version, migration.__name__)
+    return applied
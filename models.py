@@ -77,19 +77,20 @@ class AttackEntry(db.Model):
     type, IP address, country, city, user involved, failure reason, domain, error code,
     URL, timestamp, and geolocation data.
     Also includes optional fields for country centroid coordinates.
+    Written by attack_store.py; the indexes are created by migrations.py.
     """
     __tablename__ = "attack_entries"
     id = Column(Integer, primary_key=True)           # Primary key for the attack entry.
-    type = Column(String, nullable=False)              # Type of attack or event.
-    ip_address = Column(String)                        # IP address involved in the attack.
-    country = Column(String)                           # Country associated with the IP.
+    type = Column(String, nullable=False, index=True)  # Type of attack or event ('login' or 'proxy').
+    ip_address = Column(String, index=True)            # IP address involved in the attack.
+    country = Column(String, index=True)               # Country associated with the IP.
     city = Column(String)                              # City associated with the IP.
     user = Column(String)                              # User related to the event (if applicable).
     failure_reason = Column(String)                    # Reason for the failure (if applicable).
     domain = Column(String)                            # Domain associated with the event.
     error_code = Column(String)                        # HTTP or other error code.
     url = Column(String)                               # URL involved in the attack.
-    timestamp = Column(BigInteger)                     # Timestamp of the event as a big integer.
+    timestamp = Column(BigInteger, index=True)         # Timestamp of the event (epoch seconds).
     lat = Column(Float)                                # Latitude from geolocation lookup.
     lon = Column(Float)                                # Longitude from geolocation lookup.
     # Optional fields: Country centroid coordinates used as fallback if city info is unavailable.
@@ -0,0 +1,216 @@
+# ring_buffer.py
+# Fixed-capacity ring buffers for the in-memory metric histories.
+# Every buffer preallocates one array per field (plus timestamp and sequence columns),
+# so appending a sample never allocates, shifts or trims anything.
+
+from array import array
+
+
+class RingBuffer:
+    """
+    Fixed-capacity time series storing a timestamp, a sequence number and any
+    number of float fields per sample.
+
+    Appends are O(1): once the buffer is full the oldest sample is overwritten.
+    Sequence numbers increase monotonically and survive clear(), so a reader can
+    always ask for "everything after seq N".
+    """
+    __slots__ = ('capacity', 'fields', '_field_index', '_times', '_seqs', '_columns',
+                 '_head', '_size', '_last_seq')
+
+    def __init__(self, capacity, fields):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._field_index = {name: i for i, name in enumerate(self.fields)}
+        self._times = array('d', bytes(8 * capacity))
+        self._seqs = array('q', bytes(8 * capacity))
+        self._columns = [array('d', bytes(8 * capacity)) for _ in self.fields]
+        self._head = 0       # Slot the next sample is written to.
+        self._size = 0       # Number of valid samples.
+        self._last_seq = 0   # Sequence number of the newest sample.
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest sample (0 if nothing was ever appended)."""
+        return self._last_seq
+
+    @property
+    def first_seq(self):
+        """Sequence number of the oldest retained sample, or None when empty."""
+        if not self._size:
+            return None
+        return self._seqs[self._start()]
+
+    def append(self, timestamp, values, seq=None):
+        """
+        Append one sample. `values` must be ordered like `fields`.
+        If `seq` is omitted the previous sequence number plus one is used.
+        Returns the sequence number of the stored sample.
+        """
+        if seq is None:
+            seq = self._last_seq + 1
+        elif seq <= self._last_seq:
+            raise ValueError("sequence numbers must increase (got %s after %s)" % (seq, self._last_seq))
+        head = self._head
+        self._times[head] = timestamp
+        self._seqs[head] = seq
+        for column, value in zip(self._columns, values):
+            column[head] = value
+        self._head = (head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+        self._last_seq = seq
+        return seq
+
+    def clear(self):
+        """Drop all samples. The sequence counter keeps increasing afterwards."""
+        self._head = 0
+        self._size = 0
+
+    def dump(self):
+        """
+        Return the retained samples oldest first as raw bytes:
+        (times, seqs, [one column per field]), e.g. for a checkpoint.
+        """
+        view = self.window()
+        def raw(column):
+            return b''.join(segment.tobytes() for segment in view._segments(column))
+        return raw(self._times), raw(self._seqs), [raw(column) for column in self._columns]
+
+    def load(self, times, seqs, columns, last_seq):
+        """
+        Replace the contents with samples in the layout produced by dump() (any buffer
+        objects of native doubles/int64s). Only the newest `capacity` samples are kept.
+        """
+        count = len(times) // 8
+        keep = min(count, self.capacity)
+        skip = count - keep
+        def load_column(target, typecode, data):
+            values = array(typecode)
+            values.frombytes(data)
+            target[0:keep] = values[skip:]
+        load_column(self._times, 'd', times)
+        load_column(self._seqs, 'q', seqs)
+        for column, data in zip(self._columns, columns):
+            load_column(column, 'd', data)
+        self._head = keep % self.capacity
+        self._size = keep
+        self._last_seq = max(last_seq, self._seqs[keep - 1] if keep else 0)
+
+    def latest(self):
+        """Return (timestamp, {field: value}) for the newest sample, or None when empty."""
+        if not self._size:
+            return None
+        slot = (self._head - 1) % self.capacity
+        return self._times[slot], {name: self._columns[i][slot] for i, name in enumerate(self.fields)}
+
+    def window(self, count=None):
+        """Return a view over the newest `count` samples (all samples if count is None)."""
+        if count is None or count > self._size:
+            count = self._size
+        return RingView(self, self._size - max(count, 0), max(count, 0))
+
+    def since(self, seq, until=None):
+        """
+        Return a view over all samples whose sequence number is greater than `seq`
+        (and not greater than `until`, if given).
+        """
+        lo = self._bisect(seq)
+        hi = self._size if until is None else self._bisect(until)
+        return RingView(self, lo, max(hi - lo, 0))
+
+    def between(self, start, end):
+        """Return a view over samples with start <= timestamp <= end (timestamps must be ascending)."""
+        lo = self._bisect(start, self._times, right=False)
+        hi = self._bisect(end, self._times)
+        return RingView(self, lo, max(hi - lo, 0))
+
+    def _bisect(self, key, column=None, right=True):
+        """
+        bisect_right (or bisect_left with right=False) over the logical order of `column`,
+        which defaults to the sequence numbers.
+        """
+        column = self._seqs if column is None else column
+        lo, hi = 0, self._size
+        start = self._start()
+        capacity = self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = column[(start + mid) % capacity]
+            if value < key or (right and value == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _start(self):
+        return (self._head - self._size) % self.capacity
+
+
+class RingView:
+    """
+    Zero-copy window over a contiguous run of samples in a RingBuffer.
+    The view stays valid until the buffer wraps over the samples it covers,
+    so it should be consumed right away (e.g. while building a response).
+    """
+    __slots__ = ('_buffer', '_offset', '_count')
+
+    def __init__(self, buffer, offset, count):
+        self._buffer = buffer
+        self._offset = offset   # Logical index of the first sample (0 = oldest retained).
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def _segments(self, column):
+        buf = self._buffer
+        if not self._count:
+            return ()
+        start = (buf._start() + self._offset) % buf.capacity
+        end = start + self._count
+        mv = memoryview(column)
+        if end <= buf.capacity:
+            return (mv[start:end],)
+        return (mv[start:], mv[:end - buf.capacity])
+
+    def segments(self, field):
+        """Return the raw memoryview segments (one or two) backing `field`."""
+        return self._segments(self._buffer._columns[self._buffer._field_index[field]])
+
+    def times(self):
+        return _join(self._segments(self._buffer._times))
+
+    def seqs(self):
+        return _join(self._segments(self._buffer._seqs))
+
+    def values(self, field):
+        return _join(self.segments(field))
+
+    def columns(self):
+        """Return {'time': [...], field: [...], ...} for the samples in the view."""
+        result = {'time': self.times()}
+        for name in self._buffer.fields:
+            result[name] = self.values(name)
+        return result
+
+    def records(self):
+        """Return the samples as a list of {'time': ..., field: ...} dicts."""
+        columns = self.columns()
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def _join(segments):
+    result = []
+    for segment in segments:
+        result.extend(segment.tolist())
+    return result
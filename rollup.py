@@ -0,0 +1,225 @@
+# rollup.py
+# Multi-resolution rollups for metric series.
+# Raw samples cascade into minute, hour and day tiers. Every tier keeps min, max, mean
+# and count per bucket in its own fixed-size ring buffer, so serving a one-year view
+# costs the same as serving the last thirty seconds.
+
+import threading
+from ring_buffer import RingBuffer
+
+# (tier name, bucket width in seconds, buckets retained in memory)
+TIERS = (
+    ('1m', 60, 24 * 60),        # One day of minutes.
+    ('1h', 3600, 31 * 24),      # A month of hours.
+    ('1d', 86400, 366),         # A year of days.
+)
+ROLLUP_FIELDS = ('min', 'max', 'mean', 'count')
+
+
+class RollupTier:
+    """
+    One resolution of a series: an open accumulator for the current bucket plus
+    a ring buffer of closed buckets.
+    """
+    __slots__ = ('name', 'step', 'buffer', 'bucket', 'min', 'max', 'sum', 'count')
+
+    def __init__(self, name, step, capacity):
+        self.name = name
+        self.step = step
+        self.buffer = RingBuffer(capacity, ROLLUP_FIELDS)
+        self.bucket = None   # Start timestamp of the open bucket.
+        self.min = 0.0
+        self.max = 0.0
+        self.sum = 0.0
+        self.count = 0
+
+    @property
+    def retention(self):
+        """Seconds of history the in-memory buffer covers."""
+        return self.step * self.buffer.capacity
+
+    def add(self, timestamp, minimum, maximum, total, count, seq=None):
+        """
+        Fold a (min, max, sum, count) aggregate into the tier. `seq` tags the closed
+        bucket, if any, in the tier's buffer.
+        Returns the closed bucket as (bucket, min, max, sum, count) when the aggregate
+        starts a new bucket, otherwise None.
+        """
+        bucket = timestamp - (timestamp % self.step)
+        closed = None
+        if self.bucket is not None and bucket != self.bucket:
+            if bucket < self.bucket:
+                # Clock went backwards; fold into the open bucket instead of reordering history.
+                bucket = self.bucket
+            else:
+                closed = (self.bucket, self.min, self.max, self.sum, self.count)
+                self.buffer.append(self.bucket, (self.min, self.max, self.sum / self.count, self.count), seq)
+                self.bucket = None
+        if self.bucket is None:
+            self.bucket = bucket
+            self.min, self.max, self.sum, self.count = minimum, maximum, total, count
+        else:
+            self.min = min(self.min, minimum)
+            self.max = max(self.max, maximum)
+            self.sum += total
+            self.count += count
+        return closed
+
+    def open_state(self):
+        """The open accumulator as (bucket, min, max, sum, count), or None."""
+        if self.bucket is None:
+            return None
+        return (self.bucket, self.min, self.max, self.sum, self.count)
+
+    def restore_open(self, state):
+        """Reinstate an accumulator saved by open_state() (e.g. from a checkpoint)."""
+        if state is None:
+            self.bucket, self.min, self.max, self.sum, self.count = None, 0.0, 0.0, 0.0, 0
+        else:
+            self.bucket, self.min, self.max, self.sum, self.count = state
+
+
+class RollupSeries:
+    """
+    A single metric series cascading raw samples through all tiers.
+    `on_close(series, tier, bucket, min, max, mean, count)` is called for every closed bucket.
+    """
+    def __init__(self, name, tiers=TIERS, on_close=None):
+        self.name = name
+        self.tiers = [RollupTier(tier_name, step, capacity) for tier_name, step, capacity in tiers]
+        self.on_close = on_close
+
+    def add(self, timestamp, value, seq=None):
+        """
+        Feed one raw sample into the finest tier and cascade closed buckets upwards.
+        Buckets closed by this sample are stored under `seq` (the collector tick).
+        """
+        aggregate = (timestamp, value, value, value, 1)
+        for tier in self.tiers:
+            closed = tier.add(*aggregate, seq=seq)
+            if closed is None:
+                break
+            bucket, minimum, maximum, total, count = closed
+            if self.on_close is not None:
+                self.on_close(self.name, tier.name, bucket, minimum, maximum, total / count, count)
+            aggregate = closed
+
+    def tier(self, name):
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise KeyError(name)
+
+    def open_bucket(self, name):
+        """
+        Return (bucket, min, max, mean, count) for the still-open bucket of tier `name`,
+        including samples that have not cascaded up from finer tiers yet.
+        Returns None if the series has no samples.
+        """
+        target = self.tier(name)
+        newest = self.tiers[0].bucket
+        if newest is None:
+            return None
+        bucket = newest - (newest % target.step)
+        minimum, maximum, total, count = None, None, 0.0, 0
+        for tier in self.tiers:
+            if tier.count and tier.bucket - (tier.bucket % target.step) == bucket:
+                minimum = tier.min if minimum is None else min(minimum, tier.min)
+                maximum = tier.max if maximum is None else max(maximum, tier.max)
+                total += tier.sum
+                count += tier.count
+            if tier is target:
+                break
+        if not count:
+            return None
+        return bucket, minimum, maximum, total / count, count
+
+    def restore(self, tier_name, bucket, minimum, maximum, mean, count):
+        """Append a persisted closed bucket (oldest first) to a tier's buffer."""
+        tier = self.tier(tier_name)
+        latest = tier.buffer.latest()
+        if latest is None or bucket > latest[0]:
+            tier.buffer.append(bucket, (minimum, maximum, mean, count))
+            if tier.bucket is not None and bucket >= tier.bucket:
+                # A persisted bucket supersedes an accumulator restored from an older checkpoint.
+                tier.restore_open(None)
+
+
+class RollupEngine:
+    """
+    Registry of rollup series. Any metric can register by name; series are created on
+    first use so per-interface metrics appear automatically.
+    """
+    def __init__(self, tiers=TIERS, on_close=None):
+        self.tier_specs = tuple(tiers)
+        self.on_close = on_close
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def register(self, name):
+        series = self.series.get(name)
+        if series is None:
+            with self.lock:
+                series = self.series.get(name)
+                if series is None:
+                    series = RollupSeries(name, self.tier_specs, self.on_close)
+                    self.series[name] = series
+        return series
+
+    def add(self, name, timestamp, value, seq=None):
+        self.register(name).add(timestamp, value, seq)
+
+    def get(self, name):
+        return self.series.get(name)
+
+    def remove(self, name):
+        """Forget a series (e.g. of a removed interface), including its still-open buckets."""
+        with self.lock:
+            self.series.pop(name, None)
+
+    def names(self):
+        with self.lock:
+            return list(self.series)
+
+    def last_seq(self):
+        """Highest sequence number stored in any tier of any series."""
+        return max([tier.buffer.last_seq for series in list(self.series.values()) for tier in series.tiers] or [0])
+
+    def closed_since(self, seq, until=None):
+        """
+        Return {series: {tier: columns}} for every bucket closed after `seq`
+        (up to `until`), e.g. to send clients only the rollup points they are missing.
+        """
+        result = {}
+        for name, series in list(self.series.items()):
+            for tier in series.tiers:
+                if tier.buffer.last_seq > seq:
+                    view = tier.buffer.since(seq, until)
+                    if len(view):
+                        result.setdefault(name, {})[tier.name] = view.columns()
+        return result
+
+    def points(self, name, tier_name, count, include_open=True):
+        """
+        Return the newest `count` buckets of a tier as parallel lists
+        {'time': [...], 'min': [...], 'max': [...], 'mean': [...], 'count': [...]}.
+        With include_open the still-open bucket is returned as the last point.
+        """
+        series = self.series.get(name)
+        if series is None:
+            return {key: [] for key in ('time',) + ROLLUP_FIELDS}
+        tier = series.tier(tier_name)
+        pending = []
+        if include_open:
+            open_bucket = series.open_bucket(tier_name)
+            if open_bucket is not None:
+                if tier.count and tier.bucket < open_bucket[0]:
+                    # The previous bucket is complete but waits for the next finer bucket to close.
+                    pending.append((tier.bucket, tier.min, tier.max, tier.sum / tier.count, tier.count))
+                pending.append(open_bucket)
+        pending = pending[-count:] if count > 0 else []
+        columns = tier.buffer.window(max(count - len(pending), 0)).columns()
+        for point in pending:
+            for key, value in zip(('time',) + ROLLUP_FIELDS, point):
+                columns[key].append(value)
+        return columns
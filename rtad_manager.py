@@ -1,5 +1,5 @@
 # rtad_manager.py
-# This module handles log parsing, IP geo-information lookup, and updating country info.
+# This module handles log parsing, IP geo-information lookup, and geo-enrichment of new events.
 # It includes features like file offset tracking for efficient log reading,
 # debounced file watching for real-time log parsing, and caching of geo-information.
 
@@ -9,15 +9,17 @@ import logging                        # For logging debug and error messages.
 import threading                      # For multi-threaded operations and locks.
 import time                           # For handling timestamps and delays.
 import requests                       # For HTTP requests (e.g., downloading the GeoLite2 database).
-import geoip2.database                # For accessing GeoIP databases to look up location info.
 import re                             # For regular expression operations.
+import queue                          # For handing new events to the geo enrichment stage.
 import pytz                           # For timezone handling.
 from datetime import datetime         # For working with dates and times.
-from concurrent.futures import ThreadPoolExecutor  # For concurrently processing log files.
+from concurrent.futures import ThreadPoolExecutor  # For concurrent log parsing and geo lookups.
 from watchdog.observers import Observer            # For monitoring file system changes.
 from watchdog.events import FileSystemEventHandler # For handling file system events.
 from threading import Timer           # For debouncing events.
-from collections import deque         # For efficient FIFO queues with fixed max length.
+from collections import Counter, deque  # Event counters, events awaiting a GeoIP database.
+from geo_cache import GeoCache        # Bounded per-network cache of GeoIP results.
+from event_ring import EventRing      # Id-ordered event buffers with cursor reads.
 
 # Global counters for diff-based updates
 login_attempt_counter = 0             # Counter to uniquely identify login attempts.
@@ -26,29 +28,61 @@ http_error_log_counter = 0            # Counter to uniquely identify HTTP error
 # Precompiled regex for proxy events for different log formats.
 # Regex for 'zoraxy' proxy logs
 REGEX_ZORAXY = re.compile(
-    r"\[[^\]]+\]\s+\[[^\]]+\]\s+\[origin:(?P<origin>[^\]]*)\]\s+\[client\s+(?P<ip>\d+\.\d+\.\d+\.\d+)\]\s+(?P<method>[A-Z]+)\s+(?P<url>\S+)\s+(?P<code>\d{3})"
+    r"\[(?P<timestamp>[^\]]+)\]\s+\[[^\]]+\]\s+\[origin:(?P<origin>[^\]]*)\]\s+\[client\s+(?P<ip>\d+\.\d+\.\d+\.\d+)\]\s+(?P<method>[A-Z]+)\s+(?P<url>\S+)\s+(?P<code>\d{3})"
 )
 # Regex for 'npm' proxy logs
 REGEX_NPM = re.compile(
     r'^\[(?P<timestamp>[^\]]+)\]\s+(?P<code>\d{3})\s+-\s+(?P<method>[A-Z]+|-)\s+(?P<protocol>\S+)\s+(?P<host>\S+)\s+"(?P<url>[^"]+)"\s+\[Client\s+(?P<ip>\d{1,3}(?:\.\d{1,3}){3})\]'
 )
 
-# Instead of normal lists, use deques to maintain a stable FIFO queue with a maximum length.
+# Fixed-capacity rings keep the newest events in id order; pollers read them by cursor.
+# An event is appended once the enrichment stage has resolved its location, so cursor
+# readers never see (and keep) it as "Unknown".
 # Caches for login attempts and HTTP error logs (max 1000 entries each).
-login_attempts_cache = deque(maxlen=1000)
-http_error_logs_cache = deque(maxlen=1000)
+login_attempts_cache = EventRing(1000)
+http_error_logs_cache = EventRing(1000)
 
 # Locks to protect concurrent writes to shared resources.
 login_attempts_lock = threading.Lock()
 http_error_logs_lock = threading.Lock()
 
-# Global cache for IP geo-information with a Time-To-Live (TTL) mechanism.
-ip_country_cache = {}
-ip_country_cache_lock = threading.Lock()
+# New events, as (type, event dict), waiting to be geo-resolved by enrichment_job.
+# Each event is queued in id order when it is stored, and queued again if it was
+# resolved while no GeoIP database was loaded (see unlocated_events).
+enrichment_queue = queue.Queue()
+ENRICH_BATCH_SIZE = 256               # Events resolved per batch.
+ENRICH_WORKERS = 4                    # Concurrent GeoIP lookups per batch.
+# Callable(type, events) receiving each enriched batch for durable storage;
+# app.py wires it to attack_store.store.
+event_sink = None
+# Callable(type, events) receiving stored events whose location was resolved later;
+# app.py wires it to attack_store.relocate.
+location_sink = None
+
+# Events resolved while no GeoIP database was loaded; queued again once one is.
+unlocated_events = deque(maxlen=2000)
+# Bumped whenever already published events got their location; served to the live views
+# as X-Feed-Revision so that they reload what they have.
+location_revision = 0
+
+# Monotonic event counters keyed by (type, code, country) for the /metrics exposition.
+# An event is counted once, when the enrichment stage has resolved its location; the
+# counted_* watermarks hold the highest entry id already counted per cache.
+event_counters = Counter()
+event_counters_lock = threading.Lock()
+counted_login_attempt_id = 0
+counted_http_error_log_id = 0
 
 # Path to the local GeoLite2-City database.
 GEOIP_DB_PATH = '/usr/share/GeoIP/GeoLite2-City.mmdb'
 
+# Shared memory-mapped GeoIP reader, replaced as a whole when the database file changes.
+geoip_reader = None
+geoip_reader_stamp = None       # (inode, mtime, size) of the file geoip_reader was opened from
+geoip_reader_checked = 0.0      # last time the file was checked for changes
+geoip_reader_lock = threading.Lock()
+GEOIP_RELOAD_INTERVAL = 60      # seconds between checks for a changed database file
+
 # Load configuration from config.yml.
 with open('config.yml', 'r') as f:
     config = yaml.safe_load(f)
@@ -116,6 +150,23 @@ def normalize_timestamp(ts=None):
         raise TypeError(f"Invalid type for timestamp: {type(ts)}")
     return dt.isoformat()
 
+# Time formats of the proxy logs: npm ("10/May/2024:15:32:11 +0000") and zoraxy
+# ("2024-05-10 15:32:11.123456", local time).
+LOG_TIME_FORMATS = ("%d/%b/%Y:%H:%M:%S %z", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S")
+
+def parse_log_timestamp(text):
+    """
+    The datetime of a proxy log line's timestamp field, or None if it is not in a known
+    format (the event is then stamped with the time it was parsed).
+    """
+    for fmt in LOG_TIME_FORMATS:
+        try:
+            return datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            continue
+    logging.debug("Unknown log timestamp format: %s", text)
+    return None
+
 def get_formatted_timestamp(ts=None):
     """
     Return the ISO-formatted timestamp.
@@ -149,8 +200,12 @@ def download_geolite2_country_db(db_path):
     try:
         response = requests.get(url, timeout=30)
         response.raise_for_status()
-        with open(db_path, "wb") as f:
+        # Write a new file and rename it into place: the open reader maps the old file,
+        # which must not be truncated underneath it.
+        tmp_path = db_path + ".tmp"
+        with open(tmp_path, "wb") as f:
             f.write(response.content)
+        os.replace(tmp_path, db_path)
         logging.info("GeoLite2-City database downloaded to %s", db_path)
     except Exception as e:
         logging.error("Error downloading GeoLite2-City database: %s", e)
@@ -175,62 +230,103 @@ def ensure_geolite2_db(db_path, max_age_seconds=86400):
         logging.info("GeoLite2 database not found; downloading.")
     download_geolite2_country_db(db_path)
 
-def get_geo_info_from_db(ip):
+def geolite2_refresh_job(interval=3600):
+    """
+    Background job keeping the GeoLite2 database current. Lookups never download
+    the database themselves, so neither startup nor enrichment waits on the network.
+    In between downloads the file is checked for outside updates and reloaded.
+    """
+    last_download_check = 0
+    while True:
+        if time.time() - last_download_check >= interval:
+            ensure_geolite2_db(GEOIP_DB_PATH)
+            last_download_check = time.time()
+        reload_geoip_reader()
+        time.sleep(GEOIP_RELOAD_INTERVAL)
+
+def reload_geoip_reader(db_path=GEOIP_DB_PATH):
+    """
+    (Re)open the shared GeoIP reader if the database file changed since it was opened.
+    The new reader replaces the old one in a single assignment; lookups still running
+    on the old reader finish with it, and it is closed once no longer referenced.
+    """
+    global geoip_reader, geoip_reader_stamp, geoip_reader_checked
+    import geoip2.database  # Deferred: only the geo enrichment thread needs it.
+    with geoip_reader_lock:
+        geoip_reader_checked = time.time()
+        try:
+            st = os.stat(db_path)
+        except OSError:
+            return geoip_reader
+        stamp = (st.st_ino, st.st_mtime, st.st_size)
+        if stamp == geoip_reader_stamp:
+            return geoip_reader
+        try:
+            reader = geoip2.database.Reader(db_path, mode=geoip2.database.MODE_MMAP)
+        except Exception as e:
+            logging.error("Error opening GeoIP database %s: %s", db_path, e)
+            return geoip_reader
+        geoip_reader, geoip_reader_stamp = reader, stamp
+        geo_cache.clear()
+        logging.info("Loaded GeoIP database %s (built %s)", db_path, reader.metadata().build_epoch)
+    requeue_unlocated_events()
+    return reader
+
+def requeue_unlocated_events():
+    """Queue the events resolved without a GeoIP database again, once one is loaded."""
+    while geoip_reader is not None:
+        try:
+            enrichment_queue.put(unlocated_events.popleft())
+        except IndexError:
+            break
+
+def get_geoip_reader():
+    """The shared GeoIP reader, opened on first use; None while no database is available."""
+    reader = geoip_reader
+    if reader is None and time.time() - geoip_reader_checked >= GEOIP_RELOAD_INTERVAL:
+        reader = reload_geoip_reader()
+    return reader
+
+UNKNOWN_GEO_INFO = {"country": "Unknown", "city": "Unknown", "lat": None, "lon": None}
+
+def lookup_geo_info(ip):
     """
     Perform a GeoIP lookup for the given IP address using the local GeoLite2 database.
-    Returns a dictionary with country, city, latitude, and longitude.
+    Returns (info, network, found): info is a dictionary with country, city, latitude
+    and longitude, network the database block it applies to (or None).
     """
+    from geoip2.errors import AddressNotFoundError
     ip = ip.strip()
-    ensure_geolite2_db(GEOIP_DB_PATH)
+    reader = get_geoip_reader()
+    if reader is None:
+        return dict(UNKNOWN_GEO_INFO), None, False
     try:
-        with geoip2.database.Reader(GEOIP_DB_PATH) as reader:
-            response = reader.city(ip)
-            country = response.country.iso_code if response and response.country.iso_code else "Unknown"
-            city = response.city.name if response and response.city.name else "Unknown"
-            latitude = response.location.latitude if response and response.location.latitude else None
-            longitude = response.location.longitude if response and response.location.longitude else None
-            return {"country": country, "city": city, "lat": latitude, "lon": longitude}
+        response = reader.city(ip)
+        country = response.country.iso_code if response and response.country.iso_code else "Unknown"
+        city = response.city.name if response and response.city.name else "Unknown"
+        latitude = response.location.latitude if response and response.location.latitude else None
+        longitude = response.location.longitude if response and response.location.longitude else None
+        return {"country": country, "city": city, "lat": latitude, "lon": longitude}, response.traits.network, True
+    except AddressNotFoundError as e:
+        # Private and unallocated ranges: not an error, and the whole block is absent.
+        return dict(UNKNOWN_GEO_INFO), e.network, False
     except Exception as e:
         logging.error("Error during GeoIP lookup for IP %s: %s", ip, e)
-        return {"country": "Unknown", "city": "Unknown", "lat": None, "lon": None}
+        return dict(UNKNOWN_GEO_INFO), None, False
 
-def get_geo_info_cached(ip, ttl=3600):
+def get_geo_info_from_db(ip):
+    """Uncached GeoIP lookup; returns a dictionary with country, city, latitude, and longitude."""
+    return lookup_geo_info(ip)[0]
+
+# Bounded cache of geo-information per GeoIP network block; failures expire after a minute.
+geo_cache = GeoCache(lookup_geo_info, max_entries=4096, ttl=3600, max_failures=1024, failure_ttl=60)
+
+def get_geo_info_cached(ip):
     """
     Retrieve cached geo-information for the given IP address.
     If the cache is stale or not present, perform a lookup and update the cache.
     """
-    ip = ip.strip()
-    unknown_ttl = 60  # Short TTL for unknown values.
-    with ip_country_cache_lock:
-        if ip in ip_country_cache:
-            entry = ip_country_cache[ip]
-            if entry["country"] != "Unknown" and entry["city"] != "Unknown":
-                if (time.time() - entry["timestamp"]) < ttl:
-                    return {
-                        "country": entry["country"],
-                        "city": entry["city"],
-                        "lat": entry.get("lat"),
-                        "lon": entry.get("lon"),
-                    }
-            else:
-                if (time.time() - entry["timestamp"]) < unknown_ttl:
-                    return {
-                        "country": entry["country"],
-                        "city": entry["city"],
-                        "lat": entry.get("lat"),
-                        "lon": entry.get("lon"),
-                    }
-    # Perform fresh lookup if cache is missing or stale.
-    info = get_geo_info_from_db(ip)
-    with ip_country_cache_lock:
-        ip_country_cache[ip] = {
-            "country": info["country"],
-            "city": info["city"],
-            "lat": info["lat"],
-            "lon": info["lon"],
-            "timestamp": time.time(),
-        }
-    return info
+    return geo_cache.get(ip)
 
 ##################################
 # Country-Centroid Fallback Logic
@@ -275,11 +371,22 @@ class FileOffsetTracker:
     """
     Tracks file offsets to ensure only new log lines are processed.
     If a file is rotated or truncated, the offset is reset to 0.
+    Offsets survive restarts through restore() and the `persist` hook.
     """
     def __init__(self):
         # Dictionary mapping file_path -> (inode, offset)
         self.file_offsets = {}
         self.lock = threading.Lock()
+        # Callable(path, inode, offset) storing every changed offset;
+        # app.py wires it to attack_store.save_offset.
+        self.persist = None
+
+    def restore(self, offsets):
+        """
+        Start from stored {file_path: (inode, offset)}, e.g. those of the previous leader.
+        """
+        with self.lock:
+            self.file_offsets.update(offsets)
 
     def get_offset(self, path):
         """
@@ -293,7 +400,14 @@ class FileOffsetTracker:
         Update the stored inode and offset for a file.
         """
         with self.lock:
+            if self.file_offsets.get(path) == (inode, offset):
+                return
             self.file_offsets[path] = (inode, offset)
+        if self.persist is not None:
+            try:
+                self.persist(path, inode, offset)
+            except Exception as e:
+                logging.error("Error storing the offset of %s: %s", path, e)
 
     def reset_offset(self, path):
         """
@@ -402,6 +516,7 @@ class LogParser:
                 url = match.group("url")
                 error_code = int(match.group("code"))
                 domain = match.group("origin")
+                timestamp = parse_log_timestamp(match.group("timestamp"))
             else:
                 logging.debug("No match in zoraxy HTTP error log for line: %s", line)
                 return
@@ -412,6 +527,7 @@ class LogParser:
                 url = match.group("url")
                 error_code = int(match.group("code"))
                 domain = match.group("host") if "host" in match.groupdict() else None
+                timestamp = parse_log_timestamp(match.group("timestamp"))
             else:
                 logging.debug("No match in npm HTTP error log for line: %s", line)
                 return
@@ -420,7 +536,7 @@ class LogParser:
         if parse_all or error_code >= 400:
             logging.debug("HTTP error log detected: IP %s, Domain %s, URL %s, Code %s, Proxy %s",
                           ip_address, domain, url, error_code, proxy_type)
-            self.store_http_error_log(proxy_type, error_code, url, ip_address, domain)
+            self.store_http_error_log(proxy_type, error_code, url, ip_address, domain, timestamp=timestamp)
         else:
             logging.debug("Line does not meet criteria (code < 400 and parse_all_logs is false): %s", line)
 
@@ -476,14 +592,14 @@ class LogParser:
 
     def store_failed_login(self, user, ip_address, host, timestamp=None):
         """
-        Store a failed login attempt in the login_attempts_cache.
-        This function updates a global counter and uses a lock for thread-safety.
+        Number a failed login attempt and queue it for enrichment, which adds it to the
+        login_attempts_cache. This function updates a global counter and uses a lock for thread-safety.
         """
         global login_attempt_counter
         ts = normalize_timestamp(timestamp)
         with login_attempts_lock:
             login_attempt_counter += 1
-            login_attempts_cache.append({
+            event = {
                 "id": login_attempt_counter,
                 "user": user,
                 "ip_address": ip_address,
@@ -493,20 +609,21 @@ class LogParser:
                 "city": "Unknown",
                 "lat": None,
                 "lon": None
-            })
+            }
+            enrichment_queue.put(("login_attempt", event))
         logging.debug("Stored failed login attempt (ID %s): User %s, IP %s, Host %s, Timestamp: %s",
                       login_attempt_counter, user, ip_address, host, ts)
 
     def store_http_error_log(self, proxy_type, error_code, url, ip_address, domain, timestamp=None):
         """
-        Store an HTTP error log in the http_error_logs_cache.
-        Updates a global counter and uses a lock for thread-safety.
+        Number an HTTP error log and queue it for enrichment, which adds it to the
+        http_error_logs_cache. Updates a global counter and uses a lock for thread-safety.
         """
         global http_error_log_counter
         ts = normalize_timestamp(timestamp)
         with http_error_logs_lock:
             http_error_log_counter += 1
-            http_error_logs_cache.append({
+            event = {
                 "id": http_error_log_counter,
                 "proxy_type": proxy_type,
                 "error_code": error_code,
@@ -518,7 +635,8 @@ class LogParser:
                 "city": "Unknown",
                 "lat": None,
                 "lon": None
-            })
+            }
+            enrichment_queue.put(("http_error", event))
         logging.debug("Stored HTTP error log (ID %s): Proxy %s, Code %s, URL %s, IP %s, Domain %s, Timestamp: %s",
                       http_error_log_counter, proxy_type, error_code, url, ip_address, domain, ts)
 
@@ -573,47 +691,155 @@ def fetch_http_error_logs():
     with http_error_logs_lock:
         return list(http_error_logs_cache)
 
-########################
-# Country Info Updater
-########################
-def update_missing_country_info():
+def read_login_attempts(after=None, limit=None):
     """
-    For each login attempt or HTTP error log,
-    retrieve city-level latitude/longitude from the GeoIP DB.
-    If missing, fallback to the country's centroid.
+    Login attempts with an id greater than `after` (see event_ring.EventRing.read).
     """
     with login_attempts_lock:
-        for attempt in login_attempts_cache:
-            ip = attempt["ip_address"].strip()
-            info = get_geo_info_cached(ip)
-            if info["lat"] is None or info["lon"] is None:
-                # Fallback to country centroid if detailed location info is missing.
-                lat, lon = get_country_centroid(info["country"])
-                info["lat"] = lat
-                info["lon"] = lon
-            attempt["country"] = info["country"]
-            attempt["city"] = info["city"]
-            attempt["lat"] = info["lat"]
-            attempt["lon"] = info["lon"]
+        return login_attempts_cache.read(after, limit)
 
+def read_http_error_logs(after=None, limit=None):
+    """
+    HTTP error logs with an id greater than `after` (see event_ring.EventRing.read).
+    """
     with http_error_logs_lock:
-        for log in http_error_logs_cache:
-            ip = log["ip_address"].strip()
-            info = get_geo_info_cached(ip)
-            if info["lat"] is None or info["lon"] is None:
-                # Fallback to country centroid if detailed location info is missing.
-                lat, lon = get_country_centroid(info["country"])
-                info["lat"] = lat
-                info["lon"] = lon
-            log["country"] = info["country"]
-            log["city"] = info["city"]
-            log["lat"] = info["lat"]
-            log["lon"] = info["lon"]
-
-def update_country_info_job():
-    """
-    Background job that continuously updates missing country information every 10 seconds.
+        return http_error_logs_cache.read(after, limit)
+
+def restore_events(kind, entries):
+    """
+    Refill an empty cache at startup with stored events (attack_store rows, oldest first),
+    as the logs they came from are not parsed again. They get new ids and count as
+    already published. Returns the number of events restored.
+    """
+    global login_attempt_counter, http_error_log_counter, counted_login_attempt_id, counted_http_error_log_id
+    login = kind == "login_attempt"
+    cache, lock = (login_attempts_cache, login_attempts_lock) if login else (http_error_logs_cache, http_error_logs_lock)
+    with lock:
+        if len(cache):
+            return 0
+        last_id = login_attempt_counter if login else http_error_log_counter
+        for entry in entries:
+            last_id += 1
+            event = {"id": last_id, "ip_address": entry["ip_address"],
+                     "timestamp": normalize_timestamp(entry["timestamp"]),
+                     "country": entry["country"], "city": entry["city"], "lat": entry["lat"], "lon": entry["lon"]}
+            if login:
+                event.update(user=entry["user"], failure_reason=entry["failure_reason"])
+            else:
+                code = entry["error_code"]
+                event.update(proxy_type=None, error_code=int(code) if code and code.isdigit() else code,
+                             url=entry["url"], domain=entry["domain"])
+            cache.append(event)
+        if login:
+            login_attempt_counter = counted_login_attempt_id = last_id
+        else:
+            http_error_log_counter = counted_http_error_log_id = last_id
+    return len(entries)
+
+def fetch_event_counters():
     """
-    while True:
-        update_missing_country_info()
-        time.sleep(10)
+    Return a copy of the event counters: {(type, code, country): count}.
+    """
+    with event_counters_lock:
+        return dict(event_counters)
+
+def feed_version():
+    """
+    Changes whenever an event is published (resolved and counted) or relocated;
+    used to republish the feeds only when they changed.
+    """
+    return counted_login_attempt_id, counted_http_error_log_id, location_revision
+
+########################
+# Geo Enrichment Stage
+########################
+def resolve_location(ip):
+    """
+    City-level geo-information for `ip` from the cached GeoIP lookup.
+    If latitude/longitude are missing, fall back to the country's centroid.
+    """
+    info = get_geo_info_cached(ip)
+    if info["lat"] is None or info["lon"] is None:
+        info["lat"], info["lon"] = get_country_centroid(info["country"])
+    return info
+
+def call_sink(sink, kind, events):
+    """Hand events to a storage hook; a failing store must not stop the live views."""
+    if sink is None:
+        return
+    try:
+        sink(kind, events)
+    except Exception as e:
+        logging.error("Error storing %s events: %s", kind, e)
+
+def enrich_events(batch, executor=None):
+    """
+    Resolve the location of a batch of (type, event) pairs, then publish new events to
+    their cache and count them. Each distinct IP is looked up once, outside the cache
+    locks (concurrently when an executor is given); the locks are held only to fill in
+    the resolved fields and append. Events already published, queued again after a
+    GeoIP database was loaded, only get their location updated.
+    """
+    global counted_login_attempt_id, counted_http_error_log_id, location_revision
+    located = get_geoip_reader() is not None
+    ips = list({event["ip_address"].strip() for _, event in batch})
+    lookup = executor.map if executor is not None else map
+    locations = dict(zip(ips, lookup(resolve_location, ips)))
+
+    counts = Counter()
+    caches = (("login_attempt", login_attempts_cache, login_attempts_lock),
+              ("http_error", http_error_logs_cache, http_error_logs_lock))
+    for kind, cache, lock in caches:
+        counted = counted_login_attempt_id if kind == "login_attempt" else counted_http_error_log_id
+        events = [event for event_kind, event in batch if event_kind == kind and event["id"] > counted]
+        relocated = [event for event_kind, event in batch if event_kind == kind and event["id"] <= counted]
+        with lock:
+            for event in events + relocated:
+                info = locations[event["ip_address"].strip()]
+                event["country"] = info["country"]
+                event["city"] = info["city"]
+                event["lat"] = info["lat"]
+                event["lon"] = info["lon"]
+            # Events are queued in id order, so they are appended in id order.
+            for event in events:
+                cache.append(event)
+        if not located:
+            unlocated_events.extend((kind, event) for event in events + relocated)
+        if relocated:
+            call_sink(location_sink, kind, relocated)
+            location_revision += 1
+        if not events:
+            continue
+        for event in events:
+            code = str(event["error_code"]) if kind == "http_error" else ""
+            counts[(kind, code, event["country"])] += 1
+        call_sink(event_sink, kind, events)
+        if kind == "login_attempt":
+            counted_login_attempt_id = events[-1]["id"]
+        else:
+            counted_http_error_log_id = events[-1]["id"]
+
+    if counts:
+        with event_counters_lock:
+            event_counters.update(counts)
+    if not located:
+        # A database loaded during this batch has already drained unlocated_events.
+        requeue_unlocated_events()
+
+def enrichment_job(batch_size=ENRICH_BATCH_SIZE, workers=ENRICH_WORKERS):
+    """
+    Background job resolving new events as they arrive: waits for the next event,
+    then takes whatever else is queued (up to batch_size) and enriches it as one batch.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geo") as executor:
+        while True:
+            batch = [enrichment_queue.get()]
+            while len(batch) < batch_size:
+                try:
+                    batch.append(enrichment_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                enrich_events(batch, executor)
+            except Exception as e:
+                logging.error("Error enriching RTAD events: %s", e)
@@ -0,0 +1,105 @@
+# scheduler.py
+# Drift-free periodic scheduling on the monotonic clock.
+# Every job runs on a fixed grid (start + k * interval), so collection time never
+# stretches the period, wall-clock jumps do not disturb it and samples stay evenly
+# spaced for rate calculations. Each job records how often it ran, how many grid
+# slots it missed and how long it took.
+
+import time
+import logging
+
+
+class Job:
+    __slots__ = ('name', 'interval', 'func', 'next_run', 'runs', 'missed', 'errors',
+                 'last_run', 'last_duration', 'max_duration', 'total_duration')
+
+    def __init__(self, name, interval, func, next_run):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = next_run
+        self.runs = 0
+        self.missed = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+
+    def get_stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'missed': self.missed,
+            'errors': self.errors,
+            'last_duration': self.last_duration,
+            'max_duration': self.max_duration,
+            'avg_duration': (self.total_duration / self.runs) if self.runs else 0.0,
+        }
+
+
+class Scheduler:
+    """
+    Runs jobs at their own intervals on a shared monotonic grid. Jobs whose grid points
+    coincide are returned together by wait(), so callers can process them as one tick.
+    A job that falls behind runs once as soon as possible and then resumes on its
+    original grid; the slots it skipped are counted in `missed` rather than replayed.
+    """
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.jobs = []
+        self.start = None   # Grid origin, fixed by the first call to due().
+
+    def add(self, name, interval, func):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        job = Job(name, interval, func, self.start)
+        self.jobs.append(job)
+        return job
+
+    def due(self, now=None):
+        """Return the jobs due at `now` and advance each to its next grid point."""
+        now = self.clock() if now is None else now
+        if self.start is None:
+            self.start = now
+        ready = []
+        for job in self.jobs:
+            if job.next_run is None:
+                job.next_run = self.start
+            if now >= job.next_run:
+                behind = int((now - job.next_run) // job.interval)
+                job.missed += behind
+                job.next_run += (behind + 1) * job.interval
+                ready.append(job)
+        return ready
+
+    def wait(self):
+        """Sleep until at least one job is due and return all due jobs."""
+        while True:
+            now = self.clock()
+            ready = self.due(now)
+            if ready:
+                return ready
+            if not self.jobs:
+                raise RuntimeError("No jobs scheduled")
+            self.sleep(max(min(job.next_run for job in self.jobs) - now, 0.0))
+
+    def execute(self, job, *args):
+        """Run `job` with `args`, timing it. Errors are logged so other jobs of the tick still run."""
+        started = self.clock()
+        try:
+            return job.func(*args)
+        except Exception as e:
+            job.errors += 1
+            logging.error("Error in job %s: %s", job.name, e)
+        finally:
+            duration = self.clock() - started
+            job.runs += 1
+            job.last_run = started
+            job.last_duration = duration
+            job.max_duration = max(job.max_duration, duration)
+            job.total_duration += duration
+
+    def get_stats(self):
+        return {job.name: job.get_stats() for job in self.jobs}
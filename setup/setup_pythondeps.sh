@@ -2,4 +2,4 @@
 set -e
 
 # Install all required Python packages
-pip install Flask PyYAML requests docker flask-sqlalchemy flask-security psutil sqlalchemy geoip2 pytz watchdog utmp flask-assets libsass
+pip install Flask PyYAML requests docker flask-sqlalchemy flask-security psutil sqlalchemy geoip2 pytz watchdog utmp flask-assets libsass uvicorn asgiref
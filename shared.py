@@ -0,0 +1,325 @@
+# shared.py
+# Multi-worker support.
+# With several web workers, exactly one of them (the leader, elected with a file lock)
+# runs the collectors, log parsers and Docker updaters. After every tick it publishes the
+# encoded snapshot, the tick's delta, the /metrics text, status counters and the RTAD
+# feeds into memory-mapped channel files. The other workers (followers) only read those
+# channels and serve them, so request throughput scales with workers while collection
+# runs once. When the leader exits, a follower takes the lock over and becomes leader.
+# Channel files live in SHARED_DIR (tmpfs); the first worker to start and the last one
+# to exit remove whatever an earlier run left there.
+
+import os
+import json
+import atexit
+import mmap
+import time
+import zlib
+import fcntl
+import struct
+import logging
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from stats import merge_deltas
+from snapshot import Snapshot, BOOT_ID, etag_for
+from stream import encode_raw
+
+# Number of gunicorn workers (exported by start.sh); channels are only used with more than one.
+WORKERS = int(os.environ.get('WORKERS', '1') or 1)
+ENABLED = WORKERS > 1
+SHARED_DIR = os.environ.get('SHARED_DIR') or os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'simplehostmetrics')
+FEED_POLL_INTERVAL = 0.1   # seconds between follower checks for a new tick
+DELTA_WINDOW = 10          # recent tick deltas published, so followers can serve older cursors
+WORKERS_LOCK = 'workers.lock'
+
+# Channel header: seqlock counter, tag (e.g. tick seq), body length, crc32 of the body.
+HEADER = struct.Struct('<QQQI')
+
+
+def channel_path(name):
+    return os.path.join(SHARED_DIR, name)
+
+
+_workers_file = None
+
+
+def remove_channels():
+    """Delete every file in SHARED_DIR but the workers lock. Only with no other worker running."""
+    for name in os.listdir(SHARED_DIR):
+        if name != WORKERS_LOCK:
+            try:
+                os.unlink(channel_path(name))
+            except OSError as e:
+                logging.error("Could not remove stale channel %s: %s", name, e)
+
+
+def _remove_if_alone():
+    try:
+        fcntl.flock(_workers_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return
+    remove_channels()
+
+
+def join_workers():
+    """
+    Register this process as a worker for the whole process lifetime with a shared lock
+    on the workers lock. A worker that finds no other one running (it gets the lock
+    exclusively) first removes the channels of an earlier run; leave_workers does the same
+    for the last worker to exit.
+    """
+    global _workers_file
+    if _workers_file is not None:
+        return
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    _workers_file = open(channel_path(WORKERS_LOCK), 'a')
+    _remove_if_alone()
+    fcntl.flock(_workers_file, fcntl.LOCK_SH)
+    atexit.register(leave_workers)
+
+
+def leave_workers():
+    global _workers_file
+    if _workers_file is None:
+        return
+    fcntl.flock(_workers_file, fcntl.LOCK_UN)
+    _remove_if_alone()
+    _workers_file.close()
+    _workers_file = None
+
+
+def touch(name):
+    """Mark SHARED_DIR/<name> as changed, e.g. to invalidate caches in every worker."""
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    path = channel_path(name)
+    with open(path, 'a'):
+        os.utime(path)
+
+
+def stamp(name):
+    """Modification time (ns) of SHARED_DIR/<name>; 0 before the first touch()."""
+    try:
+        return os.stat(channel_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def file_lock(name):
+    """
+    Hold an exclusive lock on SHARED_DIR/<name> for the duration of the block,
+    serializing e.g. schema setup across workers. A no-op with a single worker.
+    """
+    if not ENABLED:
+        yield
+        return
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    with open(channel_path(name), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Channel:
+    """
+    Single-writer, many-reader byte channel in a memory-mapped file.
+    The writer bumps the header counter to odd before and to even after writing the body;
+    readers retry while it is odd or changed during the read, and verify the body's crc32,
+    so a torn read is never returned. The file grows when a body does not fit.
+    """
+    def __init__(self, name, size=1 << 20):
+        os.makedirs(SHARED_DIR, exist_ok=True)
+        self.path = channel_path(name)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < HEADER.size + size:
+            os.ftruncate(self.fd, HEADER.size + size)
+        self.map = mmap.mmap(self.fd, 0)
+        self.lock = threading.Lock()
+        self._cached = (None, None)   # (counter, (tag, body)) of the last successful read
+
+    def _remap(self):
+        size = os.fstat(self.fd).st_size
+        if size != len(self.map):
+            self.map.close()
+            self.map = mmap.mmap(self.fd, 0)
+
+    def write(self, tag, body):
+        with self.lock:
+            needed = HEADER.size + len(body)
+            if needed > len(self.map):
+                os.ftruncate(self.fd, max(needed, 2 * len(self.map)))
+                self._remap()
+            counter = HEADER.unpack_from(self.map)[0]
+            counter += 1 if counter % 2 == 0 else 2   # odd: write in progress
+            HEADER.pack_into(self.map, 0, counter, 0, 0, 0)
+            self.map[HEADER.size:needed] = body
+            HEADER.pack_into(self.map, 0, counter + 1, tag, len(body), zlib.crc32(body))
+
+    def read(self, retries=50):
+        """Return (tag, body) of the last complete write, or (None, None) if never written."""
+        with self.lock:
+            for _ in range(retries):
+                counter = HEADER.unpack_from(self.map)[0]
+                if counter == 0:
+                    return None, None
+                if counter == self._cached[0]:
+                    return self._cached[1]
+                if counter % 2:
+                    time.sleep(0.001)
+                    continue
+                _, tag, length, crc = HEADER.unpack_from(self.map)
+                if HEADER.size + length > len(self.map):
+                    self._remap()
+                body = self.map[HEADER.size:HEADER.size + length]
+                if HEADER.unpack_from(self.map)[0] == counter and zlib.crc32(body) == crc:
+                    self._cached = (counter, (tag, body))
+                    return tag, body
+            return self._cached[1] or (None, None)
+
+
+class Leadership:
+    """
+    Leader election with an flock()ed file. try_acquire() returns immediately;
+    wait() blocks until the current leader's process exits and the lock is free.
+    """
+    def __init__(self, name='leader.lock'):
+        os.makedirs(SHARED_DIR, exist_ok=True)
+        self.file = open(channel_path(name), 'a')
+
+    def try_acquire(self):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def wait(self):
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+
+class Publisher:
+    """Leader side: writes the per-tick outputs into the channels."""
+    def __init__(self):
+        self.snapshot = Channel('snapshot')
+        self.delta = Channel('delta')
+        self.metrics = Channel('metrics')
+        self.status = Channel('status', 1 << 16)
+        self.rtad = Channel('rtad')
+        self._rtad_version = None
+        self._deltas = deque(maxlen=DELTA_WINDOW)   # (seq, encoded delta), consecutive ticks
+        # ETags must change with the leader, since a new leader restarts tick numbering.
+        Channel('boot', 64).write(0, BOOT_ID.encode('ascii'))
+
+    def publish_tick(self, seq, snapshot_body, delta, metrics_body, status):
+        self.snapshot.write(seq, snapshot_body)
+        if delta is not None:
+            if self._deltas and self._deltas[-1][0] != delta['since']:
+                self._deltas.clear()      # a gap: older cursors can no longer be chained
+            self._deltas.append((delta['seq'], json.dumps(delta, separators=(',', ':')).encode('utf-8')))
+            self.delta.write(seq, b'[' + b','.join(body for _, body in self._deltas) + b']')
+        self.metrics.write(seq, metrics_body)
+        self.status.write(seq, json.dumps(status, separators=(',', ':')).encode('utf-8'))
+
+    def publish_rtad(self, version, fetch):
+        """Publish the RTAD feeds when `version` changed; `fetch()` returns the payload dict."""
+        if version != self._rtad_version:
+            self._rtad_version = version
+            self.rtad.write(0, json.dumps(fetch(), separators=(',', ':')).encode('utf-8'))
+
+
+class Feed:
+    """Follower side: decoded, memoized views of the channels."""
+    def __init__(self):
+        self.snapshot_channel = Channel('snapshot')
+        self.delta_channel = Channel('delta')
+        self.metrics_channel = Channel('metrics')
+        self.status_channel = Channel('status', 1 << 16)
+        self.rtad_channel = Channel('rtad')
+        self.boot_channel = Channel('boot', 64)
+        self._snapshot = None
+        self._decoded = {}   # channel name -> (body, decoded)
+        self._merged = (None, {})   # (delta channel body, {since: encoded delta})
+
+    def version(self):
+        return self.snapshot_channel.read()[0] or 0
+
+    def etag(self, version):
+        boot_id = self.boot_channel.read()[1]
+        return etag_for(version, boot_id.decode('ascii') if boot_id else 'none')
+
+    def snapshot(self):
+        tag, body = self.snapshot_channel.read()
+        tag = tag or 0
+        if self._snapshot is None or self._snapshot.version != tag or self._snapshot.body is not body:
+            self._snapshot = Snapshot(tag, body or b'{}', self.etag(tag))
+        return self._snapshot
+
+    def delta(self, since):
+        """
+        Encoded delta for cursor `since`, merged from the leader's recent tick deltas;
+        None when `since` is outside that window and the client needs the snapshot.
+        """
+        tag, body = self.delta_channel.read()
+        if body is None:
+            return None
+        cached_body, merged = self._merged
+        if cached_body is not body:
+            merged = {}
+            self._merged = (body, merged)
+        if since not in merged:
+            merged[since] = self._merge_since(self._decode('delta', body), since)
+        return merged[since]
+
+    @staticmethod
+    def _merge_since(deltas, since):
+        for i, delta in enumerate(deltas):
+            if delta['since'] == since:
+                chain = deltas[i:]
+                delta = chain[0] if len(chain) == 1 else merge_deltas(chain)
+                return json.dumps(delta, separators=(',', ':')).encode('utf-8')
+        if deltas and deltas[-1]['seq'] == since:
+            # Already up to date with the last tick: nothing to add.
+            empty = {'seq': since, 'since': since, 'delta': True, 'system': {}, 'samples': {}}
+            return json.dumps(empty, separators=(',', ':')).encode('utf-8')
+        return None
+
+    def metrics(self):
+        return self.metrics_channel.read()[1] or b''
+
+    def status(self):
+        body = self.status_channel.read()[1]
+        return self._decode('status', body) if body else {}
+
+    def rtad(self):
+        body = self.rtad_channel.read()[1]
+        return self._decode('rtad', body) if body else {}
+
+    def _decode(self, name, body):
+        cached = self._decoded.get(name)
+        if cached is None or cached[0] is not body:
+            cached = (body, json.loads(body))
+            self._decoded[name] = cached
+        return cached[1]
+
+    def run(self, broadcaster, stop):
+        """Forward the deltas of new ticks to local SSE subscribers until `stop` is set."""
+        last = self.delta_channel.read()[0]
+        while not stop.is_set():
+            try:
+                tag = self.delta_channel.read()[0]
+                if tag is not None and tag != last:
+                    if len(broadcaster):
+                        body = self.delta(last) if last is not None else None
+                        if body is not None:
+                            broadcaster.publish(encode_raw('delta', body))
+                        else:
+                            broadcaster.resync()
+                    last = tag
+            except Exception as e:
+                logging.error("Error reading shared stats feed: %s", e)
+            stop.wait(FEED_POLL_INTERVAL)
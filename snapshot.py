@@ -0,0 +1,79 @@
+# snapshot.py
+# Immutable, pre-encoded snapshots of the stats payload.
+# A tick's payload is encoded at most once, by the first request that needs it; later
+# requests write the same bytes, and revalidations are answered 304 from the version alone.
+
+import os
+import gzip
+import json
+import time
+import threading
+from flask import Response
+
+# Distinguishes ETags across restarts, since tick versions start over at zero.
+BOOT_ID = '%x' % int(time.time() * 1000) + '-' + os.urandom(2).hex()
+
+
+class Snapshot:
+    """
+    Encoded JSON body plus version and ETag. The gzip variant is produced lazily,
+    once per snapshot, the first time a client accepts it.
+    """
+    __slots__ = ('version', 'body', 'etag', 'created', '_gzip_body', '_lock')
+
+    def __init__(self, version, body, etag=None):
+        self.version = version
+        self.body = body
+        self.etag = etag or etag_for(version)
+        self.created = time.time()
+        self._gzip_body = None
+        self._lock = threading.Lock()
+
+    def gzipped(self):
+        if self._gzip_body is None:
+            with self._lock:
+                if self._gzip_body is None:
+                    self._gzip_body = gzip.compress(self.body, compresslevel=5)
+        return self._gzip_body
+
+
+def etag_for(version, boot_id=BOOT_ID):
+    return '%s-%s' % (boot_id, version)
+
+
+def build_snapshot(version, payload):
+    """Encode `payload` once into a Snapshot tagged with `version`."""
+    return Snapshot(version, json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+
+def negotiate(etag, load, not_modified, accepts_gzip):
+    """
+    Framework-neutral response parts for the snapshot tagged `etag`:
+    (status, body, headers). `load()` returns the Snapshot and is only called when a
+    body is sent; `not_modified` tells whether If-None-Match matched `etag`.
+    """
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if not_modified:
+        status, body = 304, b''
+    else:
+        snapshot = load()
+        etag = snapshot.etag
+        status = 200
+        headers['Content-Type'] = 'application/json'
+        if accepts_gzip:
+            body = snapshot.gzipped()
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            body = snapshot.body
+    headers['ETag'] = '"%s"' % etag
+    return status, body, headers
+
+
+def snapshot_response(request, etag, load):
+    """
+    Build a Flask response for the snapshot tagged `etag`, honouring If-None-Match and
+    Accept-Encoding. `load()` returns the Snapshot and is only called when a body is sent.
+    """
+    status, body, headers = negotiate(etag, load, request.if_none_match.contains(etag),
+                                      'gzip' in request.accept_encodings)
+    return Response(body, status=status, headers=headers)
@@ -1,2 +1,9 @@
 #!/bin/bash
-gunicorn --workers 1 --bind 0.0.0.0:5000 app:app
+# gthread workers keep /stats/stream (SSE) connections from blocking other requests.
+# With WORKERS > 1 one worker runs the collectors and the others serve its shared snapshots.
+# SERVER=asgi serves the dashboard feeds and streams from an event loop instead (see asgi.py).
+export WORKERS=${WORKERS:-4}
+if [ "$SERVER" = "asgi" ]; then
+    exec uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers "$WORKERS"
+fi
+gunicorn --workers "$WORKERS" --worker-class gthread --threads 32 --bind 0.0.0.0:5000 app:app
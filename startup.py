@@ -0,0 +1,50 @@
+# startup.py
+# Startup bookkeeping: a timing breakdown of the import-time steps, and a registry that
+# guarantees each background service is started at most once per process, however
+# often the startup code runs (leader takeover, reloader, tests importing app.py).
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+_started_at = time.monotonic()
+_lock = threading.Lock()
+timings = []          # [(step, seconds)] in execution order
+services = {}         # service name -> Thread
+
+
+@contextmanager
+def step(name):
+    """Time the enclosed block as startup step `name`."""
+    begin = time.monotonic()
+    try:
+        yield
+    finally:
+        timings.append((name, time.monotonic() - begin))
+
+
+def start_once(name, target, *args):
+    """Start `target(*args)` on a daemon thread unless a service `name` was already started."""
+    with _lock:
+        if name in services:
+            return False
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        services[name] = thread
+    thread.start()
+    return True
+
+
+def report():
+    """Total and per-step startup durations in milliseconds, plus the started services."""
+    return {
+        'total_ms': round((time.monotonic() - _started_at) * 1000, 1),
+        'steps': [{'step': name, 'ms': round(seconds * 1000, 1)} for name, seconds in timings],
+        'services': sorted(services)
+    }
+
+
+def log_report():
+    summary = report()
+    logging.info("Startup took %s ms: %s", summary['total_ms'],
+                 ', '.join('%s %s ms' % (s['step'], s['ms']) for s in summary['steps']))
@@ -181,7 +181,7 @@
           graph.interfaces.forEach((iface) => {
             const hist = netData[iface.iface_name] || [];
             if (hist.length) {
-              labels = hist.map((h) => h.time);
+              labels = hist.map((h) => timeLabel(h.time));
               const inData = hist.map((h) => h.input);
               const outData = hist.map((h) => h.output);
               inputDatasets.push({
@@ -10,6 +10,8 @@ const dateCache = new Map();
 // Global cumulative stores for the tables
 let cumulativeLastbData = [];
 let cumulativeProxyData = [];
+// Server's X-Feed-Revision: changes when events already loaded got their location later.
+let feedRevision = null;
 
 // Caches parsed dates for performance
 function getParsedDate(timestamp) {
@@ -144,6 +146,13 @@ function updateTableFromStore(tbodySelector, cumulativeData, type) {
   tbody.appendChild(fragment);
 }
 
+function feedRevisionChanged(response) {
+  const revision = response.headers.get("X-Feed-Revision");
+  const changed = feedRevision !== null && revision !== feedRevision;
+  feedRevision = revision;
+  return changed;
+}
+
 function fetchRTADData() {
   // Fetch for lastb (failed login attempts)
   let lastbUrl = "/rtad_lastb";
@@ -157,13 +166,26 @@ function fetchRTADData() {
   }
 
   fetch(lastbUrl, { cache: "no-store" })
-    .then((response) => response.json())
-    .then((data) => {
-      if (data.length === 0) return;
+    .then((response) =>
+      response.json().then((data) => ({
+        data,
+        // The cursor left the server's window (or the server restarted): start over.
+        reset: response.headers.get("X-Cursor-Reset") === "1",
+        relocated: feedRevisionChanged(response),
+      })),
+    )
+    .then(({ data, reset, relocated }) => {
+      if (relocated) {
+        refreshRTADData();
+        return;
+      }
+      if (reset) cumulativeLastbData = [];
+      if (data.length === 0 && !reset) return;
       cumulativeLastbData = mergeDiffData(cumulativeLastbData, data, "id");
       // Update the lastbLastId based on the latest cumulative data
-      lastbLastId =
-        cumulativeLastbData[cumulativeLastbData.length - 1].id || lastbLastId;
+      lastbLastId = cumulativeLastbData.length
+        ? cumulativeLastbData[cumulativeLastbData.length - 1].id
+        : null;
       updateTableFromStore("#lastbTable tbody", cumulativeLastbData, "lastb");
       if (currentSorts.lastbTable && currentSorts.lastbTable.column !== null) {
         requestAnimationFrame(() => {
@@ -190,12 +212,25 @@ function fetchRTADData() {
   }
 
   fetch(proxyUrl, { cache: "no-store" })
-    .then((response) => response.json())
-    .then((data) => {
-      if (data.length === 0) return;
+    .then((response) =>
+      response.json().then((data) => ({
+        data,
+        // The cursor left the server's window (or the server restarted): start over.
+        reset: response.headers.get("X-Cursor-Reset") === "1",
+        relocated: feedRevisionChanged(response),
+      })),
+    )
+    .then(({ data, reset, relocated }) => {
+      if (relocated) {
+        refreshRTADData();
+        return;
+      }
+      if (reset) cumulativeProxyData = [];
+      if (data.length === 0 && !reset) return;
       cumulativeProxyData = mergeDiffData(cumulativeProxyData, data, "id");
-      proxyLastId =
-        cumulativeProxyData[cumulativeProxyData.length - 1].id || proxyLastId;
+      proxyLastId = cumulativeProxyData.length
+        ? cumulativeProxyData[cumulativeProxyData.length - 1].id
+        : null;
       updateTableFromStore("#proxyTable tbody", cumulativeProxyData, "proxy");
       if (currentSorts.proxyTable && currentSorts.proxyTable.column !== null) {
         requestAnimationFrame(() => {
@@ -1,148 +1,266 @@
 // simplehostmetrics.refac/static/stats.js
 
-function updateStats() {
-  fetch("/stats")
-    .then((r) => r.json())
-    .then((data) => {
-      window.cachedStats = data;
-      const system = data.system || {};
+const MAX_HISTORY_POINTS = 30;
 
-      // CPU
-      cpuOverlay.textContent = Math.round(system.cpu || 0) + "%";
-      if (system.cpu_history && system.cpu_history.usage) {
-        cpuChart.data.labels = system.cpu_history.time;
-        cpuChart.data.datasets[0].data = system.cpu_history.usage;
-        cpuChart.update();
-      }
-      if (system.cpu_details && system.cpu_details.history24h) {
-        cpuDetailChart.data.labels = system.cpu_details.history24h.map(
-          (e) => e.time,
-        );
-        cpuDetailChart.data.datasets[0].data =
-          system.cpu_details.history24h.map((e) => e.usage);
-        cpuDetailChart.update();
-      }
+// History timestamps arrive as epoch seconds; labels are formatted once per
+// (timestamp, format) and reused, since each tick only adds one new point.
+const LABEL_FORMATS = {
+  hms: { hour: "2-digit", minute: "2-digit", second: "2-digit", hour12: false },
+  hm: { hour: "2-digit", minute: "2-digit", hour12: false },
+  mdhm: {
+    month: "2-digit",
+    day: "2-digit",
+    hour: "2-digit",
+    minute: "2-digit",
+    hour12: false,
+  },
+};
+const LABEL_CACHE_SIZE = 1024;
+const labelCache = new Map();
 
-      // Memory
-      if (system.memory_history) {
-        memoryBasicChart.data.labels = system.memory_history.time;
-        memoryBasicChart.data.datasets[0].data = system.memory_history.free;
-        memoryBasicChart.data.datasets[1].data = system.memory_history.used;
-        memoryBasicChart.data.datasets[2].data = system.memory_history.cached;
-        if (system.memory && system.memory.total) {
-          memoryBasicChart.options.scales.y.max = system.memory.total;
-        }
-        memoryBasicChart.update();
-      }
-      if (system.memory) {
-        memoryOverlay.textContent = (system.memory.used || 0).toFixed(2);
-      }
-      if (system.memory_details && system.memory_details.history24h) {
-        const memDV = document.getElementById("memory-detail-view");
-        if (memDV.style.display !== "none" && memDV.offsetParent !== null) {
-          memoryDetailChart.data.labels = system.memory_details.history24h.map(
-            (e) => e.time,
-          );
-          memoryDetailChart.data.datasets[0].data =
-            system.memory_details.history24h.map((e) => e.usage);
-          memoryDetailChart.update();
-        }
-      }
+function timeLabel(ts, format = "hms") {
+  const key = format + ts;
+  let label = labelCache.get(key);
+  if (label === undefined) {
+    label = new Date(ts * 1000).toLocaleString([], LABEL_FORMATS[format]);
+    if (labelCache.size >= LABEL_CACHE_SIZE) {
+      labelCache.delete(labelCache.keys().next().value);
+    }
+    labelCache.set(key, label);
+  }
+  return label;
+}
 
-      // Disk
-      if (system.disk_history_basic) {
-        diskBasicChart.data.labels = system.disk_history_basic.time;
-        diskBasicChart.data.datasets[0].data = system.disk_history_basic.used;
-        diskBasicChart.data.datasets[1].data = system.disk_history_basic.free;
-        if (system.disk && system.disk.total) {
-          diskBasicChart.options.scales.y.max = system.disk.total;
-        }
-        diskBasicChart.update();
-      }
-      if (system.disk) {
-        diskOverlay.textContent = (system.disk.used || 0).toFixed(2);
-      }
-      if (system.disk_details && system.disk_details.history) {
-        const diskDV = document.getElementById("disk-detail-view");
-        if (diskDV.style.display !== "none" && diskDV.offsetParent !== null) {
-          diskHistoryChart.data.labels = system.disk_details.history.map(
-            (e) => e.time,
-          );
-          diskHistoryChart.data.datasets[0].data =
-            system.disk_details.history.map((e) => e.used);
-          diskHistoryChart.update();
-        }
-      }
+function timeLabels(times, format = "hms") {
+  return times.map((ts) => timeLabel(ts, format));
+}
 
-      // Network
-      if (data.network && data.network.interfaces) {
-        const interfaces = data.network.interfaces;
-        let mainIface = null;
-        Object.keys(interfaces).forEach((k) => {
-          if (/^e/.test(k) && !mainIface) mainIface = k;
-        });
-        if (!mainIface) {
-          mainIface = Object.keys(interfaces)[0] || null;
-        }
-        if (
-          mainIface &&
-          interfaces[mainIface] &&
-          interfaces[mainIface].length
-        ) {
-          const arr = interfaces[mainIface];
-          networkChart.data.labels = arr.map((e) => e.time);
-          networkChart.data.datasets[0].data = arr.map((e) => e.input);
-          networkChart.data.datasets[1].data = arr.map((e) => e.output);
-          networkChart.update();
+function renderStats(data) {
+  window.cachedStats = data;
+  const system = data.system || {};
+
+  // CPU
+  cpuOverlay.textContent = Math.round(system.cpu || 0) + "%";
+  if (system.cpu_history && system.cpu_history.usage) {
+    cpuChart.data.labels = timeLabels(system.cpu_history.time);
+    cpuChart.data.datasets[0].data = system.cpu_history.usage;
+    cpuChart.update();
+  }
+  if (system.cpu_details && system.cpu_details.history24h) {
+    cpuDetailChart.data.labels = system.cpu_details.history24h.map(
+      (e) => timeLabel(e.time, "hm"),
+    );
+    cpuDetailChart.data.datasets[0].data =
+      system.cpu_details.history24h.map((e) => e.usage);
+    cpuDetailChart.update();
+  }
+
+  // Memory
+  if (system.memory_history) {
+    memoryBasicChart.data.labels = timeLabels(system.memory_history.time);
+    memoryBasicChart.data.datasets[0].data = system.memory_history.free;
+    memoryBasicChart.data.datasets[1].data = system.memory_history.used;
+    memoryBasicChart.data.datasets[2].data = system.memory_history.cached;
+    if (system.memory && system.memory.total) {
+      memoryBasicChart.options.scales.y.max = system.memory.total;
+    }
+    memoryBasicChart.update();
+  }
+  if (system.memory) {
+    memoryOverlay.textContent = (system.memory.used || 0).toFixed(2);
+  }
+  if (system.memory_details && system.memory_details.history24h) {
+    const memDV = document.getElementById("memory-detail-view");
+    if (memDV.style.display !== "none" && memDV.offsetParent !== null) {
+      memoryDetailChart.data.labels = system.memory_details.history24h.map(
+        (e) => timeLabel(e.time, "hm"),
+      );
+      memoryDetailChart.data.datasets[0].data =
+        system.memory_details.history24h.map((e) => e.usage);
+      memoryDetailChart.update();
+    }
+  }
+
+  // Disk
+  if (system.disk_history_basic) {
+    diskBasicChart.data.labels = timeLabels(
+      system.disk_history_basic.time,
+    );
+    diskBasicChart.data.datasets[0].data = system.disk_history_basic.used;
+    diskBasicChart.data.datasets[1].data = system.disk_history_basic.free;
+    if (system.disk && system.disk.total) {
+      diskBasicChart.options.scales.y.max = system.disk.total;
+    }
+    diskBasicChart.update();
+  }
+  if (system.disk) {
+    diskOverlay.textContent = (system.disk.used || 0).toFixed(2);
+  }
+  if (system.disk_details && system.disk_details.history) {
+    const diskDV = document.getElementById("disk-detail-view");
+    if (diskDV.style.display !== "none" && diskDV.offsetParent !== null) {
+      diskHistoryChart.data.labels = system.disk_details.history.map(
+        (e) => timeLabel(e.time, "mdhm"),
+      );
+      diskHistoryChart.data.datasets[0].data =
+        system.disk_details.history.map((e) => e.used);
+      diskHistoryChart.update();
+    }
+  }
+
+  // Network
+  if (data.network && data.network.interfaces) {
+    const interfaces = data.network.interfaces;
+    let mainIface = null;
+    Object.keys(interfaces).forEach((k) => {
+      if (/^e/.test(k) && !mainIface) mainIface = k;
+    });
+    if (!mainIface) {
+      mainIface = Object.keys(interfaces)[0] || null;
+    }
+    if (
+      mainIface &&
+      interfaces[mainIface] &&
+      interfaces[mainIface].length
+    ) {
+      const arr = interfaces[mainIface];
+      networkChart.data.labels = arr.map((e) => timeLabel(e.time));
+      networkChart.data.datasets[0].data = arr.map((e) => e.input);
+      networkChart.data.datasets[1].data = arr.map((e) => e.output);
+      networkChart.update();
+    }
+  }
+
+  // Docker
+  const dockerDataEl = document.getElementById("docker-data");
+  dockerDataEl.innerHTML = (data.docker || [])
+    .map((cont) => {
+      let statusClass;
+      const lowerStatus = (cont.status || "").toLowerCase();
+      if (lowerStatus.includes("update success")) {
+        statusClass = "status-green";
+      } else if (/^updat/i.test(lowerStatus)) {
+        statusClass = "status-yellow";
+        if (lowerStatus.includes("failed")) {
+          statusClass = "status-red";
         }
+      } else if (!cont.up_to_date) {
+        statusClass = "status-blue";
+      } else if (lowerStatus.includes("running")) {
+        statusClass = "status-green";
+      } else if (
+        lowerStatus.includes("starting") ||
+        lowerStatus.includes("created")
+      ) {
+        statusClass = "status-yellow";
+      } else {
+        statusClass = "status-red";
       }
-
-      // Docker
-      const dockerDataEl = document.getElementById("docker-data");
-      dockerDataEl.innerHTML = (data.docker || [])
-        .map((cont) => {
-          let statusClass;
-          const lowerStatus = (cont.status || "").toLowerCase();
-          if (lowerStatus.includes("update success")) {
-            statusClass = "status-green";
-          } else if (/^updat/i.test(lowerStatus)) {
-            statusClass = "status-yellow";
-            if (lowerStatus.includes("failed")) {
-              statusClass = "status-red";
-            }
-          } else if (!cont.up_to_date) {
-            statusClass = "status-blue";
-          } else if (lowerStatus.includes("running")) {
-            statusClass = "status-green";
-          } else if (
-            lowerStatus.includes("starting") ||
-            lowerStatus.includes("created")
-          ) {
-            statusClass = "status-yellow";
-          } else {
-            statusClass = "status-red";
-          }
-          const hrs = Math.floor(cont.uptime / 3600);
-          const mins = Math.floor((cont.uptime % 3600) / 60);
-          let updateBtn = "";
-          if (!cont.up_to_date && !/updating/i.test(cont.status)) {
-            updateBtn = `<button class="update-btn" onclick="updateContainer('${cont.name}')">↑ Update</button>`;
-          }
-          return `
-                <tr>
-                  <td><div class="status-indicator ${statusClass}"></div></td>
-                  <td>${cont.name}</td>
-                  <td>${hrs}h ${mins}m</td>
-                  <td>${cont.image}</td>
-                  <td>${updateBtn}</td>
-                </tr>
-              `;
-        })
-        .join("");
+      const hrs = Math.floor(cont.uptime / 3600);
+      const mins = Math.floor((cont.uptime % 3600) / 60);
+      let updateBtn = "";
+      if (!cont.up_to_date && !/updating/i.test(cont.status)) {
+        updateBtn = `<button class="update-btn" onclick="updateContainer('${cont.name}')">↑ Update</button>`;
+      }
+      return `
+            <tr>
+              <td><div class="status-indicator ${statusClass}"></div></td>
+              <td>${cont.name}</td>
+              <td>${hrs}h ${mins}m</td>
+              <td>${cont.image}</td>
+              <td>${updateBtn}</td>
+            </tr>
+          `;
     })
+    .join("");
+}
+
+function updateStats() {
+  const cached = window.cachedStats;
+  const url =
+    cached && cached.seq !== undefined ? `/stats?since=${cached.seq}` : "/stats";
+  fetch(url)
+    .then((r) => r.json())
+    .then((data) => (data.delta ? applyDelta(data) : renderStats(data)))
     .catch((err) => console.error("Error fetching stats:", err));
 }
 
-// Updated polling interval from 500ms to 1000ms
-setInterval(updateStats, 1000);
-updateStats();
+// Append new samples to a column-oriented history ({time: [], usage: [], ...}).
+function appendColumns(history, columns) {
+  Object.keys(columns).forEach((key) => {
+    const hist = (history[key] = history[key] || []);
+    hist.push(...columns[key]);
+    if (hist.length > MAX_HISTORY_POINTS) {
+      hist.splice(0, hist.length - MAX_HISTORY_POINTS);
+    }
+  });
+}
+
+// Merge a delta (from /stats/stream or /stats?since=) into the cached snapshot and re-render.
+function applyDelta(delta) {
+  const data = window.cachedStats;
+  if (!data || !data.system) return;
+  const system = data.system;
+  Object.assign(system, delta.system);
+  const samples = delta.samples || {};
+  ["cpu_history", "memory_history", "disk_history_basic"].forEach((key) => {
+    if (samples[key]) {
+      system[key] = system[key] || {};
+      appendColumns(system[key], samples[key]);
+    }
+  });
+  const interfaces = (data.network = data.network || {}).interfaces || {};
+  Object.entries(samples.network || {}).forEach(([iface, records]) => {
+    const hist = (interfaces[iface] = interfaces[iface] || []);
+    hist.push(...records);
+    if (hist.length > MAX_HISTORY_POINTS) {
+      hist.splice(0, hist.length - MAX_HISTORY_POINTS);
+    }
+  });
+  data.network.interfaces = interfaces;
+  if (delta.details) Object.assign(system, delta.details);
+  if (delta.docker) data.docker = delta.docker;
+  // Optional collectors: history is columns, or {key: columns} for keyed sources.
+  const metrics = (data.metrics = data.metrics || {});
+  Object.entries(delta.metrics || {}).forEach(([name, metric]) => {
+    const target = (metrics[name] = metrics[name] || { history: {} });
+    target.latest = metric.latest;
+    if (Array.isArray(metric.samples.time)) {
+      appendColumns(target.history, metric.samples);
+    } else {
+      Object.entries(metric.samples).forEach(([key, columns]) => {
+        target.history[key] = target.history[key] || {};
+        appendColumns(target.history[key], columns);
+      });
+    }
+  });
+  data.seq = delta.seq;
+  renderStats(data);
+}
+
+// Prefer the push stream; fall back to 1s polling when SSE is unavailable.
+let statsPollTimer = null;
+function startPolling() {
+  if (statsPollTimer === null) {
+    statsPollTimer = setInterval(updateStats, 1000);
+    updateStats();
+  }
+}
+
+if (window.EventSource) {
+  const statsSource = new EventSource("/stats/stream");
+  statsSource.addEventListener("snapshot", (e) => {
+    if (statsPollTimer !== null) {
+      clearInterval(statsPollTimer);
+      statsPollTimer = null;
+    }
+    renderStats(JSON.parse(e.data));
+  });
+  statsSource.addEventListener("delta", (e) => applyDelta(JSON.parse(e.data)));
+  statsSource.onerror = () => {
+    // EventSource reconnects on its own; poll meanwhile so the dashboard stays live.
+    if (statsSource.readyState === EventSource.CLOSED) startPolling();
+  };
+} else {
+  startPolling();
+}
@@ -1,59 +1,49 @@
 # simplehostmetrics.refac/stats.py
 import time
-import threading
+import atexit
 import logging
 import psutil
-import datetime
+import threading
+from functools import lru_cache, partial
+import collectors
 from database import get_db_connection
-from queue import Queue, Empty
+from db_writer import DBWriter
+from ring_buffer import RingBuffer
+from rollup import RollupEngine
+from scheduler import Scheduler
+from compactor import RetentionCompactor, RetentionPolicy
+from archive import Archive, SOURCE_TIER as ARCHIVE_SOURCE_TIER
+from stream import Broadcaster, encode_event
+from snapshot import build_snapshot
 
 MAX_HISTORY = 30
-MAX_HISTORY_EXT_CPU = 24   # 24h CPU-Graph
-MAX_HISTORY_EXT_DISK = 28  # 7d Disk-Graph (6h-Intervall)
-NETWORK_UPDATE_INTERVAL = 1.0  # seconds
+MAX_HISTORY_EXT_CPU = 24       # 24h CPU-Graph (1h rollups)
+MAX_HISTORY_EXT_DISK = 7 * 24  # 7d Disk-Graph (1h rollups)
+RAW_RETENTION = 3600           # seconds of 1s samples kept in stats.db
+ARCHIVE_RETENTION = 365 * 86400  # seconds of compressed per-minute history (archive.py)
+ATTACK_RETENTION = 90 * 86400    # seconds of RTAD events kept (attack_store.py)
+COMPACT_INTERVAL = 300         # seconds between retention runs
+KEY_EXPIRY = 300               # samples a key (e.g. an interface) may be missing before it is dropped
 
-# Global DB queue for offloading operations
-db_queue = Queue()
+# Single batched writer for stats.db; db_queue is its bounded queue.
+db_writer = DBWriter(get_db_connection)
+db_queue = db_writer.queue
 
 def queue_query(sql, params):
-    db_queue.put((sql, params))
+    db_writer.submit(sql, params)
 
-def db_worker():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    BATCH_SIZE = 20  # Number of queries to batch together
-    while True:
-        batch = []
-        try:
-            # Wait for at least one query; timeout after 10 seconds if none are queued
-            item = db_queue.get(timeout=10)
-            batch.append(item)
-        except Empty:
-            # If no query appears within timeout, commit any accumulated batch (if any) and continue
-            if batch:
-                for sql, params in batch:
-                    cursor.execute(sql, params)
-                conn.commit()
-            continue
+def queue_rows(sql, rows):
+    """Queue one statement for several parameter rows as a single writer item."""
+    db_writer.submit(sql, rows, many=True)
 
-        # Try to get additional items without waiting
-        while len(batch) < BATCH_SIZE:
-            try:
-                item = db_queue.get_nowait()
-                batch.append(item)
-            except Empty:
-                break
-
-        for sql, params in batch:
-            try:
-                cursor.execute(sql, params)
-            except Exception as e:
-                logging.error("DB operation failed: %s; SQL: %s; Params: %s", e, sql, params)
-        conn.commit()
-
-# Start the DB worker thread
-db_worker_thread = threading.Thread(target=db_worker, daemon=True)
-db_worker_thread.start()
+def start_writer():
+    """
+    Start the DB writer thread and flush whatever is still queued when the process exits.
+    Only the leader writes stats.db, so only it calls this (see app.start_background_services).
+    """
+    db_writer.start()
+    atexit.register(db_writer.stop)
+    atexit.register(archive.flush)   # runs first, so the writer still stores the open chunks
 
 # Global in-memory caches and histories for system metrics
 cached_stats = {
@@ -62,288 +52,389 @@ cached_stats = {
     'network': {'interfaces': {}}
 }
 
-cpu_history = {'time': [], 'usage': []}
-memory_history_basic = {'time': [], 'free': [], 'used': [], 'cached': []}
-disk_history_basic = {'time': [], 'total': [], 'used': [], 'free': []}
-cpu_history_24h = []
-memory_history_24h = []
-disk_history = []
-network_history = {}
+# Fixed-size ring buffers; appending never shifts or reallocates the stored history.
+cpu_history = RingBuffer(MAX_HISTORY, ('usage',))
+memory_history_basic = RingBuffer(MAX_HISTORY, ('free', 'used', 'cached'))
+disk_history_basic = RingBuffer(MAX_HISTORY, ('total', 'used', 'free'))
+network_history = {}  # interface -> RingBuffer(MAX_HISTORY, ('input', 'output'))
+
+# Collector name -> history: a RingBuffer, or {key: RingBuffer} for keyed collectors.
+# The built-in collectors keep their histories in the buffers above.
+BUILTIN_COLLECTORS = ('cpu', 'memory', 'disk', 'network')
+histories = {
+    'cpu': cpu_history,
+    'memory': memory_history_basic,
+    'disk': disk_history_basic,
+    'network': network_history,
+}
+active_collectors = {}  # name -> enabled collectors.Collector
+latest_metrics = {}     # name -> latest sample of the non built-in collectors
+absent_keys = {}        # keyed collector name -> {key: consecutive samples without it}
+
+# Compressed long-term copy of every series' minute means.
+archive = Archive(queue_query)
+
+def persist_rollup(series, tier, bucket, minimum, maximum, mean, count):
+    queue_query("INSERT INTO rollups (series, tier, timestamp, min, max, mean, count) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (series, tier, float(bucket), minimum, maximum, mean, count))
+    if tier == ARCHIVE_SOURCE_TIER:
+        archive.add(series, bucket, mean)
+
+# Minute/hour/day rollups for every metric (cpu, memory, disk, net.<iface>.input/output).
+rollups = RollupEngine(on_close=persist_rollup)
+
+# The collector only appends; expired rows are removed in bulk by the compactor thread.
+compactor = RetentionCompactor(
+    [RetentionPolicy(table, RAW_RETENTION)
+     for table in ('cpu_history', 'memory_history', 'disk_history_basic', 'net_history')] +
+    [RetentionPolicy('rollups', step * capacity, 'tier = ?', (tier,))
+     for tier, step, capacity in rollups.tier_specs] +
+    [RetentionPolicy('chunks', ARCHIVE_RETENTION, column='end_time'),
+     RetentionPolicy('attack_entries', ATTACK_RETENTION)],
+    interval=COMPACT_INTERVAL
+)
+
+# Live push of per-tick deltas to /stats/stream subscribers.
+broadcaster = Broadcaster()
+sample_seq = 0               # Sequence number given to every sample of the running tick.
+tick_seq = 0                 # Sequence number of the last fully published tick.
+_docker_seq = 0              # Tick at which the Docker container list last changed.
+_last_docker = None
 
-# Aggregators for extended views
-cpu_24h_aggregator = {'current_hour': None, 'sum': 0.0, 'count': 0}
-mem_24h_aggregator = {'current_hour': None, 'sum': 0.0, 'count': 0}
-disk_7d_aggregator = {'current_6hour': None, 'sum': 0.0, 'count': 0}
+# Pre-encoded payload of the latest tick; built on first request, never mutated.
+current_snapshot = None
+# Held by the collector while a tick is appended; readers take it to see whole ticks only.
+state_lock = threading.Lock()
+# (series, count, field) -> (rollup version, hourly history)
+_hourly_cache = {}
 
-prev_net_io = None
-prev_net_time = None
-last_network_update = 0
+# Callable returning the current Docker container list; app.py wires it to docker_manager.
+docker_source = lambda: []
 
-def get_cpu_details():
+# The delta of the last tick; kept (and built even without stream subscribers) when
+# retain_delta is set, so it can be handed to other workers.
+retain_delta = False
+last_delta = None
+
+# Callables run after every published tick (e.g. pre-rendering the /metrics exposition).
+tick_listeners = []
+
+def history_columns(buffer):
+    return buffer.window().columns()
+
+def network_records(view):
+    return [{'time': t, 'input': i, 'output': o}
+            for t, i, o in zip(view.times(), view.values('input'), view.values('output'))]
+
+def network_history_records():
+    return {iface: network_records(buffer.window()) for iface, buffer in list(network_history.items())}
+
+def rollup_version(series):
+    """
+    Changes whenever a minute or hour bucket of `series` closes, i.e. at most once a minute.
+    Views derived from hourly points only need to be rebuilt when this changes.
+    """
+    entry = rollups.get(series)
+    if entry is None:
+        return None
+    return entry.tier('1m').buffer.last_seq, entry.tier('1h').buffer.last_seq
+
+def hourly_history(series, count, field='usage'):
+    """Newest `count` hourly means of `series` as [{'time': epoch, field: mean}], memoized per rollup version."""
+    key = (series, count, field)
+    version = rollup_version(series)
+    cached = _hourly_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    points = rollups.points(series, '1h', count)
+    history = [{'time': t, field: round(mean, 2)} for t, mean in zip(points['time'], points['mean'])]
+    _hourly_cache[key] = (version, history)
+    return history
+
+def restore_sequence():
+    """Continue numbering after the samples load_history put into the buffers."""
+    global sample_seq, tick_seq
+    buffers = []
+    for history in histories.values():
+        buffers.extend(history.values() if isinstance(history, dict) else [history])
+    sample_seq = tick_seq = max([sample_seq, rollups.last_seq()] + [b.last_seq for b in buffers])
+
+def metric_history(name, since=None, until=None):
+    """Columns of a collector's history (per key for keyed collectors), optionally only after `since`."""
+    def columns(buffer):
+        return (buffer.window() if since is None else buffer.since(since, until)).columns()
+    history = histories[name]
+    if isinstance(history, dict):
+        return {key: columns(buffer) for key, buffer in list(history.items())
+                if since is None or buffer.last_seq > since}
+    return columns(history)
+
+def snapshot_payload():
+    """Full payload of the last published tick, built from the ring buffers."""
+    system = dict(cached_stats['system'])
+    system['cpu_history'] = history_columns(cpu_history)
+    system['memory_history'] = history_columns(memory_history_basic)
+    system['disk_history_basic'] = history_columns(disk_history_basic)
+    return {
+        'system': system,
+        'docker': cached_stats['docker'],
+        'network': {'interfaces': network_history_records()},
+        'metrics': {name: {'latest': latest_metrics.get(name), 'history': metric_history(name)}
+                    for name in active_collectors if name not in BUILTIN_COLLECTORS},
+        'seq': tick_seq
+    }
+
+def get_snapshot():
+    """
+    Return the Snapshot of the last published tick. It is encoded on first request
+    after a tick, so ticks nobody asks for cost no serialization at all.
+    """
+    global current_snapshot
+    snapshot = current_snapshot
+    if snapshot is not None and snapshot.version == tick_seq:
+        return snapshot
+    with state_lock:
+        snapshot = current_snapshot
+        if snapshot is None or snapshot.version != tick_seq:
+            snapshot = current_snapshot = build_snapshot(tick_seq, snapshot_payload())
+    return snapshot
+
+def build_delta(since):
+    """
+    Return everything published after tick `since`: current gauges, new history samples,
+    rollup buckets closed since then and (if changed) the Docker list.
+    Returns None when the cursor is outside the retained window and the client
+    has to fall back to the full snapshot.
+    """
+    with state_lock:
+        return _build_delta(since, tick_seq)
+
+def _build_delta(since, until):
+    first = cpu_history.first_seq
+    if since > until or first is None or since < first - 1:
+        return None
+    system = cached_stats['system']
+    delta = {
+        'seq': until,
+        'since': since,
+        'delta': True,
+        'system': {key: system[key] for key in ('cpu', 'memory', 'disk') if key in system},
+        'samples': {
+            'cpu_history': cpu_history.since(since, until).columns(),
+            'memory_history': memory_history_basic.since(since, until).columns(),
+            'disk_history_basic': disk_history_basic.since(since, until).columns(),
+            'network': {}
+        }
+    }
+    for iface, buffer in list(network_history.items()):
+        if buffer.last_seq > since:
+            records = network_records(buffer.since(since, until))
+            if records:
+                delta['samples']['network'][iface] = records
+    for name in active_collectors:
+        if name not in BUILTIN_COLLECTORS:
+            samples = metric_history(name, since, until)
+            if samples and (isinstance(histories[name], dict) or samples['time']):
+                delta.setdefault('metrics', {})[name] = {'latest': latest_metrics.get(name), 'samples': samples}
+    closed = rollups.closed_since(since, until)
+    if closed:
+        delta['rollups'] = closed
+        delta['details'] = {key: system[key] for key in ('cpu_details', 'memory_details', 'disk_details')
+                            if key in system}
+    if _docker_seq > since:
+        delta['docker'] = cached_stats['docker']
+    return delta
+
+def _extend_columns(target, columns):
+    for name, values in columns.items():
+        target.setdefault(name, []).extend(values)
+
+def merge_deltas(deltas):
+    """
+    Combine consecutive tick deltas (each one's 'since' is the previous one's 'seq') into
+    one delta from the first cursor, the same as a client applying them in order.
+    """
+    merged = {'seq': deltas[-1]['seq'], 'since': deltas[0]['since'], 'delta': True, 'system': {}, 'samples': {}}
+    samples = merged['samples']
+    for delta in deltas:
+        merged['system'].update(delta.get('system', {}))
+        for key, value in delta.get('samples', {}).items():
+            if key == 'network':
+                network = samples.setdefault('network', {})
+                for iface, records in value.items():
+                    network.setdefault(iface, []).extend(records)
+            else:
+                _extend_columns(samples.setdefault(key, {}), value)
+        for name, metric in delta.get('metrics', {}).items():
+            target = merged.setdefault('metrics', {}).setdefault(name, {'samples': {}})
+            target['latest'] = metric['latest']
+            if isinstance(metric['samples'].get('time'), list):
+                _extend_columns(target['samples'], metric['samples'])
+            else:
+                for key, columns in metric['samples'].items():
+                    _extend_columns(target['samples'].setdefault(key, {}), columns)
+        for series, tiers in delta.get('rollups', {}).items():
+            for tier, columns in tiers.items():
+                _extend_columns(merged.setdefault('rollups', {}).setdefault(series, {}).setdefault(tier, {}), columns)
+        if 'details' in delta:
+            merged.setdefault('details', {}).update(delta['details'])
+        if 'docker' in delta:
+            merged['docker'] = delta['docker']
+    return merged
+
+def publish_delta(previous_seq):
+    """Encode the delta since the previous tick once and hand it to every stream subscriber."""
+    global last_delta
+    if len(broadcaster) or retain_delta:
+        delta = build_delta(previous_seq)
+        if retain_delta:
+            last_delta = delta
+        if delta is not None and len(broadcaster):
+            broadcaster.publish(encode_event('delta', delta))
+
+def get_cpu_details(values):
     try:
         load15 = psutil.getloadavg()[2]
     except Exception:
         load15 = 0
-    if not cpu_history_24h:
-        current_usage = psutil.cpu_percent()
-        cpu_history_24h.insert(0, {'time': time.time(), 'usage': current_usage})
-    history_formatted = [{
-        'time': datetime.datetime.fromtimestamp(e['time']).strftime('%H:%M'),
-        'usage': e['usage']
-    } for e in cpu_history_24h]
-    return {'load15': load15, 'history24h': history_formatted}
-
-def get_memory_details():
-    if not memory_history_24h:
-        mem = psutil.virtual_memory()
-        mem_used_gb = round(mem.used / (1024 ** 3), 2)
-        memory_history_24h.insert(0, {'time': time.time(), 'usage': mem_used_gb})
-    history_formatted = [{
-        'time': datetime.datetime.fromtimestamp(e['time']).strftime('%H:%M'),
-        'usage': e['usage']
-    } for e in memory_history_24h]
-    return {'history24h': history_formatted}
-
-def get_disk_details():
-    disk = psutil.disk_usage('/')
-    if not disk_history:
-        disk_used_gb = round(disk.used / (1024 ** 3), 2)
-        disk_history.insert(0, {'time': time.time(), 'used': disk.used})
-    history = [{
-        'time': datetime.datetime.fromtimestamp(entry['time']).strftime('%m-%d %H:%M'),
-        'used': round(entry['used'] / (1024 ** 3), 2)
-    } for entry in disk_history]
+    return {'load15': load15, 'history24h': hourly_history('cpu', MAX_HISTORY_EXT_CPU)}
+
+def get_memory_details(values):
+    return {'history24h': hourly_history('memory', MAX_HISTORY_EXT_CPU)}
+
+def get_disk_details(values):
     return {
         'root': {
-            'total': round(disk.total / (1024 ** 3), 2),
-            'used': round(disk.used / (1024 ** 3), 2),
-            'free': round(disk.free / (1024 ** 3), 2),
-            'percent': disk.percent
+            'total': values['total'],
+            'used': values['used'],
+            'free': values['free'],
+            'percent': values['percent']
         },
-        'history': history
+        'history': hourly_history('disk', MAX_HISTORY_EXT_DISK, 'used')
     }
 
-def update_aggregators(cpu_percent, mem_used_gb, disk_used):
-    now = int(time.time())
-    current_hour = now - (now % 3600)
-    # CPU aggregator
-    if cpu_24h_aggregator['current_hour'] is None:
-        cpu_24h_aggregator['current_hour'] = current_hour
-        cpu_24h_aggregator['sum'] = cpu_percent
-        cpu_24h_aggregator['count'] = 1
-    else:
-        if current_hour == cpu_24h_aggregator['current_hour']:
-            cpu_24h_aggregator['sum'] += cpu_percent
-            cpu_24h_aggregator['count'] += 1
-        else:
-            avg_usage = (cpu_24h_aggregator['sum'] / cpu_24h_aggregator['count']) if cpu_24h_aggregator['count'] else 0
-            queue_query("INSERT INTO cpu_history_24h (timestamp, usage) VALUES (?, ?)",
-                        (float(cpu_24h_aggregator['current_hour']), avg_usage))
-            cutoff = time.time() - (24 * 3600)
-            queue_query("DELETE FROM cpu_history_24h WHERE timestamp < ?", (cutoff,))
-            cpu_24h_aggregator['current_hour'] = current_hour
-            cpu_24h_aggregator['sum'] = cpu_percent
-            cpu_24h_aggregator['count'] = 1
-
-    # Memory aggregator
-    if mem_24h_aggregator['current_hour'] is None:
-        mem_24h_aggregator['current_hour'] = current_hour
-        mem_24h_aggregator['sum'] = mem_used_gb
-        mem_24h_aggregator['count'] = 1
-    else:
-        if current_hour == mem_24h_aggregator['current_hour']:
-            mem_24h_aggregator['sum'] += mem_used_gb
-            mem_24h_aggregator['count'] += 1
-        else:
-            avg_mem_usage = (mem_24h_aggregator['sum'] / mem_24h_aggregator['count']) if mem_24h_aggregator['count'] else 0
-            queue_query("INSERT INTO memory_history_24h (timestamp, usage) VALUES (?, ?)",
-                        (float(mem_24h_aggregator['current_hour']), avg_mem_usage))
-            cutoff = time.time() - (24 * 3600)
-            queue_query("DELETE FROM memory_history_24h WHERE timestamp < ?", (cutoff,))
-            mem_24h_aggregator['current_hour'] = current_hour
-            mem_24h_aggregator['sum'] = mem_used_gb
-            mem_24h_aggregator['count'] = 1
-
-    # Disk aggregator (6-hour intervals)
-    current_6hour = now // 21600
-    if disk_7d_aggregator['current_6hour'] is None:
-        disk_7d_aggregator['current_6hour'] = current_6hour
-        disk_7d_aggregator['sum'] = disk_used
-        disk_7d_aggregator['count'] = 1
-    else:
-        if current_6hour == disk_7d_aggregator['current_6hour']:
-            disk_7d_aggregator['sum'] += disk_used
-            disk_7d_aggregator['count'] += 1
-        else:
-            avg_used = disk_7d_aggregator['sum'] / disk_7d_aggregator['count'] if disk_7d_aggregator['count'] > 0 else disk_used
-            old_6h_timestamp = float(disk_7d_aggregator['current_6hour'] * 21600)
-            queue_query("INSERT INTO disk_history_details (timestamp, used) VALUES (?, ?)",
-                        (old_6h_timestamp, avg_used))
-            cutoff_7d = time.time() - (7 * 24 * 3600)
-            queue_query("DELETE FROM disk_history_details WHERE timestamp < ?", (cutoff_7d,))
-            disk_7d_aggregator['current_6hour'] = current_6hour
-            disk_7d_aggregator['sum'] = disk_used
-            disk_7d_aggregator['count'] = 1
+@lru_cache(maxsize=None)
+def insert_sql(table, key_column, fields):
+    columns = ((key_column,) if key_column else ()) + ('timestamp',) + fields
+    # Raw rows are keyed by integer epoch second; a second sample within one second replaces the first.
+    return "INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (table, ', '.join(columns), ', '.join('?' * len(columns)))
+
+def expire_keys(collector, history, values):
+    """
+    Drop the state of keys missing from the last KEY_EXPIRY samples, e.g. the veth
+    interfaces of removed Docker containers: their history buffer, rollup series and
+    open archive chunk. (Rate collectors only keep counters of the last read anyway.)
+    """
+    absent = absent_keys.setdefault(collector.name, {})
+    for key in [key for key in absent if key in values]:
+        del absent[key]
+    for key in history.keys() - values.keys():
+        absent[key] = absent.get(key, 0) + 1
+        if absent[key] >= KEY_EXPIRY:
+            del history[key], absent[key]
+            for series, _ in collector.rollup_series(key):
+                rollups.remove(series)
+                archive.close(series)
+
+def record(collector, now, seq):
+    """
+    Shared pipeline for every collector: sample once, then append to its history,
+    feed the rollup tiers, queue the raw rows and publish the latest values.
+    """
+    values = collector.sample()
+    if not values:
+        return
+    history = histories[collector.name]
+    rows = values.items() if collector.keyed else ((None, values),)
+    timestamp = int(now)
+    table_rows = []
+    for key, row in rows:
+        fields = tuple(row[field] for field in collector.fields)
+        buffer = history
+        if collector.keyed:
+            buffer = history.get(key)
+            if buffer is None:
+                buffer = history[key] = RingBuffer(MAX_HISTORY, collector.fields)
+        buffer.append(now, fields, seq)
+        for series, field in collector.rollup_series(key):
+            rollups.add(series, now, row[field], seq)
+        if collector.table:
+            table_rows.append(((key,) if collector.keyed else ()) + (timestamp,) + fields)
+    if collector.keyed:
+        expire_keys(collector, history, values)
+    if table_rows:
+        # One writer item per collector and tick, however many keys (e.g. interfaces) it has.
+        queue_rows(insert_sql(collector.table, collector.key_column if collector.keyed else None,
+                              collector.fields), table_rows)
+    system = cached_stats['system']
+    collector.publish(system, values)
+    if collector.name in DETAILS:
+        details_key, details = DETAILS[collector.name]
+        system[details_key] = details(values)
+    if collector.name not in BUILTIN_COLLECTORS:
+        latest_metrics[collector.name] = values
+
+DETAILS = {
+    'cpu': ('cpu_details', get_cpu_details),
+    'memory': ('memory_details', get_memory_details),
+    'disk': ('disk_details', get_disk_details),
+}
+
+def configure_collectors(config=None):
+    """
+    (Re)build the active collectors and their schedule from the `collectors` section
+    of config.yml ({name: {enabled, interval, ...}}). Call before the collector thread starts.
+    """
+    config = config or {}
+    for name in config:
+        if name not in collectors.COLLECTORS:
+            logging.warning("Unknown collector in config.yml: %s", name)
+    scheduler.jobs = []
+    active_collectors.clear()
+    for name in collectors.COLLECTORS:
+        try:
+            collector = collectors.create(name, config.get(name))
+        except Exception as e:
+            logging.error("Invalid configuration for collector %s: %s", name, e)
+            continue
+        if not collector.enabled:
+            continue
+        if not collector.available():
+            logging.warning("Collector %s is not available on this host", name)
+            continue
+        if name not in histories:
+            histories[name] = {} if collector.keyed else RingBuffer(MAX_HISTORY, collector.fields)
+        active_collectors[name] = collector
+        scheduler.add(name, collector.interval, partial(record, collector))
+
+# Each collector samples on its own drift-free grid; collectors due at the same
+# moment share one tick (and one sequence number).
+scheduler = Scheduler()
+configure_collectors()
+
+def run_tick(jobs):
+    """Run the due collectors as one tick and publish it."""
+    global sample_seq, tick_seq, _docker_seq, _last_docker
+    with state_lock:
+        now = time.time()
+        sample_seq += 1
+        seq = sample_seq
+        for job in jobs:
+            scheduler.execute(job, now, seq)
+        docker = docker_source()
+        if docker is not _last_docker:
+            _last_docker = docker
+            _docker_seq = seq
+        cached_stats['docker'] = docker
+        previous_seq, tick_seq = tick_seq, seq
+    publish_delta(previous_seq)
+    for listener in tick_listeners:
+        listener()
 
 def update_stats_cache():
-    SLEEP_INTERVAL = 1.0  # 1 second between in-memory updates
-    global prev_net_io, prev_net_time, last_network_update
+    restore_sequence()
     while True:
         try:
-            now = time.time()
-            now_str = datetime.datetime.now().strftime('%H:%M:%S')
-            cpu_percent = psutil.cpu_percent()
-            mem = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-
-            # CPU immediate updates
-            cpu_history['time'].append(now_str)
-            cpu_history['usage'].append(cpu_percent)
-            if len(cpu_history['time']) > MAX_HISTORY:
-                cpu_history['time'].pop(0)
-                cpu_history['usage'].pop(0)
-            queue_query("INSERT INTO cpu_history (timestamp, usage) VALUES (?, ?)", (now, cpu_percent))
-            queue_query(
-                """DELETE FROM cpu_history
-                   WHERE rowid NOT IN (
-                     SELECT rowid FROM cpu_history
-                     ORDER BY timestamp DESC
-                     LIMIT ?
-                   )""", (MAX_HISTORY,)
-            )
-
-            # Memory immediate updates
-            cached_val = getattr(mem, 'cached', 0)
-            cached_GB = cached_val / (1024 ** 3)
-            used_no_cache_GB = (mem.used - cached_val) / (1024 ** 3)
-            memory_history_basic['time'].append(now_str)
-            memory_history_basic['free'].append(round(mem.free/(1024**3), 2))
-            memory_history_basic['used'].append(round(used_no_cache_GB, 2))
-            memory_history_basic['cached'].append(round(cached_GB, 2))
-            if len(memory_history_basic['time']) > MAX_HISTORY:
-                memory_history_basic['time'].pop(0)
-                memory_history_basic['free'].pop(0)
-                memory_history_basic['used'].pop(0)
-                memory_history_basic['cached'].pop(0)
-            queue_query("INSERT INTO memory_history (timestamp, free, used, cached) VALUES (?, ?, ?, ?)",
-                        (now, round(mem.free/(1024**3), 2), round(used_no_cache_GB, 2), round(cached_GB, 2)))
-            queue_query(
-                """DELETE FROM memory_history
-                   WHERE rowid NOT IN (
-                     SELECT rowid FROM memory_history
-                     ORDER BY timestamp DESC
-                     LIMIT ?
-                   )""", (MAX_HISTORY,)
-            )
-
-            # Disk immediate updates
-            total_disk_GB = round(disk.total/(1024**3), 2)
-            used_disk_GB = round(disk.used/(1024**3), 2)
-            free_disk_GB = round(disk.free/(1024**3), 2)
-            disk_history_basic['time'].append(now_str)
-            disk_history_basic['total'].append(total_disk_GB)
-            disk_history_basic['used'].append(used_disk_GB)
-            disk_history_basic['free'].append(free_disk_GB)
-            if len(disk_history_basic['time']) > MAX_HISTORY:
-                disk_history_basic['time'].pop(0)
-                disk_history_basic['total'].pop(0)
-                disk_history_basic['used'].pop(0)
-                disk_history_basic['free'].pop(0)
-            queue_query("INSERT INTO disk_history_basic (timestamp, total, used, free) VALUES (?, ?, ?, ?)",
-                        (now, total_disk_GB, used_disk_GB, free_disk_GB))
-            queue_query(
-                """DELETE FROM disk_history_basic
-                   WHERE rowid NOT IN (
-                     SELECT rowid FROM disk_history_basic
-                     ORDER BY timestamp DESC
-                     LIMIT ?
-                   )""", (MAX_HISTORY,)
-            )
-
-            # Update aggregators for extended views
-            mem_used_gb = round(mem.used/(1024**3), 2)
-            update_aggregators(cpu_percent, mem_used_gb, disk.used)
-
-            # Format 24h data for UI
-            cpu_24h_formatted = [{
-                'time': datetime.datetime.fromtimestamp(e['time']).strftime('%H:%M'),
-                'usage': e['usage']
-            } for e in cpu_history_24h]
-            mem_24h_formatted = [{
-                'time': datetime.datetime.fromtimestamp(e['time']).strftime('%H:%M'),
-                'usage': e['usage']
-            } for e in memory_history_24h]
-
-            heavy_cpu_details = get_cpu_details()
-            heavy_cpu_details['history24h'] = cpu_24h_formatted
-            heavy_mem_details = get_memory_details()
-            heavy_mem_details['history24h'] = mem_24h_formatted
-
-            cached_disk_details = get_disk_details()
-
-            # Network stats update
-            if (now - last_network_update) >= NETWORK_UPDATE_INTERVAL:
-                net_current = psutil.net_io_counters(pernic=True)
-                if prev_net_io is not None and prev_net_time is not None:
-                    dt = now - prev_net_time
-                    if dt > 0:
-                        for iface, stats_net in net_current.items():
-                            prev_stats = prev_net_io.get(iface)
-                            if prev_stats:
-                                input_speed = (stats_net.bytes_recv - prev_stats.bytes_recv) / (dt * (1024 * 1024))
-                                output_speed = (stats_net.bytes_sent - prev_stats.bytes_sent) / (dt * (1024 * 1024))
-                                if input_speed < 0.0001:
-                                    input_speed = 0
-                                if output_speed < 0.0001:
-                                    output_speed = 0
-                                if iface not in network_history:
-                                    network_history[iface] = []
-                                network_history[iface].append({
-                                    'time': datetime.datetime.fromtimestamp(now).strftime('%H:%M:%S'),
-                                    'input': input_speed,
-                                    'output': output_speed
-                                })
-                                if len(network_history[iface]) > MAX_HISTORY:
-                                    network_history[iface] = network_history[iface][-MAX_HISTORY:]
-                                queue_query("INSERT INTO net_history (interface, timestamp, input, output) VALUES (?, ?, ?, ?)",
-                                            (iface, now, input_speed, output_speed))
-                                queue_query(
-                                    """DELETE FROM net_history
-                                       WHERE rowid NOT IN (
-                                         SELECT rowid FROM net_history
-                                         WHERE interface=?
-                                         ORDER BY timestamp DESC
-                                         LIMIT ?
-                                       )""", (iface, MAX_HISTORY)
-                                )
-                prev_net_io = net_current
-                prev_net_time = now
-                last_network_update = now
-
-            # Update the in-memory cache structure for API responses
-            cached_stats['system'] = {
-                'cpu': cpu_percent,
-                'memory': {
-                    'percent': mem.percent,
-                    'total': round(mem.total/(1024**3), 2),
-                    'used': round(mem.used/(1024**3), 2),
-                    'free': round(mem.free/(1024**3), 2),
-                    'cached': round(getattr(mem, 'cached', 0)/(1024**3), 2)
-                },
-                'disk': {
-                    'percent': disk.percent,
-                    'total': total_disk_GB,
-                    'used': used_disk_GB,
-                    'free': free_disk_GB
-                },
-                'cpu_history': cpu_history,
-                'memory_history': memory_history_basic,
-                'disk_history_basic': disk_history_basic,
-                'cpu_details': heavy_cpu_details,
-                'memory_details': heavy_mem_details,
-                'disk_details': cached_disk_details
-            }
-            cached_stats['network'] = {'interfaces': network_history}
+            run_tick(scheduler.wait())
         except Exception as e:
             logging.error("Error updating stats cache: %s", e)
-        time.sleep(SLEEP_INTERVAL)
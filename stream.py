@@ -0,0 +1,139 @@
+# stream.py
+# Shared Server-Sent Events fan-out.
+# The collector encodes each message once; every subscriber receives the same bytes,
+# so the per-tick cost is one serialization no matter how many dashboards are open.
+
+import json
+import asyncio
+import threading
+from queue import Queue, Empty, Full
+
+# Returned by Subscription.get() when the subscriber fell behind and needs a full snapshot.
+RESYNC = object()
+
+
+def encode_event(event, data):
+    """Encode `data` as one SSE frame."""
+    return encode_raw(event, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+def encode_raw(event, body):
+    """Wrap already-encoded single-line JSON bytes in an SSE frame."""
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + body + b'\n\n'
+
+
+class Subscription:
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, backlog):
+        self.queue = Queue(maxsize=backlog)
+        self.overflowed = False
+
+    def offer(self, frame):
+        """Queue `frame`; on a full queue drop the backlog and ask for a resync instead."""
+        try:
+            self.queue.put_nowait(frame)
+        except Full:
+            self.overflow()
+
+    def overflow(self):
+        self.overflowed = True
+        with self.queue.mutex:
+            self.queue.queue.clear()
+
+    def get(self, timeout=None):
+        """
+        Return the next frame, RESYNC if frames were dropped, or None on timeout
+        (callers use the timeout to send keepalives).
+        """
+        if self.overflowed:
+            self.overflowed = False
+            return RESYNC
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class AsyncSubscription:
+    """
+    Subscription consumed by a coroutine on `loop` (ASGI mode). The collector thread only
+    schedules queue operations on the loop, so the event loop never blocks on it.
+    """
+    __slots__ = ('loop', 'queue', 'overflowed')
+
+    def __init__(self, backlog, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=backlog)
+        self.overflowed = False
+
+    def offer(self, frame):
+        self._schedule(self._put, frame)
+
+    def overflow(self):
+        self._schedule(self._overflow)
+
+    def _schedule(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # Loop already closed; the subscriber is going away.
+
+    def _put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self._overflow()
+
+    def _overflow(self):
+        self.overflowed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    async def get(self, timeout=None):
+        """Same contract as Subscription.get(), awaitable."""
+        if self.overflowed:
+            self.overflowed = False
+            return RESYNC
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Broadcaster:
+    """
+    Fan-out of pre-encoded frames to any number of subscribers. A subscriber that
+    does not keep up loses its backlog and is told to resync instead of growing memory.
+    """
+    def __init__(self, backlog=30):
+        self.backlog = backlog
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, loop=None):
+        """Register a subscriber; with an event `loop` it is an AsyncSubscription."""
+        sub = Subscription(self.backlog) if loop is None else AsyncSubscription(self.backlog, loop)
+        with self.lock:
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def publish(self, frame):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.offer(frame)
+
+    def resync(self):
+        """Tell every subscriber to start over from a full snapshot (e.g. after a missed tick)."""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.overflow()
+
+    def __len__(self):
+        return len(self.subscribers)
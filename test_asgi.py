@@ -0,0 +1,203 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from apptest import app as webapp
+import asgi
+import shared
+from models import db, User
+
+
+def call(path, query=b'', headers=None):
+    """Run one GET through the ASGI app; returns (status, headers, body)."""
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': query, 'scheme': 'http', 'http_version': '1.1',
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start = messages[0]
+    response_headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+
+
+def session_cookie(first_login):
+    """Session cookie of the default admin, with its first_login flag set as given."""
+    with webapp.app.app_context():
+        user = User.query.first()
+        user.first_login = first_login
+        db.session.commit()
+        uniquifier = user.fs_uniquifier
+    client = webapp.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = uniquifier
+        session['_fresh'] = True
+    return 'session=' + client.get_cookie('session').value
+
+
+class AsgiAuthTestCase(unittest.TestCase):
+    def setUp(self):
+        asgi._auth_cache.clear()
+        self.checks = []
+        check_auth = asgi._check_auth
+
+        def counting_check(path, headers):
+            self.checks.append(path)
+            return check_auth(path, headers)
+
+        patcher = mock.patch.object(asgi, '_check_auth', counting_check)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_native_routes_need_a_session(self):
+        for path in ('/stats', '/rtad_lastb', '/metrics'):
+            self.assertEqual(call(path)[0], 401)
+        self.assertEqual(call('/stats', headers={'Cookie': 'session=forged'})[0], 401)
+
+    def test_metrics_token_replaces_the_session(self):
+        with mock.patch.object(webapp, 'METRICS_TOKEN', 'scrape-me'):
+            self.assertEqual(call('/metrics', headers={'Authorization': 'Bearer wrong'})[0], 401)
+            status, headers, _ = call('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual((status, headers['content-type']), (200, asgi.exposition.CONTENT_TYPE))
+
+    def test_first_login_is_sent_to_the_credentials_form(self):
+        cookie = session_cookie(first_login=True)
+        status, headers, _ = call('/stats', headers={'Cookie': cookie})
+        self.assertEqual(status, 302)
+        self.assertTrue(headers['location'].endswith('/user-management'))
+        self.assertEqual(call('/metrics', headers={'Cookie': cookie})[0], 302)
+        self.assertEqual(asgi._auth_cache, {})       # never cached
+        cookie = session_cookie(first_login=False)
+        self.assertEqual(call('/stats', headers={'Cookie': cookie})[0], 200)
+
+    def test_cached_check_redone_after_logout(self):
+        cookie = session_cookie(first_login=False)
+        for _ in range(3):
+            self.assertEqual(call('/stats', headers={'Cookie': cookie})[0], 200)
+        self.assertEqual(len(self.checks), 1)
+        client = webapp.app.test_client()
+        client.set_cookie('session', cookie.split('=', 1)[1])
+        self.assertEqual(client.post('/logout').status_code, 302)    # Flask serves the logout
+        call('/stats', headers={'Cookie': cookie})
+        self.assertEqual(len(self.checks), 2)
+        webapp.auth_changed()                           # e.g. credentials changed
+        call('/stats', headers={'Cookie': cookie})
+        self.assertEqual(len(self.checks), 3)
+
+    def test_cache_evicts_least_recently_used(self):
+        with mock.patch.object(asgi, '_check_auth', lambda path, headers: asgi.AUTH_OK), \
+                mock.patch.object(asgi, 'AUTH_CACHE_SIZE', 2):
+            for name in ('a', 'b', 'a', 'c'):
+                call('/api/attack_map_data', headers={'Cookie': 'session=' + name})
+        self.assertEqual([key[0] for key in asgi._auth_cache], ['a', 'c'])
+
+
+class QuietBroadcaster(asgi.stats.Broadcaster):
+    """Ignores the ticks of the collectors running in this process."""
+    def publish(self, frame):
+        pass
+
+    def resync(self):
+        pass
+
+
+class AsgiStreamTestCase(unittest.TestCase):
+    """/stats/stream leaves the broadcaster as soon as the client goes away."""
+    def setUp(self):
+        patches = [
+            (asgi, '_check_auth', lambda path, headers: asgi.AUTH_OK),
+            (webapp, 'STREAM_KEEPALIVE', 60),
+            (webapp, 'current_snapshot', lambda: mock.Mock(body=b'{"seq":1}')),
+            (asgi.stats, 'broadcaster', QuietBroadcaster()),
+        ]
+        for target, name, value in patches:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.scope = {'type': 'http', 'method': 'GET', 'path': '/stats/stream', 'raw_path': b'/stats/stream',
+                      'root_path': '', 'query_string': b'', 'headers': [(b'cookie', b'session=ok')]}
+
+    async def stream(self, disconnect):
+        """Run the endpoint until the snapshot frame is sent, then `disconnect()` it."""
+        sent, gone = asyncio.Event(), asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message.get('more_body'):
+                sent.set()
+
+        task = asyncio.ensure_future(asgi.app(self.scope, receive, send))
+        await sent.wait()
+        self.assertEqual(len(asgi.stats.broadcaster.subscribers), 1)
+        disconnect(task, gone)
+        done, _ = await asyncio.wait((task,), timeout=2)
+        self.assertEqual(done, {task})        # well before the 60 s keepalive
+        await task
+
+    def test_disconnect_unsubscribes_without_waiting_for_a_frame(self):
+        asyncio.run(self.stream(lambda task, gone: gone.set()))
+        self.assertEqual(asgi.stats.broadcaster.subscribers, set())
+
+    def test_cancellation_is_propagated(self):
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(self.stream(lambda task, gone: task.cancel()))
+        self.assertEqual(asgi.stats.broadcaster.subscribers, set())
+
+
+class AsgiStatsTestCase(unittest.TestCase):
+    """/stats on a follower serving the leader's published ticks."""
+    def setUp(self):
+        self.previous_dir = shared.SHARED_DIR
+        shared.SHARED_DIR = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shared.SHARED_DIR)
+        self.addCleanup(setattr, shared, 'SHARED_DIR', self.previous_dir)
+        self.publisher = shared.Publisher()
+        for seq in range(5, 8):
+            self.publisher.publish_tick(seq, b'{"seq":%d}' % seq, {
+                'seq': seq, 'since': seq - 1, 'delta': True, 'system': {},
+                'samples': {'cpu_history': {'time': [seq], 'usage': [1.0]}}}, b'', {})
+        patches = {'is_leader': lambda: False, 'feed': shared.Feed()}
+        for name, value in patches.items():
+            patcher = mock.patch.object(webapp, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(asgi, '_check_auth', lambda path, headers: asgi.AUTH_OK)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.headers = {'Cookie': 'session=ok'}
+
+    def test_etag_and_not_modified(self):
+        status, headers, body = call('/stats', headers=self.headers)
+        self.assertEqual((status, body), (200, b'{"seq":7}'))
+        etag = headers['etag']
+        status, headers, body = call('/stats', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual((status, body, headers['etag']), (304, b'', etag))
+        self.publisher.publish_tick(8, b'{"seq":8}', None, b'', {})
+        self.assertEqual(call('/stats', headers=dict(self.headers, **{'If-None-Match': etag}))[0], 200)
+
+    def test_delta_from_cursor(self):
+        status, _, body = call('/stats', query=b'since=5', headers=self.headers)
+        delta = json.loads(body)
+        self.assertEqual((status, delta['since'], delta['seq']), (200, 5, 7))
+        self.assertEqual(delta['samples']['cpu_history']['time'], [6, 7])
+        # A cursor outside the published window gets the full snapshot instead.
+        self.assertEqual(call('/stats', query=b'since=2', headers=self.headers)[2], b'{"seq":7}')
+
+
+if __name__ == '__main__':
+    unittest.main()
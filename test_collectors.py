@@ -0,0 +1,83 @@
+import unittest
+from array import array
+
+import collectors
+
+
+class CountingCollector(collectors.RateCollector):
+    name = 'counting'
+    fields = ('rx',)
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.values = iter([{'eth0': {'rx': 10.0}}, {'eth0': {'rx': 12.0}, 'eth1': {'rx': 1.0}}])
+
+    def counters(self):
+        return next(self.values)
+
+
+class ScriptedNetworkCollector(collectors.NetworkCollector):
+    def __init__(self, reads):
+        super().__init__()
+        self.reads = iter(reads)
+
+    def read(self):
+        current = next(self.reads)
+        return tuple(current), array('Q', [v for counters in current.values() for v in counters])
+
+
+class CollectorTestCase(unittest.TestCase):
+    def test_registry_creates_configured_collectors(self):
+        collector = collectors.create('memory', {'interval': 5})
+        self.assertEqual(collector.interval, 5.0)
+        self.assertTrue(collector.enabled)
+        self.assertFalse(collectors.create('cpu_cores').enabled)
+        with self.assertRaises(KeyError):
+            collectors.create('nope')
+
+    def test_rollup_series_names(self):
+        self.assertEqual(collectors.create('network').rollup_series('eth0'),
+                         [('net.eth0.input', 'input'), ('net.eth0.output', 'output')])
+        self.assertEqual(collectors.create('pressure').rollup_series(),
+                         [('pressure.cpu', 'cpu'), ('pressure.memory', 'memory'), ('pressure.io', 'io')])
+        self.assertEqual(collectors.create('cpu_cores').rollup_series('cpu1'),
+                         [('cpu_cores.cpu1.usage', 'usage')])
+
+    def test_rate_collector_needs_two_samples(self):
+        collector = CountingCollector()
+        self.assertEqual(collector.sample(), {})
+        collector.previous_time -= 2.0
+        rates = collector.sample()
+        self.assertEqual(list(rates), ['eth0'])
+        self.assertAlmostEqual(rates['eth0']['rx'], 1.0, places=2)
+
+    def test_counter_wraps_and_resets(self):
+        self.assertEqual(collectors.counter_delta(5, 2 ** 32 - 5), 10)
+        self.assertEqual(collectors.counter_delta(5, 2 ** 64 - 5), 10)
+        self.assertEqual(collectors.counter_delta(7, 2 ** 40), 7)
+
+    def test_counter_decrease_far_from_a_wrap_is_a_reset(self):
+        # 64-bit counters: a re-created interface that had carried ~3.5 GB is not a wrap.
+        self.assertEqual(collectors.counter_delta(1024, 3500000000), 1024)
+        self.assertEqual(collectors.counter_delta(1024, 5000000000), 1024)
+        self.assertEqual(collectors.counter_delta(2 ** 29, 2 ** 32 - 5), 2 ** 29)
+
+    def test_network_rates_follow_interface_changes(self):
+        mb = collectors.MB
+        collector = ScriptedNetworkCollector([
+            {'eth0': (0, 0, 0, 0, 0, 0, 0, 0), 'veth1': (0, 0, 0, 0, 0, 0, 0, 0)},
+            {'veth2': (1, 1, 1, 1, 1, 1, 1, 1), 'eth0': (2 * mb, mb, 20, 10, 0, 0, 4, 0)},
+        ])
+        self.assertEqual(collector.sample(), {})
+        collector.counters_time -= 2.0
+        rates = collector.sample()
+        self.assertEqual(list(rates), ['eth0'])
+        self.assertAlmostEqual(rates['eth0']['output'], 1.0, places=2)
+        self.assertAlmostEqual(rates['eth0']['input'], 0.5, places=2)
+        self.assertAlmostEqual(rates['eth0']['packets_out'], 10.0, places=2)
+        self.assertAlmostEqual(rates['eth0']['drops_in'], 2.0, places=2)
+        self.assertEqual(collector.totals()['veth2']['dropout'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
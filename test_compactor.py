@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import database
+from compactor import RetentionCompactor, RetentionPolicy
+
+
+class RetentionCompactorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.directory.name, 'stats.db')
+        database.initialize_database()
+        with database.write_transaction() as conn:
+            conn.executemany("INSERT INTO cpu_history (timestamp, usage) VALUES (?, 1.0)",
+                             [(t,) for t in range(1000, 1100)])
+            conn.executemany("INSERT INTO rollups (series, tier, timestamp) VALUES ('cpu', ?, ?)",
+                             [(tier, t) for tier in ('1m', '1h') for t in range(1000, 1100)])
+
+    def tearDown(self):
+        database.close_thread_connections()
+        database.DB_PATH = self.previous_path
+        self.directory.cleanup()
+
+    def timestamps(self, sql, params=()):
+        return [row[0] for row in database.read_connection().execute(sql, params)]
+
+    def test_expired_rows_removed_in_batches(self):
+        compactor = RetentionCompactor([
+            RetentionPolicy('cpu_history', 40),
+            RetentionPolicy('rollups', 10, "tier = ?", ('1m',)),
+        ], batch_size=7)
+        report = compactor.run_once(now=1100)
+        self.assertEqual(report['removed'], {'cpu_history': 60, 'rollups [1m]': 90})
+        self.assertEqual(self.timestamps("SELECT timestamp FROM cpu_history ORDER BY timestamp"),
+                         list(range(1060, 1100)))
+        self.assertEqual(self.timestamps("SELECT timestamp FROM rollups WHERE tier = '1m' ORDER BY timestamp"),
+                         list(range(1090, 1100)))
+        # Other tiers of the shared table are left alone.
+        self.assertEqual(len(self.timestamps("SELECT timestamp FROM rollups WHERE tier = '1h'")), 100)
+        # Nothing left to expire on the next pass.
+        self.assertEqual(compactor.run_once(now=1100)['removed'], {'cpu_history': 0, 'rollups [1m]': 0})
+
+    def test_failing_policy_does_not_stop_the_others(self):
+        compactor = RetentionCompactor([RetentionPolicy('missing_table', 10),
+                                        RetentionPolicy('cpu_history', 10)])
+        with self.assertLogs(level='ERROR'):
+            report = compactor.run_once(now=1100)
+        self.assertEqual(report['removed'], {'cpu_history': 90})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import database
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_path = database.DB_PATH
+        database.DB_PATH = os.path.join(self.directory.name, 'stats.db')
+        database.initialize_database()
+
+    def tearDown(self):
+        database.close_thread_connections()
+        database.DB_PATH = self.previous_path
+        self.directory.cleanup()
+
+    def test_connections_are_reused_per_thread(self):
+        self.assertIs(database.read_connection(), database.read_connection())
+        self.assertIsNot(database.read_connection(), database.write_connection())
+        other = []
+        thread = threading.Thread(target=lambda: other.append(database.read_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], database.read_connection())
+
+    def test_read_connection_is_query_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            database.read_connection().execute("DELETE FROM cpu_history")
+
+    def test_write_transaction_commits_or_rolls_back(self):
+        with database.write_transaction() as conn:
+            conn.execute("INSERT INTO cpu_history (timestamp, usage) VALUES (1, 5.0)")
+        with self.assertRaises(ZeroDivisionError):
+            with database.write_transaction() as conn:
+                conn.execute("INSERT INTO cpu_history (timestamp, usage) VALUES (2, 6.0)")
+                1 / 0
+        rows = database.read_connection().execute("SELECT timestamp FROM cpu_history").fetchall()
+        self.assertEqual([r['timestamp'] for r in rows], [1])
+        self.assertEqual(database.read_connection().execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import db_writer
+from db_writer import DBWriter, POLICY_DROP_NEWEST
+
+INSERT = "INSERT INTO samples (value) VALUES (?)"
+
+
+class FlakyConnection:
+    """Connection whose first `failures` journal_mode pragmas fail as if the DB were locked."""
+    def __init__(self, conn, failures):
+        self.conn = conn
+        self.failures = failures
+
+    def execute(self, sql, *args):
+        if 'journal_mode' in sql and self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class DBWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stats.db')
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE samples (value INTEGER)")
+        conn.commit()
+        conn.close()
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.stop()
+        self.directory.cleanup()
+
+    def writer(self, **kwargs):
+        writer = DBWriter(lambda: sqlite3.connect(self.path, check_same_thread=False), **kwargs)
+        self.writers.append(writer)
+        return writer
+
+    def values(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return [row[0] for row in conn.execute("SELECT value FROM samples ORDER BY rowid")]
+        finally:
+            conn.close()
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out waiting for the writer")
+            time.sleep(0.01)
+
+    def test_queued_statements_batched_by_size(self):
+        writer = self.writer(batch_size=4, commit_interval=0.05)
+        for value in range(10):
+            writer.submit(INSERT, (value,))
+        writer.submit(INSERT, [(10,), (11,)], many=True)
+        writer.start()
+        self.wait_for(lambda: writer.rows == 12)
+        self.assertEqual(self.values(), list(range(12)))
+        self.assertEqual(writer.get_stats()['batches'], 3)
+
+    def test_commit_window_groups_later_statements(self):
+        writer = self.writer(commit_interval=0.3)
+        writer.start()
+        writer.submit(INSERT, (1,))
+        time.sleep(0.05)
+        writer.submit(INSERT, (2,))
+        self.wait_for(lambda: writer.batches)
+        self.assertEqual((writer.batches, writer.rows), (1, 2))
+        self.assertEqual(self.values(), [1, 2])
+
+    def test_full_queue_drops_oldest_or_newest(self):
+        writer = self.writer(maxsize=2)
+        for value in range(5):
+            writer.submit(INSERT, (value,))
+        self.assertEqual(writer.get_stats()['dropped'], 3)
+        self.assertEqual([item[1] for item in list(writer.queue.queue)], [(3,), (4,)])
+
+        writer = self.writer(maxsize=2, policy=POLICY_DROP_NEWEST)
+        for value in range(5):
+            writer.submit(INSERT, (value,))
+        self.assertEqual(writer.dropped, 3)
+        self.assertEqual([item[1] for item in list(writer.queue.queue)], [(0,), (1,)])
+
+    def test_wal_switch_retried_while_locked(self):
+        writer = DBWriter(lambda: FlakyConnection(sqlite3.connect(self.path, check_same_thread=False), 2),
+                          commit_interval=0.05)
+        self.writers.append(writer)
+        writer.submit(INSERT, (7,))
+        with mock.patch.object(db_writer.time, 'sleep') as sleep, self.assertLogs(level='ERROR') as logs:
+            writer.start()
+            self.wait_for(lambda: writer.rows == 1)
+        self.assertEqual([c for c in sleep.call_args_list if c == mock.call(1.0)], [mock.call(1.0)] * 2)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.values(), [7])
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        conn.close()
+
+    def test_stop_flushes_everything_queued(self):
+        # stats registers stop() with atexit; it must drain the queue before returning.
+        writer = self.writer(batch_size=3, commit_interval=0.5)
+        writer.start()
+        for value in range(20):
+            writer.submit(INSERT, (value,))
+        writer.stop()
+        self.assertFalse(writer._thread.is_alive())
+        self.assertEqual(self.values(), list(range(20)))
+        self.assertEqual(writer.get_stats()['queue_depth'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import stats
+from ring_buffer import RingBuffer
+from rollup import RollupEngine
+
+
+class DeltaTestCase(unittest.TestCase):
+    """stats.build_delta over buffers holding ticks 3..7 (the oldest ones were dropped)."""
+    def setUp(self):
+        cpu = RingBuffer(5, ('usage',))
+        memory = RingBuffer(5, ('free', 'used', 'cached'))
+        disk = RingBuffer(5, ('total', 'used', 'free'))
+        eth0 = RingBuffer(5, ('input', 'output'))
+        for seq in range(1, 8):
+            cpu.append(1000 + seq, (float(seq),), seq)
+            memory.append(1000 + seq, (1.0, 2.0, 3.0), seq)
+            disk.append(1000 + seq, (4.0, 5.0, 6.0), seq)
+            if seq % 2:
+                eth0.append(1000 + seq, (seq * 10.0, 0.0), seq)
+        state = {
+            'cpu_history': cpu, 'memory_history_basic': memory, 'disk_history_basic': disk,
+            'network_history': {'eth0': eth0}, 'active_collectors': {},
+            'rollups': RollupEngine(on_close=lambda *args: None),
+            'cached_stats': {'system': {'cpu': 7.0}, 'docker': ['web'], 'network': {'interfaces': {}}},
+            'tick_seq': 7, '_docker_seq': 5,
+        }
+        for name, value in state.items():
+            patcher = mock.patch.object(stats, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_delta_contains_only_ticks_after_cursor(self):
+        delta = stats.build_delta(4)
+        self.assertEqual((delta['since'], delta['seq'], delta['delta']), (4, 7, True))
+        self.assertEqual(delta['samples']['cpu_history']['usage'], [5.0, 6.0, 7.0])
+        self.assertEqual([r['input'] for r in delta['samples']['network']['eth0']], [50.0, 70.0])
+        self.assertEqual(delta['system'], {'cpu': 7.0})
+        self.assertEqual(delta['docker'], ['web'])
+
+    def test_unchanged_parts_are_left_out(self):
+        delta = stats.build_delta(6)
+        self.assertEqual(delta['samples']['cpu_history']['usage'], [7.0])
+        self.assertEqual([r['input'] for r in delta['samples']['network']['eth0']], [70.0])
+        self.assertNotIn('docker', delta)
+        delta = stats.build_delta(7)
+        self.assertEqual(delta['samples']['cpu_history']['usage'], [])
+        self.assertEqual(delta['samples']['network'], {})
+
+    def test_cursor_outside_window_needs_snapshot(self):
+        self.assertIsNotNone(stats.build_delta(2))     # tick 3 is the oldest retained
+        self.assertIsNone(stats.build_delta(1))        # tick 2 was dropped
+        self.assertIsNone(stats.build_delta(8))        # cursor from before a restart
+
+
+if __name__ == '__main__':
+    unittest.main()
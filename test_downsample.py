@@ -0,0 +1,36 @@
+import math
+import unittest
+
+from downsample import lttb, minmax
+
+
+class DownsampleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.times = [float(i) for i in range(1000)]
+        self.values = [math.sin(i / 50.0) for i in range(1000)]
+        self.values[500] = 10.0
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        times, values = lttb(self.times, self.values, 50)
+        self.assertEqual(len(times), 50)
+        self.assertEqual((times[0], times[-1]), (0.0, 999.0))
+        self.assertIn(10.0, values)
+        self.assertEqual(list(times), sorted(times))
+
+    def test_lttb_returns_short_series_unchanged(self):
+        times, values = lttb(self.times[:10], self.values[:10], 50)
+        self.assertEqual(list(times), self.times[:10])
+
+    def test_minmax_keeps_extremes_per_bucket(self):
+        times, mins, maxs = minmax(self.times, self.values, 10)
+        self.assertEqual(list(times), [float(i * 100) for i in range(10)])
+        self.assertEqual(max(maxs), 10.0)
+        self.assertAlmostEqual(min(mins), -1.0, places=3)
+
+    def test_minmax_prefers_supplied_extremes(self):
+        times, mins, maxs = minmax([0.0, 1.0], [5.0, 5.0], 1, [1.0, 2.0], [8.0, 9.0])
+        self.assertEqual((list(mins), list(maxs)), ([1.0], [9.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from event_ring import EventRing, read_events
+
+
+def ring_with(ids, capacity=5):
+    ring = EventRing(capacity)
+    for event_id in ids:
+        ring.append({'id': event_id})
+    return ring
+
+
+def ids(page):
+    return [event['id'] for event in page.events]
+
+
+class EventRingTestCase(unittest.TestCase):
+    def test_behaves_like_bounded_deque(self):
+        ring = ring_with(range(1, 8))
+        self.assertEqual(len(ring), 5)
+        self.assertEqual([e['id'] for e in ring], [3, 4, 5, 6, 7])
+        self.assertEqual(ring[-1]['id'], 7)
+        self.assertEqual(ring[0]['id'], 3)
+        with self.assertRaises(ValueError):
+            ring.append({'id': 7})
+        ring.clear()
+        self.assertEqual(list(ring), [])
+
+    def test_cursor_reads(self):
+        ring = ring_with(range(1, 8))
+        page = ring.read(4)
+        self.assertEqual((ids(page), page.next_cursor, page.reset), ([5, 6, 7], 7, False))
+        page = ring.read(4, limit=2)
+        self.assertEqual((ids(page), page.next_cursor), ([5, 6], 6))
+        page = ring.read(7)
+        self.assertEqual((ids(page), page.next_cursor, page.reset), ([], 7, False))
+        self.assertEqual(ids(ring.read(2)), [3, 4, 5, 6, 7])        # nothing lost yet
+        self.assertEqual(ids(ring.read(limit=2)), [6, 7])
+        self.assertEqual(ids(ring.read()), [3, 4, 5, 6, 7])
+
+    def test_cursor_outside_window_resets(self):
+        ring = ring_with(range(1, 8))
+        page = ring.read(1, limit=2)                  # id 2 was dropped
+        self.assertEqual((ids(page), page.next_cursor, page.reset), ([3, 4], 4, True))
+        page = ring.read(100)                         # ids restarted on the server
+        self.assertEqual((ids(page), page.reset), ([3, 4, 5, 6, 7], True))
+        page = EventRing(5).read(100)
+        self.assertEqual((ids(page), page.next_cursor, page.reset), ([], 0, True))
+
+    def test_gapped_ids_and_plain_lists(self):
+        events = [{'id': i} for i in (2, 5, 9, 14, 20)]
+        self.assertEqual(ids(read_events(events, 9)), [14, 20])
+        self.assertEqual(ids(read_events(events, 10)), [14, 20])
+        self.assertEqual(ids(ring_with([2, 5, 9, 14, 20]).read(3)), [5, 9, 14, 20])
+
+
+if __name__ == '__main__':
+    unittest.main()
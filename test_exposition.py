@@ -0,0 +1,100 @@
+import math
+import re
+import unittest
+from unittest import mock
+
+import collectors
+import exposition
+import stats
+from scheduler import Scheduler
+
+METRIC_NAME = r'[a-zA-Z_:][a-zA-Z0-9_:]*'
+SAMPLE = re.compile(r'^(%s)(?:\{(.*)\})? (\S+)$' % METRIC_NAME)
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+UNESCAPE = {'\\\\': '\\', '\\"': '"', '\\n': '\n'}
+
+
+def parse(text):
+    """Minimal text-format parser: {(name, frozenset(labels)): value} plus {name: type}."""
+    samples, types, declared = {}, {}, set()
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            declared.add(line.split()[2])
+            continue
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ', 3)
+            types[name] = kind
+            continue
+        match = SAMPLE.match(line)
+        if match is None:
+            raise ValueError("bad sample line: %r" % line)
+        name, label_text, value = match.groups()
+        if name not in declared or name not in types:
+            raise ValueError("sample before HELP/TYPE: %r" % line)
+        labels = {}
+        if label_text:
+            position = 0
+            for label in LABEL.finditer(label_text):
+                if label.start() != position:
+                    raise ValueError("bad labels: %r" % label_text)
+                labels[label.group(1)] = re.sub(r'\\.', lambda m: UNESCAPE[m.group(0)], label.group(2))
+                position = label.end()
+            if position != len(label_text):
+                raise ValueError("bad labels: %r" % label_text)
+        samples[(name, frozenset(labels.items()))] = float(value)
+    return samples, types
+
+
+class ExpositionTestCase(unittest.TestCase):
+    def setUp(self):
+        memory = collectors.create('memory')
+        memory.last_bytes = {'total': 8 * 1024 ** 3 + 123, 'used': 5000000001, 'free': 1, 'cached': 2}
+        disk = collectors.create('disk', {'path': '/srv/data'})
+        disk.last_bytes = {'total': 1000000000007, 'used': 3, 'free': 999999999999}
+        pressure = collectors.create('pressure')
+        state = {
+            'cached_stats': {
+                'system': {'cpu': 12.5, 'memory': {'percent': 60.0, 'total': 8.0, 'used': 4.66},
+                           'disk': {'percent': 0.1, 'total': 931.32, 'used': 0.0, 'free': 931.32}},
+                'docker': [{'name': 'we"b\\1\nx', 'status': 'running', 'image': 'nginx', 'uptime': 60,
+                            'up_to_date': True}],
+            },
+            'active_collectors': {'memory': memory, 'disk': disk, 'pressure': pressure},
+            'latest_metrics': {'pressure': {'cpu': float('nan'), 'memory': float('inf'), 'io': float('-inf')}},
+            'scheduler': Scheduler(),
+        }
+        for name, value in state.items():
+            patcher = mock.patch.object(stats, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (('rtad_source', lambda: {('http_error', '404', 'NL'): 3}),
+                            ('geo_cache_source', lambda: None)):
+            patcher = mock.patch.object(exposition, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.samples, self.types = parse(exposition.render(1)[1].decode('utf-8'))
+
+    def sample(self, metric, **labels):
+        return self.samples[(exposition.PREFIX + metric, frozenset(labels.items()))]
+
+    def test_byte_gauges_use_unrounded_bytes(self):
+        self.assertEqual(self.sample('memory_total_bytes'), 8 * 1024 ** 3 + 123)
+        self.assertEqual(self.sample('memory_used_bytes'), 5000000001)
+        self.assertEqual(self.sample('disk_total_bytes', path='/srv/data'), 1000000000007)
+        self.assertEqual(self.types[exposition.PREFIX + 'disk_free_bytes'], 'gauge')
+
+    def test_label_values_escaped(self):
+        self.assertEqual(self.sample('container_running', name='we"b\\1\nx'), 1)
+        self.assertEqual(self.sample('rtad_events_total', type='http_error', code='404', country='NL'), 3)
+        self.assertEqual(self.types[exposition.PREFIX + 'rtad_events_total'], 'counter')
+
+    def test_special_float_values(self):
+        self.assertTrue(math.isnan(self.sample('pressure_cpu')))
+        self.assertEqual(self.sample('pressure_memory'), math.inf)
+        self.assertEqual(self.sample('pressure_io'), -math.inf)
+        self.assertEqual([exposition.format_value(v) for v in (float('nan'), math.inf, -math.inf, 2, 0.5)],
+                         ['NaN', '+Inf', '-Inf', '2.0', '0.5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import ipaddress
+import unittest
+
+from geo_cache import GeoCache
+
+
+class FakeLookup:
+    """Answers from {network: country}; unknown addresses fail for just that address."""
+    def __init__(self, networks):
+        self.networks = {ipaddress.ip_network(n): c for n, c in networks.items()}
+        self.calls = []
+
+    def __call__(self, ip):
+        self.calls.append(ip)
+        address = ipaddress.ip_address(ip)
+        for network, country in sorted(self.networks.items(), key=lambda n: -n[0].prefixlen):
+            if address in network:
+                return {'country': country, 'city': 'Unknown', 'lat': None, 'lon': None}, network, True
+        return {'country': 'Unknown', 'city': 'Unknown', 'lat': None, 'lon': None}, None, False
+
+
+class GeoCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.lookup = FakeLookup({'198.51.100.0/24': 'NL', '203.0.0.0/16': 'DE', '2001:db8::/48': 'FR'})
+        self.cache = GeoCache(self.lookup, max_entries=2, ttl=100, failure_ttl=10, clock=lambda: self.now)
+
+    def test_network_block_shares_one_entry(self):
+        for host in range(1, 50):
+            self.assertEqual(self.cache.get('198.51.100.%d' % host)['country'], 'NL')
+        self.assertEqual(self.cache.get('2001:db8::1')['country'], 'FR')
+        self.assertEqual(self.cache.get('2001:db8:0:ffff::2')['country'], 'FR')
+        self.assertEqual(self.lookup.calls, ['198.51.100.1', '2001:db8::1'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (49, 2, 2))
+
+    def test_blocks_of_different_sizes(self):
+        self.assertEqual(self.cache.get('203.0.7.1')['country'], 'DE')
+        self.assertEqual(self.cache.get('198.51.100.1')['country'], 'NL')
+        self.assertEqual(self.cache.get('198.51.100.2')['country'], 'NL')
+        self.assertEqual(self.cache.get('203.0.200.2')['country'], 'DE')
+        self.assertEqual(len(self.lookup.calls), 2)
+
+    def test_lru_eviction_and_ttl(self):
+        self.cache.get('198.51.100.1')
+        self.cache.get('2001:db8::1')
+        self.cache.get('198.51.100.2')           # refreshes the /24
+        self.cache.get('203.0.7.1')              # evicts the least recently used /48
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.cache.get('2001:db8::2')
+        self.assertEqual(len(self.lookup.calls), 4)
+        self.now = 1000
+        self.cache.get('2001:db8::2')
+        self.assertEqual(len(self.lookup.calls), 5)
+
+    def test_failures_cached_briefly(self):
+        self.cache.get('192.0.2.1')
+        info = self.cache.get('192.0.2.1')
+        info['country'] = 'XX'                   # callers get copies
+        self.assertEqual(self.cache.get('192.0.2.1')['country'], 'Unknown')
+        self.assertEqual(self.cache.stats()['negative_hits'], 2)
+        self.now = 11
+        self.cache.get('192.0.2.1')
+        self.assertEqual(len(self.lookup.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import math
+import random
+import sqlite3
+import unittest
+
+from gorilla import ChunkEncoder, decode, decode_range
+from migrations import migrate
+from archive import Archive, points, series_exists
+
+
+def encode(pairs):
+    encoder = ChunkEncoder()
+    for timestamp, value in pairs:
+        encoder.append(timestamp, value)
+    return encoder.getvalue()
+
+
+class GorillaTestCase(unittest.TestCase):
+    def test_roundtrip_irregular_series(self):
+        rng = random.Random(7)
+        pairs, timestamp = [], 1700000000
+        for _ in range(500):
+            timestamp += rng.choice([60, 60, 61, 59, 300, 7200, 10 ** 9])
+            pairs.append((timestamp, rng.choice([rng.random() * 100, 0.0, -0.0, 1e300, -5.5])))
+        self.assertEqual(list(decode(encode(pairs))), pairs)
+
+    def test_special_floats(self):
+        pairs = list(enumerate([float('inf'), float('-inf'), 0.0, 5e-324, 1.0], start=1))
+        pairs.append((10, float('nan')))
+        decoded = list(decode(encode(pairs)))
+        self.assertEqual(decoded[:-1], pairs[:-1])
+        self.assertTrue(math.isnan(decoded[-1][1]))
+
+    def test_getvalue_while_appending(self):
+        encoder = ChunkEncoder()
+        for i in range(10):
+            encoder.append(60 * i, float(i))
+            self.assertEqual(list(decode(encoder.getvalue())), [(60 * j, float(j)) for j in range(i + 1)])
+        with self.assertRaises(ValueError):
+            encoder.append(0, 1.0)
+
+    def test_decode_range(self):
+        data = encode((60 * i, float(i)) for i in range(100))
+        self.assertEqual(decode_range(data, 600, 900), ([600, 660, 720, 780, 840, 900], [10.0, 11.0, 12.0, 13.0, 14.0, 15.0]))
+        self.assertEqual(decode_range(data, 10 ** 6, 10 ** 7), ([], []))
+
+    def test_steady_series_compresses(self):
+        data = encode((1700000000 + 60 * i, 42.0 + (i % 3) * 0.5) for i in range(720))
+        self.assertLess(len(data), 720 * 2)
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.row_factory = sqlite3.Row
+        migrate(self.conn)
+        self.archive = Archive(self.conn.execute, chunk_points=4)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_chunks_roll_over_and_resume(self):
+        for i in range(6):
+            self.archive.add('cpu', 60 * i, float(i))
+        self.archive.add('cpu', 60, 99.0)     # older than the open chunk: ignored
+        self.assertEqual(self.counts(), [4])   # only the sealed chunk is written yet
+        self.archive.flush()
+        self.assertEqual(self.counts(), [4, 2])
+
+        resumed = Archive(self.conn.execute, chunk_points=4)
+        self.assertEqual(resumed.resume(self.conn), 1)
+        resumed.add('cpu', 360, 6.0)
+        self.assertEqual(resumed.open_points('cpu', 0, 360), ([240, 300, 360], [4.0, 5.0, 6.0]))
+        resumed.flush()
+        self.assertEqual(points('cpu', 120, 360, self.conn),
+                         ([120, 180, 240, 300, 360], [2.0, 3.0, 4.0, 5.0, 6.0]))
+        self.assertTrue(series_exists('cpu', self.conn))
+        self.assertFalse(series_exists('memory', self.conn))
+
+    def test_open_chunk_written_on_seal_and_flush_points(self):
+        writes = []
+        archive = Archive(lambda sql, params: writes.append(params[3]), chunk_points=10, flush_points=3)
+        for i in range(12):
+            archive.add('cpu', 60 * i, 1.0)
+        self.assertEqual(writes, [3, 6, 9, 10])
+        archive.close('cpu')
+        self.assertEqual(writes, [3, 6, 9, 10, 2])
+        archive.flush()
+        self.assertEqual(len(writes), 5)
+
+    def test_resume_replays_unwritten_minutes_from_rollups(self):
+        for i in range(6):
+            self.archive.add('cpu', 60 * i, float(i))
+        # The process died before the open chunk was flushed; the rollups were stored.
+        self.conn.executemany(
+            "INSERT INTO rollups (series, tier, timestamp, min, max, mean, count) VALUES (?, '1m', ?, 0, 0, ?, 1)",
+            [('cpu', 60.0 * i, float(i)) for i in range(7)] + [('memory', 0.0, 50.0)])
+        resumed = Archive(self.conn.execute, chunk_points=4)
+        self.assertEqual(resumed.resume(self.conn), 0)
+        resumed.flush()
+        self.assertEqual(points('cpu', 0, 360, self.conn)[1], [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(points('memory', 0, 60, self.conn), ([0], [50.0]))
+
+    def counts(self):
+        return [r['count'] for r in self.conn.execute("SELECT count FROM chunks ORDER BY start_time")]
+
+
+if __name__ == '__main__':
+    unittest.main()
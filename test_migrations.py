@@ -0,0 +1,48 @@
+import sqlite3
+import unittest
+
+from migrations import migrate, schema_version, SCHEMA_VERSION
+
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_fresh_database_reaches_current_version(self):
+        self.assertEqual(migrate(self.conn), list(range(1, SCHEMA_VERSION + 1)))
+        self.assertEqual(schema_version(self.conn), SCHEMA_VERSION)
+        self.assertEqual(migrate(self.conn), [])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM country_centroids").fetchone()[0], 20)
+
+    def test_legacy_database_upgrades_in_place(self):
+        self.conn.execute("CREATE TABLE cpu_history (timestamp REAL, usage REAL)")
+        self.conn.execute("CREATE TABLE net_history (interface TEXT, timestamp REAL, input REAL, output REAL)")
+        self.conn.execute("CREATE TABLE cpu_history_24h (timestamp REAL, usage REAL)")
+        self.conn.executemany("INSERT INTO cpu_history VALUES (?, ?)", [(100.2, 1.0), (100.7, 2.0), (101.1, 3.0)])
+        self.conn.executemany("INSERT INTO net_history VALUES (?, ?, ?, ?)",
+                              [('eth0', 100.5, 1.0, 2.0), ('lo', 100.5, 0.0, 0.0)])
+        self.conn.commit()
+        migrate(self.conn)
+        self.assertEqual(self.conn.execute("SELECT timestamp, usage FROM cpu_history ORDER BY timestamp").fetchall(),
+                         [(100, 2.0), (101, 3.0)])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM net_history").fetchone()[0], 2)
+        tables = {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn('cpu_history_24h', tables)
+
+    def test_history_queries_use_keys(self):
+        migrate(self.conn)
+
+        def plan(sql):
+            return ' '.join(r[-1] for r in self.conn.execute("EXPLAIN QUERY PLAN " + sql))
+        self.assertNotIn('TEMP B-TREE', plan("SELECT timestamp, usage FROM cpu_history ORDER BY timestamp DESC LIMIT 30"))
+        for sql in ("SELECT usage FROM cpu_history WHERE timestamp BETWEEN 1 AND 2",
+                    "SELECT input FROM net_history WHERE interface = 'eth0' AND timestamp BETWEEN 1 AND 2",
+                    "SELECT rowid FROM net_history WHERE timestamp < 1"):
+            self.assertIn('SEARCH', plan(sql), sql)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ from functools import wraps
 
 # Import your app and configuration.
 # Adjust the import path as necessary.
+import apptest  # noqa: F401  (stats.db and the checkpoint go to a temporary directory)
 from app import app, config_data, npm_proxy
 
 # Bypass the login_required decorator for testing.
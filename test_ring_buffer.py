@@ -0,0 +1,70 @@
+import unittest
+
+from ring_buffer import RingBuffer
+
+
+class RingBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.buffer = RingBuffer(4, ('input', 'output'))
+
+    def test_append_until_wrap_keeps_newest(self):
+        for i in range(6):
+            self.buffer.append(float(i), (i * 10, i * 100))
+        self.assertEqual(len(self.buffer), 4)
+        columns = self.buffer.window().columns()
+        self.assertEqual(columns['time'], [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(columns['input'], [20.0, 30.0, 40.0, 50.0])
+        self.assertEqual(columns['output'], [200.0, 300.0, 400.0, 500.0])
+
+    def test_window_returns_newest_samples(self):
+        for i in range(6):
+            self.buffer.append(float(i), (i, i))
+        self.assertEqual(self.buffer.window(2).records(), [
+            {'time': 4.0, 'input': 4.0, 'output': 4.0},
+            {'time': 5.0, 'input': 5.0, 'output': 5.0},
+        ])
+        # A wrapped window is served as two zero-copy segments.
+        self.assertEqual(len(self.buffer.window().segments('input')), 2)
+
+    def test_since_uses_sequence_numbers(self):
+        for i in range(6):
+            self.buffer.append(float(i), (i, i))
+        self.assertEqual(self.buffer.first_seq, 3)
+        self.assertEqual(self.buffer.last_seq, 6)
+        self.assertEqual(self.buffer.since(4).seqs(), [5, 6])
+        self.assertEqual(self.buffer.since(0).seqs(), [3, 4, 5, 6])
+        self.assertEqual(len(self.buffer.since(6)), 0)
+        self.assertEqual(self.buffer.since(3, until=5).seqs(), [4, 5])
+
+    def test_between_selects_time_range(self):
+        for i in range(6):
+            self.buffer.append(float(i * 10), (i, i))
+        self.assertEqual(self.buffer.between(25, 40).times(), [30.0, 40.0])
+        self.assertEqual(self.buffer.between(20, 20).times(), [20.0])
+        self.assertEqual(len(self.buffer.between(60, 90)), 0)
+
+    def test_sequence_numbers_must_increase(self):
+        self.buffer.append(1.0, (0, 0), seq=10)
+        with self.assertRaises(ValueError):
+            self.buffer.append(2.0, (0, 0), seq=10)
+
+    def test_clear_keeps_sequence_counter(self):
+        self.buffer.append(1.0, (1, 1))
+        self.buffer.clear()
+        self.assertFalse(self.buffer)
+        self.assertEqual(self.buffer.append(2.0, (2, 2)), 2)
+        self.assertEqual(self.buffer.latest(), (2.0, {'input': 2.0, 'output': 2.0}))
+
+    def test_dump_and_load_keep_newest_samples_in_order(self):
+        for i in range(6):
+            self.buffer.append(float(i), (i, -i))
+        restored = RingBuffer(3, ('input', 'output'))
+        restored.load(*self.buffer.dump(), last_seq=self.buffer.last_seq)
+        self.assertEqual(restored.window().columns(),
+                         {'time': [3.0, 4.0, 5.0], 'input': [3.0, 4.0, 5.0], 'output': [-3.0, -4.0, -5.0]})
+        self.assertEqual(restored.window().seqs(), [4, 5, 6])
+        self.assertEqual(restored.append(6.0, (6, -6)), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from rollup import RollupEngine
+
+TIERS = (('1m', 60, 10), ('1h', 3600, 10))
+
+
+class RollupEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.closed = []
+        self.engine = RollupEngine(TIERS, on_close=lambda *bucket: self.closed.append(bucket))
+
+    def test_minute_bucket_keeps_min_max_mean_count(self):
+        for ts, value in ((0, 1.0), (20, 5.0), (40, 3.0), (60, 7.0)):
+            self.engine.add('cpu', ts, value)
+        self.assertEqual(self.closed, [('cpu', '1m', 0, 1.0, 5.0, 3.0, 3)])
+        points = self.engine.points('cpu', '1m', 10, include_open=False)
+        self.assertEqual(points['time'], [0.0])
+        self.assertEqual(points['min'], [1.0])
+        self.assertEqual(points['max'], [5.0])
+        self.assertEqual(points['count'], [3.0])
+
+    def test_minutes_cascade_into_hours(self):
+        for minute in range(61):
+            self.engine.add('cpu', minute * 60, float(minute))
+        # Minute 60 is still open, so hour 0 has not been closed yet but is served as pending.
+        points = self.engine.points('cpu', '1h', 5)
+        self.assertEqual(points['time'], [0, 3600])
+        self.assertEqual(points['mean'], [29.5, 60.0])
+        self.engine.add('cpu', 61 * 60, 0.0)
+        self.assertIn(('cpu', '1h', 0, 0.0, 59.0, 29.5, 60), self.closed)
+
+    def test_open_bucket_includes_unclosed_minutes(self):
+        for ts in range(0, 3600 + 150, 30):
+            self.engine.add('mem', ts, 2.0)
+        bucket, minimum, maximum, mean, count = self.engine.get('mem').open_bucket('1h')
+        self.assertEqual((bucket, mean, count), (3600, 2.0, 5))
+
+    def test_restore_ignores_out_of_order_buckets(self):
+        series = self.engine.register('disk')
+        series.restore('1h', 7200, 1, 2, 1.5, 10)
+        series.restore('1h', 3600, 1, 2, 1.5, 10)
+        self.assertEqual(self.engine.points('disk', '1h', 10)['time'], [7200.0])
+
+    def test_open_accumulator_survives_restart(self):
+        for ts, value in ((0, 1.0), (20, 5.0)):
+            self.engine.add('cpu', ts, value)
+        saved = [tier.open_state() for tier in self.engine.get('cpu').tiers]
+        restarted = RollupEngine(TIERS)
+        for tier, state in zip(restarted.register('cpu').tiers, saved):
+            tier.restore_open(state)
+        restarted.add('cpu', 60, 3.0)
+        self.assertEqual(restarted.points('cpu', '1m', 10, include_open=False)['mean'], [3.0])
+
+    def test_persisted_bucket_supersedes_restored_accumulator(self):
+        series = self.engine.register('cpu')
+        series.tier('1m').restore_open((60, 1.0, 1.0, 1.0, 1))
+        series.restore('1m', 60, 1.0, 4.0, 2.0, 3)
+        self.assertIsNone(series.tier('1m').open_state())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,314 @@
+import os
+import queue
+import sqlite3
+import struct
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import rtad_manager
+import attack_store
+from migrations import migrate
+
+
+LOCATIONS = {
+    '198.51.100.7': {'country': 'NL', 'city': 'Amsterdam', 'lat': 52.37, 'lon': 4.89},
+    '203.0.113.9': {'country': 'DE', 'city': 'Unknown', 'lat': None, 'lon': None},
+}
+
+
+def mmdb_value(value):
+    """MaxMind DB data-section encoding of the small maps, strings and ints used below."""
+    if isinstance(value, dict):
+        return bytes([0xE0 | len(value)]) + b''.join(mmdb_value(k) + mmdb_value(v) for k, v in value.items())
+    if isinstance(value, list):
+        return bytes([len(value), 4]) + b''.join(mmdb_value(v) for v in value)     # extended: array
+    if isinstance(value, str):
+        return bytes([0x40 | len(value)]) + value.encode()
+    data = value.to_bytes(8, 'big').lstrip(b'\0')
+    return bytes([len(data), 2]) + data                                      # extended: uint64
+
+
+def write_mmdb(path, country):
+    """GeoLite2-City style file mapping 128.0.0.0/1 to `country`."""
+    tree = struct.pack('>I', 1)[1:] + struct.pack('>I', 1 + 16)[1:]          # left: none, right: data
+    metadata = {'node_count': 1, 'record_size': 24, 'ip_version': 4, 'database_type': 'GeoLite2-City',
+                'languages': ['en'], 'binary_format_major_version': 2, 'binary_format_minor_version': 0,
+                'build_epoch': 1700000000, 'description': {'en': 'test'}}
+    with open(path, 'wb') as f:
+        f.write(tree + b'\0' * 16 + mmdb_value({'country': {'iso_code': country}}))
+        f.write(b'\xab\xcd\xefMaxMind.com' + mmdb_value(metadata))
+
+
+class RtadTestCase(unittest.TestCase):
+    def setUp(self):
+        rtad_manager.login_attempts_cache.clear()
+        rtad_manager.http_error_logs_cache.clear()
+        rtad_manager.event_counters.clear()
+        rtad_manager.enrichment_queue = queue.Queue()
+        rtad_manager.unlocated_events.clear()
+        self.parser = object.__new__(rtad_manager.LogParser)   # no watchdog
+        self.lookups = []
+        self.reader = object()                                 # a loaded GeoIP database
+        self.stored, self.relocated = [], []
+        patches = {
+            'get_geo_info_cached': self.lookup, 'get_geoip_reader': lambda: self.reader,
+            'geoip_reader': None,
+            'event_sink': lambda kind, events: self.stored.append((kind, [e['id'] for e in events])),
+            'location_sink': lambda kind, events: self.relocated.append((kind, [e['id'] for e in events])),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(rtad_manager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def lookup(self, ip):
+        self.lookups.append(ip)
+        if self.reader is None:
+            return dict(rtad_manager.UNKNOWN_GEO_INFO)
+        return dict(LOCATIONS[ip])
+
+    def drain(self):
+        batch = []
+        while not rtad_manager.enrichment_queue.empty():
+            batch.append(rtad_manager.enrichment_queue.get_nowait())
+        return batch
+
+    def test_events_enriched_once_in_batches(self):
+        for _ in range(3):
+            self.parser.store_failed_login('root', '198.51.100.7', 'host')
+        self.parser.store_http_error_log('npm', 404, '/wp-login.php', '203.0.113.9', 'example.org')
+        batch = self.drain()
+        self.assertEqual(len(batch), 4)
+        rtad_manager.enrich_events(batch)
+
+        self.assertEqual(sorted(self.lookups), ['198.51.100.7', '203.0.113.9'])
+        attempts = rtad_manager.fetch_login_attempts()
+        self.assertEqual({(a['country'], a['city']) for a in attempts}, {('NL', 'Amsterdam')})
+        log = rtad_manager.fetch_http_error_logs()[-1]
+        self.assertEqual((log['country'], log['lat'], log['lon']),
+                         ('DE', *rtad_manager.get_country_centroid('DE')))
+        counters = rtad_manager.fetch_event_counters()
+        self.assertEqual(counters[('login_attempt', '', 'NL')], 3)
+        self.assertEqual(counters[('http_error', '404', 'DE')], 1)
+        self.assertEqual(rtad_manager.counted_login_attempt_id, attempts[-1]['id'])
+
+        # Nothing is queued again for events that are already enriched.
+        self.assertEqual(self.drain(), [])
+        self.assertEqual(self.stored, [('login_attempt', [a['id'] for a in attempts]), ('http_error', [log['id']])])
+
+    def test_events_published_only_once_enriched(self):
+        self.parser.store_failed_login('root', '198.51.100.7', 'host')
+        version = rtad_manager.feed_version()
+        self.assertEqual(rtad_manager.read_login_attempts(0).events, [])
+        rtad_manager.enrich_events(self.drain())
+        events = rtad_manager.read_login_attempts(0).events
+        self.assertEqual([e['country'] for e in events], ['NL'])
+        self.assertNotEqual(rtad_manager.feed_version(), version)
+
+    def test_failing_sink_is_logged(self):
+        def failing_sink(kind, events):
+            raise OSError("disk full")
+        self.parser.store_failed_login('root', '198.51.100.7', 'host')
+        with mock.patch.object(rtad_manager, 'event_sink', failing_sink), self.assertLogs(level='ERROR'):
+            rtad_manager.enrich_events(self.drain())
+        self.assertEqual(len(rtad_manager.fetch_login_attempts()), 1)
+        self.assertEqual(rtad_manager.fetch_event_counters()[('login_attempt', '', 'NL')], 1)
+
+    def test_unknown_events_requeued_once_a_database_loads(self):
+        self.reader = None
+        self.parser.store_failed_login('root', '198.51.100.7', 'host')
+        self.parser.store_http_error_log('npm', 404, '/', '203.0.113.9', 'example.org')
+        rtad_manager.enrich_events(self.drain())
+        self.assertEqual([e['country'] for e in rtad_manager.fetch_login_attempts()], ['Unknown'])
+        self.assertEqual(self.drain(), [])                     # nothing to retry with yet
+        revision = rtad_manager.location_revision
+
+        self.reader = rtad_manager.geoip_reader = object()
+        rtad_manager.requeue_unlocated_events()
+        batch = self.drain()
+        self.assertEqual([kind for kind, _ in batch], ['login_attempt', 'http_error'])
+        rtad_manager.enrich_events(batch)
+        attempt = rtad_manager.fetch_login_attempts()[-1]
+        self.assertEqual((len(rtad_manager.fetch_login_attempts()), attempt['country']), (1, 'NL'))
+        self.assertEqual(rtad_manager.fetch_http_error_logs()[-1]['country'], 'DE')
+        self.assertEqual([kind for kind, _ in self.relocated], ['login_attempt', 'http_error'])
+        self.assertEqual(len(self.stored), 2)                  # stored once, then relocated
+        self.assertEqual(rtad_manager.location_revision, revision + 2)
+        self.assertEqual(list(rtad_manager.unlocated_events), [])
+
+
+NPM_LINES = [
+    '[10/May/2024:15:32:11 +0000] 404 - GET https example.org "/wp-login.php" [Client 198.51.100.7] [Length 0]',
+    '[10/May/2024:15:32:12 +0200] 403 - POST https example.org "/xmlrpc.php" [Client 198.51.100.7] [Length 0]',
+]
+
+
+class LogIngestTestCase(unittest.TestCase):
+    """Proxy log ingest across restarts, into attack_entries on a temp database."""
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'proxy-host-1_access.log')
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.row_factory = sqlite3.Row
+        self.addCleanup(self.conn.close)
+        migrate(self.conn)
+        self.parser = object.__new__(rtad_manager.LogParser)   # no watchdog
+        rtad_manager.enrichment_queue = queue.Queue()
+        patches = [
+            (attack_store.stats, 'queue_rows', self.conn.executemany),
+            (attack_store.stats, 'queue_query', self.conn.execute),
+            (rtad_manager, 'get_geo_info_cached', lambda ip: dict(LOCATIONS[ip])),
+            (rtad_manager, 'get_geoip_reader', object),
+            (rtad_manager, 'event_sink', attack_store.store),
+            (rtad_manager, 'offset_tracker', None),
+        ]
+        for target, name, value in patches:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.restart()
+
+    def restart(self):
+        """What app.start_rtad_log_parser does in a new leader."""
+        rtad_manager.http_error_logs_cache.clear()
+        rtad_manager.offset_tracker = rtad_manager.FileOffsetTracker()
+        rtad_manager.offset_tracker.restore(attack_store.load_offsets(self.conn))
+        rtad_manager.offset_tracker.persist = attack_store.save_offset
+        rtad_manager.restore_events('http_error', attack_store.recent('http_error', conn=self.conn))
+
+    def ingest(self, lines):
+        with open(self.path, 'a') as f:
+            f.writelines(line + '\n' for line in lines)
+        self.parser.process_log_file(self.path, lambda line: self.parser.process_http_error_log(line, 'npm'))
+        batch = []
+        while not rtad_manager.enrichment_queue.empty():
+            batch.append(rtad_manager.enrichment_queue.get_nowait())
+        if batch:
+            rtad_manager.enrich_events(batch)
+
+    def stored(self):
+        return [(r['url'], r['timestamp']) for r in
+                self.conn.execute("SELECT url, timestamp FROM attack_entries ORDER BY id")]
+
+    def test_same_log_ingested_once_across_restarts(self):
+        self.ingest(NPM_LINES[:1])
+        self.restart()
+        self.ingest([])
+        self.assertEqual(len(self.stored()), 1)
+        self.assertEqual([e['url'] for e in rtad_manager.fetch_http_error_logs()], ['/wp-login.php'])
+
+        self.ingest(NPM_LINES[1:])
+        self.restart()
+        self.ingest([])
+        # Events carry the time logged, not the time parsed.
+        self.assertEqual(self.stored(), [
+            ('/wp-login.php', int(datetime(2024, 5, 10, 15, 32, 11, tzinfo=timezone.utc).timestamp())),
+            ('/xmlrpc.php', int(datetime(2024, 5, 10, 13, 32, 12, tzinfo=timezone.utc).timestamp())),
+        ])
+        self.assertEqual([e['error_code'] for e in rtad_manager.fetch_http_error_logs()], [404, 403])
+
+    def test_rotated_log_read_from_the_start(self):
+        self.ingest(NPM_LINES[:1])
+        os.rename(self.path, self.path + '.1')          # logrotate; the new file gets a new inode
+        self.restart()
+        self.ingest(NPM_LINES[1:])
+        self.assertEqual([url for url, _ in self.stored()], ['/wp-login.php', '/xmlrpc.php'])
+
+
+class GeoipReloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'GeoLite2-City.mmdb')
+        for name in ('geoip_reader', 'geoip_reader_stamp'):
+            patcher = mock.patch.object(rtad_manager, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rtad_manager.geo_cache.clear()
+        self.addCleanup(rtad_manager.geo_cache.clear)
+
+    def replace_db(self, country):
+        # Written aside and renamed over the old file, like the GeoLite2 refresh job.
+        write_mmdb(self.path + '.tmp', country)
+        os.replace(self.path + '.tmp', self.path)
+
+    def test_swapped_database_is_reloaded(self):
+        self.replace_db('NL')
+        reader = rtad_manager.reload_geoip_reader(self.path)
+        self.assertEqual(rtad_manager.get_geo_info_cached('198.51.100.7')['country'], 'NL')
+        self.assertIs(rtad_manager.reload_geoip_reader(self.path), reader)      # unchanged file
+
+        self.replace_db('DE')
+        self.assertIsNot(rtad_manager.reload_geoip_reader(self.path), reader)
+        self.assertEqual(rtad_manager.get_geo_info_cached('198.51.100.7')['country'], 'DE')
+        self.assertEqual(rtad_manager.get_geo_info_cached('10.0.0.1')['country'], 'Unknown')
+
+
+class AttackStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.row_factory = sqlite3.Row
+        migrate(self.conn)
+        events = []
+        for i in range(25):
+            events.append(('login_attempt' if i % 2 else 'http_error', {
+                'ip_address': '198.51.100.%d' % (i % 5), 'country': 'NL' if i < 20 else 'DE',
+                'city': 'Unknown', 'user': 'root', 'error_code': 404, 'url': '/',
+                'timestamp': rtad_manager.normalize_timestamp(1700000000 + i), 'lat': 1.0, 'lon': 2.0,
+            }))
+        self.conn.executemany(attack_store.INSERT_SQL, [attack_store.event_row(k, e) for k, e in events])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_pages_newest_first(self):
+        ids, before = [], None
+        while True:
+            page = attack_store.query(limit=10, before=before, conn=self.conn)
+            ids.extend(entry['id'] for entry in page['entries'])
+            before = page['next_before']
+            if before is None:
+                break
+        self.assertEqual(ids, list(range(25, 0, -1)))
+
+    def test_filters(self):
+        page = attack_store.query(type='login', ip='198.51.100.1', conn=self.conn)
+        self.assertEqual([e['id'] for e in page['entries']], [22, 12, 2])
+        self.assertEqual(page['entries'][0]['timestamp'], 1700000021)
+        page = attack_store.query(country='DE', since=1700000022, conn=self.conn)
+        self.assertEqual([e['id'] for e in page['entries']], [25, 24, 23])
+        with self.assertRaises(ValueError):
+            attack_store.query(type='bogus', conn=self.conn)
+
+    def test_relocate_fills_in_unknown_rows(self):
+        event = {'ip_address': '198.51.100.9', 'country': 'Unknown', 'city': 'Unknown', 'user': 'root',
+                 'timestamp': rtad_manager.normalize_timestamp(1700000100), 'lat': None, 'lon': None}
+        self.conn.execute(attack_store.INSERT_SQL, attack_store.event_row('login_attempt', event))
+        event.update(country='NL', city='Amsterdam', lat=52.37, lon=4.89)
+        with mock.patch.object(attack_store.stats, 'queue_rows', self.conn.executemany):
+            attack_store.relocate('login_attempt', [event])
+        entry = attack_store.query(ip='198.51.100.9', conn=self.conn)['entries'][0]
+        self.assertEqual((entry['country'], entry['city'], entry['lat']), ('NL', 'Amsterdam', 52.37))
+
+    def test_filtered_pages_walk_an_index(self):
+        plan = ' '.join(r[-1] for r in self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM attack_entries WHERE ip_address = ? AND id < ? "
+            "ORDER BY id DESC LIMIT 10", ('x', 5)))
+        self.assertIn('ix_attack_entries_ip_address', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_time_bounded_pages(self):
+        # No index serves a timestamp range in id order: a sort or a rowid scan, as documented.
+        plan = ' '.join(r[-1] for r in self.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM attack_entries WHERE timestamp >= ? AND timestamp <= ? "
+            "ORDER BY id DESC LIMIT 10", (0, 1)))
+        self.assertTrue('TEMP B-TREE' in plan or plan.startswith('SCAN'), plan)
+        page = attack_store.query(since=1700000010, until=1700000012, conn=self.conn)
+        self.assertEqual([e['id'] for e in page['entries']], [13, 12, 11])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+        self.calls = []
+        self.scheduler.add('fast', 1.0, lambda: self.calls.append('fast'))
+        self.scheduler.add('slow', 3.0, lambda: self.calls.append('slow'))
+
+    def names(self, jobs):
+        return [job.name for job in jobs]
+
+    def test_jobs_run_on_their_own_grid(self):
+        ticks = [self.names(self.scheduler.wait()) for _ in range(4)]
+        self.assertEqual(ticks, [['fast', 'slow'], ['fast'], ['fast'], ['fast', 'slow']])
+        self.assertEqual(self.clock.now, 103.0)
+
+    def test_slow_execution_does_not_drift(self):
+        for _ in range(3):
+            for job in self.scheduler.wait():
+                self.scheduler.execute(job)
+            self.clock.now += 0.4  # Collection time must not stretch the period.
+        self.scheduler.wait()
+        self.assertEqual(self.clock.now, 103.0)
+
+    def test_late_job_runs_once_and_counts_missed_slots(self):
+        self.scheduler.wait()
+        self.clock.now += 3.5
+        self.assertEqual(self.names(self.scheduler.wait()), ['fast', 'slow'])
+        fast, slow = self.scheduler.jobs
+        self.assertEqual(fast.missed, 2)
+        self.assertEqual(fast.next_run, 104.0)
+        self.assertEqual(slow.next_run, 106.0)
+
+    def test_execute_records_errors_and_duration(self):
+        job = self.scheduler.add('broken', 1.0, lambda: 1 / 0)
+        with self.assertLogs(level='ERROR'):
+            self.scheduler.execute(job)
+        stats = self.scheduler.get_stats()['broken']
+        self.assertEqual((stats['runs'], stats['errors']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
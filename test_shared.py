@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from multiprocessing import Process
+
+import shared
+from stream import Broadcaster, RESYNC
+
+
+def write_in_child(payload):
+    shared.Channel('test').write(7, payload)
+
+
+class SharedChannelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.previous_dir = shared.SHARED_DIR
+        shared.SHARED_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(shared.SHARED_DIR)
+        shared.SHARED_DIR = self.previous_dir
+
+    def test_unwritten_channel_reads_none(self):
+        self.assertEqual(shared.Channel('test').read(), (None, None))
+
+    def test_write_is_visible_to_other_processes_and_grows(self):
+        reader = shared.Channel('test', size=16)
+        payload = b'x' * 100000
+        child = Process(target=write_in_child, args=(payload,))
+        child.start()
+        child.join()
+        self.assertEqual(reader.read(), (7, payload))
+        shared.Channel('test').write(8, b'short')
+        self.assertEqual(reader.read(), (8, b'short'))
+
+    def test_leadership_is_exclusive(self):
+        first, second = shared.Leadership(), shared.Leadership()
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        first.file.close()
+        self.assertTrue(second.try_acquire())
+
+    def test_feed_serves_matching_delta_and_etag(self):
+        publisher, feed = shared.Publisher(), shared.Feed()
+        publisher.publish_tick(5, b'{"seq":5}', {'seq': 5, 'since': 4}, b'metrics', {'writer': {}})
+        self.assertEqual(json.loads(feed.delta(4)), {'seq': 5, 'since': 4})
+        self.assertEqual(json.loads(feed.delta(5))['samples'], {})    # up to date
+        self.assertIsNone(feed.delta(3))
+        snapshot = feed.snapshot()
+        self.assertEqual((snapshot.version, snapshot.body), (5, b'{"seq":5}'))
+        self.assertTrue(snapshot.etag.endswith('-5'))
+        self.assertIs(feed.snapshot(), snapshot)
+        self.assertEqual(feed.metrics(), b'metrics')
+
+    def test_follower_delta_spans_several_ticks(self):
+        publisher, feed = shared.Publisher(), shared.Feed()
+        for seq in range(5, 9):
+            publisher.publish_tick(seq, b'{}', {
+                'seq': seq, 'since': seq - 1, 'delta': True, 'system': {'cpu': float(seq)},
+                'samples': {'cpu_history': {'time': [seq], 'usage': [float(seq)]},
+                            'network': {'eth0': [{'time': seq, 'input': 1.0, 'output': 2.0}]}},
+                'metrics': {'cpu_cores': {'latest': {'cpu0': {'usage': seq}},
+                                          'samples': {'cpu0': {'time': [seq], 'usage': [seq]}}}},
+            } | ({'docker': ['web-%d' % seq]} if seq == 6 else {}), b'', {})
+        delta = json.loads(feed.delta(5))
+        self.assertEqual((delta['since'], delta['seq']), (5, 8))
+        self.assertEqual(delta['system'], {'cpu': 8.0})
+        self.assertEqual(delta['samples']['cpu_history'], {'time': [6, 7, 8], 'usage': [6.0, 7.0, 8.0]})
+        self.assertEqual([r['time'] for r in delta['samples']['network']['eth0']], [6, 7, 8])
+        self.assertEqual(delta['metrics']['cpu_cores'], {'latest': {'cpu0': {'usage': 8}},
+                                                         'samples': {'cpu0': {'time': [6, 7, 8], 'usage': [6, 7, 8]}}})
+        self.assertEqual(delta['docker'], ['web-6'])
+        self.assertEqual(json.loads(feed.delta(4))['samples']['cpu_history']['time'], [5, 6, 7, 8])
+        self.assertIsNone(feed.delta(3))
+        # A gap in the published ticks drops the cursors before it.
+        publisher.publish_tick(10, b'{}', {'seq': 10, 'since': 9}, b'', {})
+        self.assertIsNone(feed.delta(5))
+        self.assertEqual(json.loads(feed.delta(9))['seq'], 10)
+
+    def test_stale_channels_removed_by_first_and_last_worker(self):
+        with open(shared.channel_path('snapshot'), 'wb') as f:
+            f.write(b'left over')
+        self.addCleanup(shared.leave_workers)
+        shared.join_workers()
+        self.assertEqual(os.listdir(shared.SHARED_DIR), [shared.WORKERS_LOCK])
+        shared.Channel('snapshot').write(1, b'{}')
+        # Another worker still running keeps the channels in place.
+        other = subprocess.Popen([sys.executable, '-c',
+                                  'import fcntl, sys; f = open(sys.argv[1]); fcntl.flock(f, fcntl.LOCK_SH); '
+                                  'print(flush=True); sys.stdin.read()', shared.channel_path(shared.WORKERS_LOCK)],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        other.stdout.readline()
+        shared.leave_workers()
+        self.assertIn('snapshot', os.listdir(shared.SHARED_DIR))
+        other.communicate()
+        shared.join_workers()
+        shared.Channel('delta').write(1, b'[]')
+        shared.leave_workers()
+        self.assertEqual(os.listdir(shared.SHARED_DIR), [shared.WORKERS_LOCK])
+
+    def test_import_starts_no_writer(self):
+        # Followers import stats too; only the leader may start the stats.db writer.
+        code = 'import threading, stats; print(sorted(t.name for t in threading.enumerate()))'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertNotIn('db-writer', output)
+
+    def test_feed_forwards_deltas_and_resyncs_after_a_gap(self):
+        publisher, feed = shared.Publisher(), shared.Feed()
+        ticks = [(6, 5), (8, 7)]
+        events = []
+
+        class RecordingBroadcaster(Broadcaster):
+            def publish(self, frame):
+                events.append(frame)
+
+            def resync(self):
+                events.append(RESYNC)
+
+        class PublishWhileWaiting:
+            # Publishes one tick per poll interval and stops after the feed read the last one.
+            polls = 0
+
+            def is_set(self):
+                return self.polls > len(ticks)
+
+            def wait(self, timeout):
+                if self.polls < len(ticks):
+                    seq, since = ticks[self.polls]
+                    publisher.publish_tick(seq, b'{}', {'seq': seq, 'since': since}, b'', {})
+                self.polls += 1
+
+        broadcaster = RecordingBroadcaster()
+        broadcaster.subscribe()
+        publisher.publish_tick(5, b'{}', {'seq': 5, 'since': 4}, b'', {})
+        feed.run(broadcaster, PublishWhileWaiting())
+        self.assertEqual(events, [b'event: delta\ndata: {"seq":6,"since":5}\n\n', RESYNC])
+
+if __name__ == '__main__':
+    unittest.main()
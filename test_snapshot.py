@@ -0,0 +1,45 @@
+import gzip
+import unittest
+
+from flask import Flask
+
+import snapshot
+from snapshot import build_snapshot, etag_for, negotiate, snapshot_response
+
+
+class NegotiateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = build_snapshot(7, {'seq': 7})
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.snapshot
+
+    def test_matching_etag_is_not_modified_without_loading(self):
+        status, body, headers = negotiate(self.snapshot.etag, self.load, True, True)
+        self.assertEqual((status, body, self.loads), (304, b'', 0))
+        self.assertEqual(headers['ETag'], '"%s"' % self.snapshot.etag)
+
+    def test_body_plain_or_gzipped(self):
+        status, body, headers = negotiate(self.snapshot.etag, self.load, False, False)
+        self.assertEqual((status, body), (200, b'{"seq":7}'))
+        self.assertNotIn('Content-Encoding', headers)
+        status, body, headers = negotiate(self.snapshot.etag, self.load, False, True)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'{"seq":7}')
+        self.assertIs(self.snapshot.gzipped(), body)          # compressed once per snapshot
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+    def test_etag_changes_with_boot_id(self):
+        self.assertTrue(self.snapshot.etag.startswith(snapshot.BOOT_ID + '-'))
+        self.assertNotEqual(etag_for(7, 'previous-boot'), etag_for(7))
+        app = Flask(__name__)
+        for sent, expected in ((self.snapshot.etag, 304), (etag_for(7, 'previous-boot'), 200)):
+            with app.test_request_context(headers={'If-None-Match': '"%s"' % sent}) as context:
+                response = snapshot_response(context.request, self.snapshot.etag, self.load)
+            self.assertEqual(response.status_code, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
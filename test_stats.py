@@ -0,0 +1,66 @@
+import unittest
+from array import array
+from unittest import mock
+
+import collectors
+import stats
+from archive import Archive
+from rollup import RollupEngine
+
+
+class ScriptedNetworkCollector(collectors.NetworkCollector):
+    def __init__(self, reads):
+        super().__init__()
+        self.reads = iter(reads)
+
+    def read(self):
+        current = next(self.reads)
+        return tuple(current), array('Q', [v for counters in current.values() for v in counters])
+
+
+def counters(*interfaces):
+    return {iface: [100] * len(collectors.NetworkCollector.COUNTERS) for iface in interfaces}
+
+
+class KeyExpiryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.history = {}
+        state = {
+            'histories': {'network': self.history}, 'absent_keys': {}, 'KEY_EXPIRY': 3,
+            'rollups': RollupEngine(on_close=stats.persist_rollup), 'archive': Archive(lambda sql, params: None),
+            'cached_stats': {'system': {}, 'docker': [], 'network': {'interfaces': {}}},
+            'queue_rows': lambda sql, rows: None, 'queue_query': lambda sql, params: None,
+        }
+        for name, value in state.items():
+            patcher = mock.patch.object(stats, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_removed_interface_is_dropped_after_expiry(self):
+        reads = [counters('eth0')] + [counters('eth0', 'veth1')] * 3 + [counters('eth0')] * 3
+        collector = ScriptedNetworkCollector(reads)
+        for seq, _ in enumerate(reads, 1):
+            stats.record(collector, 1000.0 + seq * 60, seq)
+            if seq == 4:
+                self.assertEqual(sorted(self.history), ['eth0', 'veth1'])
+                self.assertIsNotNone(stats.rollups.get('net.veth1.input'))
+                self.assertIn('net.veth1.input', stats.archive.open)
+            if seq == 6:                              # missing twice: kept
+                self.assertIn('veth1', self.history)
+        self.assertEqual(list(self.history), ['eth0'])
+        self.assertEqual(sorted(stats.rollups.names()), ['net.eth0.input', 'net.eth0.output'])
+        self.assertEqual(sorted(stats.archive.open), ['net.eth0.input', 'net.eth0.output'])
+        self.assertEqual(stats.absent_keys['network'], {})
+        self.assertEqual(list(collector.totals()), ['eth0'])
+
+    def test_interface_back_in_time_is_kept(self):
+        reads = [counters('eth0', 'veth1')] * 2 + [counters('eth0')] * 2 + [counters('eth0', 'veth1')] * 3
+        collector = ScriptedNetworkCollector(reads)
+        for seq, _ in enumerate(reads, 1):
+            stats.record(collector, 1000.0 + seq, seq)
+        self.assertEqual(sorted(self.history), ['eth0', 'veth1'])
+        self.assertEqual(stats.absent_keys['network'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import unittest
+
+from stream import Broadcaster, RESYNC, encode_raw
+
+
+class BroadcasterTestCase(unittest.TestCase):
+    def test_slow_subscriber_is_resynced(self):
+        broadcaster = Broadcaster(backlog=2)
+        sub = broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish(encode_raw('delta', b'%d' % i))
+        self.assertIs(sub.get(timeout=0), RESYNC)
+        self.assertIsNone(sub.get(timeout=0))
+
+    def test_async_subscriber_receives_frames_from_other_threads(self):
+        broadcaster = Broadcaster(backlog=2)
+
+        async def consume():
+            sub = broadcaster.subscribe(asyncio.get_running_loop())
+            frame = encode_raw('delta', b'{}')
+            threading.Thread(target=broadcaster.publish, args=(frame,)).start()
+            received = await sub.get(timeout=1)
+            for _ in range(3):
+                broadcaster.publish(frame)
+            await asyncio.sleep(0)
+            resync = await sub.get(timeout=1)
+            timeout = await sub.get(timeout=0.01)
+            broadcaster.unsubscribe(sub)
+            return received, resync, timeout
+
+        received, resync, timeout = asyncio.run(consume())
+        self.assertEqual(received, b'event: delta\ndata: {}\n\n')
+        self.assertIs(resync, RESYNC)
+        self.assertIsNone(timeout)
+        self.assertEqual(len(broadcaster), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()